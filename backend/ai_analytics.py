@@ -3,12 +3,19 @@ Advanced AI Analytics Module for Reflourish
 Integrates OpenAI and Claude for comprehensive food waste analytics
 """
 
-import requests
 import json
 import sqlite3
 from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from llm_gateway import chat_text, get_gateway, message_text
+
+# Overall budget for generate_full_analysis(); its calls run concurrently
+FULL_ANALYSIS_DEADLINE_SECONDS = 30
 
 # Import API keys
 try:
@@ -126,7 +133,8 @@ class AIAnalytics:
             'meals_wasted': meals_wasted
         }
     
-    def generate_executive_summary_openai(self, metrics: Dict[str, Any], store_name: str = "Store") -> str:
+    def generate_executive_summary_openai(self, metrics: Dict[str, Any], store_name: str = "Store",
+                                         timeout: float = 15) -> str:
         """Generate executive summary using OpenAI"""
         try:
             if not self.openai_key or self.openai_key == "sk-proj-your-openai-key-here":
@@ -153,11 +161,6 @@ class AIAnalytics:
             Be specific and data-driven.
             """
             
-            headers = {
-                "Authorization": f"Bearer {self.openai_key}",
-                "Content-Type": "application/json"
-            }
-            
             data = {
                 "model": "gpt-4o-mini",
                 "messages": [
@@ -168,25 +171,15 @@ class AIAnalytics:
                 "temperature": 0.7
             }
             
-            response = requests.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers=headers,
-                json=data,
-                timeout=15
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                return result['choices'][0]['message']['content'].strip()
-            else:
-                print(f"OpenAI API error: {response.status_code}")
-                return self._fallback_summary(metrics, store_name)
+            result = get_gateway().openai_chat(self.openai_key, data, timeout=timeout)
+            return chat_text(result).strip()
                 
         except Exception as e:
             print(f"OpenAI error: {str(e)}")
             return self._fallback_summary(metrics, store_name)
     
-    def generate_detailed_report_claude(self, metrics: Dict[str, Any], packages: List[Dict], store_name: str = "Store") -> str:
+    def generate_detailed_report_claude(self, metrics: Dict[str, Any], packages: List[Dict], store_name: str = "Store",
+                                        timeout: float = 30) -> str:
         """Generate detailed weekly report using Claude"""
         try:
             if not self.anthropic_key or self.anthropic_key == "sk-ant-REDACTED":
@@ -226,12 +219,6 @@ class AIAnalytics:
             Format as professional markdown with clear sections and actionable insights.
             """
             
-            headers = {
-                "x-api-key": self.anthropic_key,
-                "Content-Type": "application/json",
-                "anthropic-version": "2023-06-01"
-            }
-            
             data = {
                 "model": "claude-3-5-sonnet-20241022",
                 "max_tokens": 1500,
@@ -240,25 +227,15 @@ class AIAnalytics:
                 ]
             }
             
-            response = requests.post(
-                "https://api.anthropic.com/v1/messages",
-                headers=headers,
-                json=data,
-                timeout=30
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                return result['content'][0]['text']
-            else:
-                print(f"Claude API error: {response.status_code}")
-                return self._fallback_detailed_report(metrics, store_name)
+            result = get_gateway().anthropic_messages(self.anthropic_key, data, timeout=timeout)
+            return message_text(result)
                 
         except Exception as e:
             print(f"Claude error: {str(e)}")
             return self._fallback_detailed_report(metrics, store_name)
     
-    def generate_ai_predictions(self, metrics: Dict[str, Any], packages: List[Dict]) -> Dict[str, Any]:
+    def generate_ai_predictions(self, metrics: Dict[str, Any], packages: List[Dict],
+                                timeout: float = 20) -> Dict[str, Any]:
         """Generate AI predictions for inventory and behavior"""
         try:
             if not self.openai_key or self.openai_key == "sk-proj-your-openai-key-here":
@@ -287,11 +264,6 @@ class AIAnalytics:
             Return as JSON with specific, actionable recommendations.
             """
             
-            headers = {
-                "Authorization": f"Bearer {self.openai_key}",
-                "Content-Type": "application/json"
-            }
-            
             data = {
                 "model": "gpt-4o-mini",
                 "messages": [
@@ -302,26 +274,71 @@ class AIAnalytics:
                 "temperature": 0.2
             }
             
-            response = requests.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers=headers,
-                json=data,
-                timeout=20
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                try:
-                    return json.loads(result['choices'][0]['message']['content'])
-                except json.JSONDecodeError:
-                    return self._fallback_predictions(metrics)
-            else:
+            result = get_gateway().openai_chat(self.openai_key, data, timeout=timeout)
+            try:
+                return json.loads(chat_text(result))
+            except json.JSONDecodeError:
                 return self._fallback_predictions(metrics)
                 
         except Exception as e:
             print(f"Prediction error: {str(e)}")
             return self._fallback_predictions(metrics)
     
+    def generate_full_analysis(self, metrics: Dict[str, Any], packages: List[Dict], store_name: str = "Store",
+                               deadline_seconds: float = FULL_ANALYSIS_DEADLINE_SECONDS) -> Dict[str, Any]:
+        """Executive summary, detailed report and predictions, generated concurrently
+        
+        The three provider calls run side by side on the shared gateway, so
+        the wait is the slowest call rather than their sum, and all of them
+        share one deadline. Each part falls back on its own: a part that
+        fails or is still running at the deadline gets its _fallback_* value
+        and the others are kept.
+        """
+        start = time.monotonic()
+        deadline = start + deadline_seconds
+        
+        def remaining(limit):
+            return max(0.001, min(limit, deadline - time.monotonic()))
+        
+        parts = {
+            'executive_summary': (
+                lambda: self.generate_executive_summary_openai(metrics, store_name, timeout=remaining(15)),
+                lambda: self._fallback_summary(metrics, store_name)
+            ),
+            'detailed_report': (
+                lambda: self.generate_detailed_report_claude(metrics, packages, store_name, timeout=remaining(30)),
+                lambda: self._fallback_detailed_report(metrics, store_name)
+            ),
+            'predictions': (
+                lambda: self.generate_ai_predictions(metrics, packages, timeout=remaining(20)),
+                lambda: self._fallback_predictions(metrics)
+            ),
+        }
+        
+        executor = ThreadPoolExecutor(max_workers=len(parts), thread_name_prefix='ai-analytics')
+        try:
+            futures = {name: executor.submit(generate) for name, (generate, _) in parts.items()}
+            analysis = {}
+            timed_out = []
+            for name, future in futures.items():
+                try:
+                    analysis[name] = future.result(timeout=max(0.0, deadline - time.monotonic()))
+                except FutureTimeoutError:
+                    analysis[name] = parts[name][1]()
+                    timed_out.append(name)
+                except Exception as e:
+                    print(f"{name} error: {str(e)}")
+                    analysis[name] = parts[name][1]()
+        finally:
+            # Stragglers finish on their own: their gateway calls share the deadline
+            executor.shutdown(wait=False)
+        
+        analysis.update({
+            'timed_out': timed_out,
+            'elapsed_seconds': round(time.monotonic() - start, 3)
+        })
+        return analysis
+    
     def _analyze_trends(self, packages: List[Dict]) -> Dict[str, Any]:
         """Analyze trends in package data"""
         if not packages:
@@ -587,11 +604,6 @@ SCHEMA (return exactly one JSON object)
             if not self.openai_key or self.openai_key in ["your-openai-key-here", "sk-proj-your-openai-key-here"]:
                 return None
             
-            headers = {
-                "Authorization": f"Bearer {self.openai_key}",
-                "Content-Type": "application/json"
-            }
-            
             data = {
                 "model": "gpt-4o-mini",
                 "messages": [
@@ -602,19 +614,8 @@ SCHEMA (return exactly one JSON object)
                 "temperature": 0.2
             }
             
-            response = requests.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers=headers,
-                json=data,
-                timeout=30
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                return result['choices'][0]['message']['content'].strip()
-            else:
-                print(f"OpenAI API error: {response.status_code} - {response.text}")
-                return None
+            result = get_gateway().openai_chat(self.openai_key, data, timeout=30)
+            return chat_text(result).strip()
                 
         except Exception as e:
             print(f"OpenAI API call error: {str(e)}")
@@ -305,9 +305,7 @@ class AIInsightsGenerator:
     def _generate_with_anthropic(self, trends: Dict, predictions: Dict, recommendations: Dict) -> str:
         """Generate report using Anthropic Claude API"""
         try:
-            import anthropic
-            
-            client = anthropic.Anthropic(api_key=self.api_key)
+            from llm_gateway import get_gateway, message_text
             
             prompt = f"""
             Generate a comprehensive weekly AI report for a food waste reduction platform based on the following data:
@@ -326,16 +324,16 @@ class AIInsightsGenerator:
             Format the response in clear, actionable language suitable for store managers and volunteers.
             """
             
-            response = client.messages.create(
-                model="claude-3-sonnet-20240229",
-                max_tokens=2000,
-                messages=[{
+            response = get_gateway().anthropic_messages(self.api_key, {
+                "model": "claude-3-sonnet-20240229",
+                "max_tokens": 2000,
+                "messages": [{
                     "role": "user",
                     "content": prompt
                 }]
-            )
+            }, timeout=60)
             
-            return response.content[0].text
+            return message_text(response)
             
         except Exception as e:
             logger.error(f"Anthropic API error: {e}")
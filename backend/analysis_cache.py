@@ -0,0 +1,106 @@
+"""
+Perceptual-hash cache of food photo analyses
+
+Stores re-photograph the same trays and double-tap submit, and each of those
+used to cost a full model round trip. Analyses are kept in SQLite keyed by the
+photo's dHash (see image_prep.dhash); a new photo within max_distance bits of
+a cached one reuses its analysis. Entries expire after ttl_seconds, and the
+table is trimmed to max_entries, least recently used first.
+
+The table is small by construction, so a lookup reads every live hash for the
+model and compares them in Python rather than indexing Hamming distance.
+"""
+
+import json
+import threading
+import time
+
+from image_prep import hamming_distance
+
+_SIGN_BIT = 1 << 63
+
+
+def _to_sqlite(value):
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= _SIGN_BIT else value
+
+
+def _from_sqlite(value):
+    return value & ((1 << 64) - 1)
+
+
+class AnalysisCache:
+    """Near-duplicate lookup of image analyses in the image_analysis_cache table"""
+
+    def __init__(self, max_distance=6, ttl_seconds=7 * 24 * 3600, max_entries=5000):
+        self.max_distance = max_distance
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, conn, image_hash, model):
+        """Cached analysis of the closest photo within max_distance, or None"""
+        # Hashes only, read from the covering index; just the winner's JSON is loaded
+        rows = conn.execute(
+            'SELECT id, dhash FROM image_analysis_cache WHERE model = ? AND created_at >= ?',
+            (model, time.time() - self.ttl_seconds)
+        ).fetchall()
+        best = None
+        for row in rows:
+            distance = hamming_distance(image_hash, _from_sqlite(row['dhash']))
+            if distance <= self.max_distance and (best is None or distance < best[0]):
+                best = (distance, row['id'])
+                if distance == 0:
+                    break
+
+        match = None
+        if best is not None:
+            distance, entry_id = best
+            # Trimmed by a concurrent put() since the scan: a miss
+            match = conn.execute('SELECT analysis FROM image_analysis_cache WHERE id = ?', (entry_id,)).fetchone()
+
+        with self._lock:
+            if match is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        conn.execute(
+            'UPDATE image_analysis_cache SET hits = hits + 1, last_used_at = ? WHERE id = ?',
+            (time.time(), entry_id)
+        )
+        conn.commit()
+        return json.loads(match['analysis']), distance
+
+    def put(self, conn, image_hash, model, analysis):
+        now = time.time()
+        conn.execute(
+            'INSERT INTO image_analysis_cache (dhash, model, analysis, created_at, last_used_at) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (_to_sqlite(image_hash), model, json.dumps(analysis), now, now)
+        )
+        conn.execute('DELETE FROM image_analysis_cache WHERE created_at < ?', (now - self.ttl_seconds,))
+        conn.execute('''
+            DELETE FROM image_analysis_cache WHERE id IN (
+                SELECT id FROM image_analysis_cache
+                ORDER BY last_used_at DESC
+                LIMIT -1 OFFSET ?
+            )
+        ''', (self.max_entries,))
+        conn.commit()
+
+    def stats(self, conn):
+        entries = conn.execute('SELECT COUNT(*) FROM image_analysis_cache').fetchone()[0]
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'max_distance': self.max_distance,
+                'ttl_seconds': self.ttl_seconds,
+                'max_entries': self.max_entries,
+            }
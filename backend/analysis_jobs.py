@@ -0,0 +1,164 @@
+"""
+Background jobs for food photo analysis
+
+A model round trip takes seconds, and running it on the Flask request thread
+let a burst of uploads tie up every thread the server has. JobRunner runs
+analyses on its own bounded thread pool instead: POST
+/api/analyze-food-image/jobs gets a job ID back immediately, and the result
+is polled from GET /api/analyze-food-image/jobs/<id>.
+
+Every job has a deadline. The job function receives it so it can bound its
+own network calls, a job still queued when it passes is never started, and a
+job that hasn't finished by then is reported as timed out (a late result is
+discarded). Finished jobs are kept for retention_seconds so clients can
+collect them, then forgotten. Jobs live in this process only, like the
+other in-process caches in the backend.
+"""
+
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+TIMED_OUT = 'timed_out'
+
+FINISHED = (SUCCEEDED, FAILED, TIMED_OUT)
+
+
+class JobQueueFull(Exception):
+    """Raised when max_pending jobs are already queued or running"""
+
+
+class Job:
+    def __init__(self, timeout):
+        self.id = secrets.token_hex(12)
+        self.status = QUEUED
+        self.created_at = time.time()
+        self.deadline = time.monotonic() + timeout
+        self.finished_at = None
+        # Response body and HTTP status the synchronous endpoint would return
+        self.result = None
+        self.status_code = None
+        self.done = threading.Event()
+
+    def to_dict(self):
+        job = {
+            'id': self.id,
+            'status': self.status,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+        }
+        if self.status in FINISHED:
+            job['result'] = self.result
+            job['status_code'] = self.status_code
+        return job
+
+
+class JobRunner:
+    """Bounded thread pool of deadline-limited jobs, looked up by ID"""
+
+    def __init__(self, max_workers=4, max_pending=32, timeout_seconds=30, retention_seconds=600):
+        self.max_pending = max_pending
+        self.timeout_seconds = timeout_seconds
+        self.retention_seconds = retention_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='analysis-job')
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self.counts = {SUCCEEDED: 0, FAILED: 0, TIMED_OUT: 0}
+
+    def submit(self, fn, timeout=None, cleanup=None):
+        """Queue fn(deadline) -> (body, status_code); returns the Job
+
+        `deadline` is a time.monotonic() value. cleanup(), if given, runs on
+        the worker once the job is done with, whether or not fn ran. Raises
+        JobQueueFull when max_pending jobs are unfinished.
+        """
+        job = Job(timeout or self.timeout_seconds)
+        with self._lock:
+            self._expire()
+            if sum(1 for other in self._jobs.values() if other.status not in FINISHED) >= self.max_pending:
+                raise JobQueueFull('Too many image analyses in progress, try again shortly')
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, fn, cleanup)
+        return job
+
+    def _run(self, job, fn, cleanup):
+        try:
+            self._execute(job, fn)
+        finally:
+            if cleanup is not None:
+                cleanup()
+
+    def _execute(self, job, fn):
+        with self._lock:
+            if job.status in FINISHED:
+                return
+            if time.monotonic() >= job.deadline:
+                self._finish(job, TIMED_OUT, *self._timeout_result())
+                return
+            job.status = RUNNING
+        try:
+            body, status_code = fn(job.deadline)
+            status = SUCCEEDED if status_code < 400 else FAILED
+        except Exception as e:
+            body, status_code, status = {'success': False, 'error': str(e)}, 500, FAILED
+        with self._lock:
+            if job.status in FINISHED:
+                return
+            if time.monotonic() >= job.deadline:
+                self._finish(job, TIMED_OUT, *self._timeout_result())
+            else:
+                self._finish(job, status, body, status_code)
+
+    def _timeout_result(self):
+        return {'success': False, 'error': f'Image analysis timed out after {self.timeout_seconds}s'}, 504
+
+    def _finish(self, job, status, body, status_code):
+        # Caller holds self._lock
+        job.status = status
+        job.result = body
+        job.status_code = status_code
+        job.finished_at = time.time()
+        self.counts[status] += 1
+        job.done.set()
+
+    def _expire(self):
+        # Caller holds self._lock. Overdue jobs time out even if a worker is
+        # still stuck on them; old finished ones are dropped.
+        now = time.monotonic()
+        cutoff = time.time() - self.retention_seconds
+        for job_id, job in list(self._jobs.items()):
+            if job.status not in FINISHED and now >= job.deadline:
+                self._finish(job, TIMED_OUT, *self._timeout_result())
+            elif job.status in FINISHED and job.finished_at < cutoff:
+                del self._jobs[job_id]
+
+    def get(self, job_id):
+        with self._lock:
+            self._expire()
+            return self._jobs.get(job_id)
+
+    def wait(self, job):
+        """Block until the job finishes or its deadline passes; returns (body, status_code)"""
+        job.done.wait(max(0.0, job.deadline - time.monotonic()))
+        with self._lock:
+            if job.status not in FINISHED:
+                self._finish(job, TIMED_OUT, *self._timeout_result())
+            return job.result, job.status_code
+
+    def stats(self):
+        with self._lock:
+            self._expire()
+            active = [job.status for job in self._jobs.values()]
+            return {
+                'queued': active.count(QUEUED),
+                'running': active.count(RUNNING),
+                'retained': len(active),
+                'max_pending': self.max_pending,
+                'timeout_seconds': self.timeout_seconds,
+                **self.counts,
+            }
@@ -1,36 +1,226 @@
-from flask import Flask, request, jsonify, send_file, send_from_directory
+from flask import Flask, Request, Response, request, jsonify, send_from_directory
 from flask_cors import CORS
 import sqlite3
-import qrcode
 import os
 import json
 import random
+import heapq
 import base64
-from datetime import datetime, timedelta
+import hashlib
+import threading
+import time
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
-import anthropic
-from PIL import Image
-import io
+from werkzeug.exceptions import RequestEntityTooLarge
 
+# Before the local imports: db reads DATABASE_URL and SQLITE_* when imported
 load_dotenv()
 
+import db
+from db import DATABASE, get_db
+from migrations import run_migrations
+from geo import GridClusterIndex, bounding_box, haversine_km
+from user_cache import UserLookupCache
+from events import EventBus, StreamFilter
+from qr_worker import QRWorker, is_content_addressed, qr_filename
+from qr_token import get_secret as get_qr_token_secret, make_token, parse_token
+from image_prep import ImagePreprocessor, PreprocessorBusy
+from analysis_cache import AnalysisCache
+from analysis_jobs import JobQueueFull, JobRunner
+from photo_upload import PhotoTooLarge, SpooledPhoto, spool_bytes, spool_stream, take_upload
+from llm_gateway import CircuitOpen, DeadlineExceeded, get_gateway, message_text
+
 app = Flask(__name__)
 CORS(app)
 
 # Anthropic API key should be set via environment variable ANTHROPIC_API_KEY
 # For development, you can create a .env file with: ANTHROPIC_API_KEY=your_key_here
+# Calls go through llm_gateway, which retries, rate-limits and trips a
+# circuit breaker for every provider call in the process
 
-# Initialize Anthropic client
-anthropic_client = anthropic.Anthropic(
-    api_key=os.getenv('ANTHROPIC_API_KEY')
-)
+db.init_app(app)
+
+# "Packages near me" defaults for /api/packages/available?lat=&lng=
+NEARBY_DEFAULT_RADIUS_KM = 10
+NEARBY_MAX_RADIUS_KM = 100
+NEARBY_DEFAULT_LIMIT = 50
+NEARBY_MAX_LIMIT = 200
+
+# Page sizes for keyset-paginated package listings
+LIST_DEFAULT_LIMIT = 50
+LIST_MAX_LIMIT = 200
+
+LEADERBOARD_MAX_LIMIT = 100
+
+# /api/stores/locations?zoom=: web map zoom levels, and the last one that clusters
+MAP_MAX_ZOOM = 22
+STORE_CLUSTER_MAX_ZOOM = 16
+ROLLUP_MAX_DAYS = 366
+
+PACKAGE_REQUIRED_FIELDS = ('store_name', 'store_email', 'weight_lbs', 'food_type',
+                           'pickup_window_start', 'pickup_window_end')
+BULK_MAX_PACKAGES = 500
+
+# Idle /api/stream/packages connections get a comment line this often, which
+# keeps proxies from timing them out and lets us notice disconnected clients
+STREAM_HEARTBEAT_SECONDS = 15
+
+# QR images: content-addressed names are immutable; older per-package names
+# get a shorter lifetime. The collector sweeps images no live package uses.
+QR_IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+QR_LEGACY_MAX_AGE = 3600
+QR_GC_INTERVAL_SECONDS = 3600
+QR_GC_GRACE_SECONDS = 600
+# Where QR images are written; served at /uploads/<filename> whatever the directory
+QR_IMAGE_DIR = os.getenv('QR_IMAGE_DIR', 'uploads')
+
+# Food photos are decoded and resized in worker processes, not request threads
+IMAGE_PREP_WORKERS = int(os.getenv('IMAGE_PREP_WORKERS', 2))
+IMAGE_PREP_MAX_PENDING = int(os.getenv('IMAGE_PREP_MAX_PENDING', 8))
+
+# Uploaded photos are kept in memory up to PHOTO_MEMORY_BYTES, then spooled to disk
+PHOTO_MAX_BYTES = int(os.getenv('PHOTO_MAX_BYTES', 25 * 1024 * 1024))
+PHOTO_MEMORY_BYTES = int(os.getenv('PHOTO_MEMORY_BYTES', 512 * 1024))
+# Request bodies are refused past this before they are read: one photo sent
+# as base64 JSON (a third larger than the photo) plus form/JSON overhead
+PHOTO_REQUEST_MAX_BYTES = PHOTO_MAX_BYTES * 4 // 3 + 64 * 1024
+app.config['MAX_CONTENT_LENGTH'] = PHOTO_REQUEST_MAX_BYTES
+
+FOOD_ANALYSIS_MODEL = "claude-3-5-sonnet-20241022"
+FOOD_ANALYSIS_PROMPT = """You are an expert food analyst helping stores estimate food waste for donation. Analyze this food image and provide accurate weight estimates.
+
+WEIGHT ESTIMATION GUIDELINES:
+- Use common food references: 1 slice bread = ~1oz, 1 apple = ~6oz, 1 sandwich = ~8oz
+- Consider container weight: plastic containers +0.1-0.3 lbs, paper bags +0.05-0.1 lbs
+- Look for size references: hands, utensils, plates, or packaging for scale
+- Account for food density: bread is light, soup/sauces are heavy, fresh produce varies
+- Be conservative but realistic: round to nearest 0.1 lbs
 
-# Database setup
-DATABASE = os.getenv('DATABASE_URL', 'packages.db')
+COMMON ESTIMATES:
+- Single bagel/donut: 0.2-0.4 lbs
+- Loaf of bread: 1.5-2.5 lbs  
+- Large pizza: 2-4 lbs
+- Prepared sandwich: 0.4-0.8 lbs
+- Bunch of bananas (5-6): 2-3 lbs
+- Large prepared meal: 1-2 lbs
+
+Provide a JSON response with:
+1. food_type: Specific, descriptive name (e.g., "Fresh Baked Bread Loaves", "Prepared Deli Sandwiches", "Mixed Produce - Apples & Bananas")
+2. estimated_weight_lbs: Your best weight estimate in pounds (be realistic, consider all visible items + containers)
+3. confidence: Your confidence level (high/medium/low)
+4. description: Brief description including what you see and why you estimated this weight
+5. reasoning: Explain your weight calculation approach
+
+Respond ONLY with valid JSON in this exact format:
+{
+  "food_type": "string",
+  "estimated_weight_lbs": number,
+  "confidence": "high|medium|low", 
+  "description": "string",
+  "reasoning": "string"
+}"""
+
+FOOD_BATCH_ANALYSIS_PROMPT = """The {count} photos above all show parts of ONE food donation, possibly from different angles, so the same items may appear in more than one photo. Use the same weight estimation approach as for a single photo: common food references, container weight, visible size references and food density, rounded to the nearest 0.1 lbs.
+
+For each photo, estimate only what is visible in that photo. For the combined estimate, count every distinct item once: do not add up items that appear in several photos.
+
+Respond ONLY with valid JSON in this exact format, with exactly {count} entries in "images", in photo order:
+{{
+  "images": [
+    {{
+      "food_type": "string",
+      "estimated_weight_lbs": number,
+      "confidence": "high|medium|low",
+      "description": "string"
+    }}
+  ],
+  "combined": {{
+    "food_type": "string",
+    "estimated_weight_lbs": number,
+    "confidence": "high|medium|low",
+    "description": "string",
+    "reasoning": "string"
+  }}
+}}"""
+# A batch takes one preprocessing slot per photo
+ANALYSIS_BATCH_MAX_PHOTOS = min(8, IMAGE_PREP_MAX_PENDING)
+BATCH_PHOTO_ENDPOINTS = ('analyze_food_image_batch',)
+
+class PhotoUploadRequest(Request):
+    """Parses multipart file uploads straight into SpooledPhotos
+    
+    So a file is spooled once, by the form parser, with PHOTO_MAX_BYTES
+    enforced as it is written; see photo_upload.take_upload(). Every spool
+    is recorded, so the ones no handler claimed are deleted even when the
+    parse stops partway (a later file too large, the client gone).
+    """
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.photo_spools = []
+    
+    @property
+    def max_content_length(self):
+        if self.endpoint in BATCH_PHOTO_ENDPOINTS:
+            return PHOTO_REQUEST_MAX_BYTES * ANALYSIS_BATCH_MAX_PHOTOS
+        return super().max_content_length
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        photo = SpooledPhoto(PHOTO_MEMORY_BYTES, PHOTO_MAX_BYTES)
+        self.photo_spools.append(photo)
+        return photo
+    
+    def _load_form_data(self):
+        try:
+            super()._load_form_data()
+        except BaseException:
+            # The files parsed before the failure never reach request.files
+            self.close_unclaimed_photos()
+            raise
+    
+    def close_unclaimed_photos(self):
+        for photo in self.photo_spools:
+            if not photo.claimed:
+                photo.close()
+    
+    def close(self):
+        super().close()
+        self.close_unclaimed_photos()
+
+app.request_class = PhotoUploadRequest
+
+# Analyses run as jobs on their own pool, so slow model calls can't take
+# every request thread; each gets ANALYSIS_JOB_TIMEOUT_SECONDS end to end
+ANALYSIS_JOB_WORKERS = int(os.getenv('ANALYSIS_JOB_WORKERS', 4))
+ANALYSIS_JOB_MAX_PENDING = int(os.getenv('ANALYSIS_JOB_MAX_PENDING', 32))
+ANALYSIS_JOB_TIMEOUT_SECONDS = int(os.getenv('ANALYSIS_JOB_TIMEOUT_SECONDS', 30))
+
+# Photos whose dHashes differ in at most this many of 64 bits share an analysis
+ANALYSIS_CACHE_MAX_DISTANCE = int(os.getenv('ANALYSIS_CACHE_MAX_DISTANCE', 6))
+ANALYSIS_CACHE_TTL_SECONDS = int(os.getenv('ANALYSIS_CACHE_TTL_SECONDS', 7 * 24 * 3600))
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.getenv('ANALYSIS_CACHE_MAX_ENTRIES', 5000))
+
+# Packages as streamed and resolved from QR tokens: never the pickup PIN or QR payload
+PUBLIC_PACKAGE_FIELDS = ('id', 'store_name', 'store_email', 'weight_lbs', 'food_type',
+                         'pickup_window_start', 'pickup_window_end', 'special_instructions',
+                         'status', 'created_at', 'volunteer_id', 'pickup_completed_at',
+                         'store_address', 'store_lat', 'store_lng')
+
+image_preprocessor = ImagePreprocessor(max_workers=IMAGE_PREP_WORKERS, max_pending=IMAGE_PREP_MAX_PENDING)
+analysis_cache = AnalysisCache(
+    max_distance=ANALYSIS_CACHE_MAX_DISTANCE,
+    ttl_seconds=ANALYSIS_CACHE_TTL_SECONDS,
+    max_entries=ANALYSIS_CACHE_MAX_ENTRIES
+)
+analysis_jobs = JobRunner(
+    max_workers=ANALYSIS_JOB_WORKERS,
+    max_pending=ANALYSIS_JOB_MAX_PENDING,
+    timeout_seconds=ANALYSIS_JOB_TIMEOUT_SECONDS
+)
 
 def init_db():
     """Initialize the database with all tables"""
-    conn = sqlite3.connect(DATABASE)
+    conn = db.connect()
     cursor = conn.cursor()
     
     # Packages table
@@ -91,38 +281,280 @@ def init_db():
     ''')
     
     conn.commit()
+    
+    # Bring older databases up to the current schema (columns, indexes, ...)
+    run_migrations(conn)
     conn.close()
 
-def generate_qr_code(package_data, package_id):
-    """Generate QR code image and return the file path"""
-    # Create uploads directory if it doesn't exist
-    if not os.path.exists('uploads'):
-        os.makedirs('uploads')
+# Renders QR images off the request path; see qr_worker.py
+qr_worker = QRWorker(QR_IMAGE_DIR)
+
+def qr_image_path(payload):
+    """Where a QR payload's image lives, as stored in packages.qr_code_image_path"""
+    return f'uploads/{qr_filename(payload)}'
+
+def generate_qr_code(payload):
+    """Queue the QR code image for rendering and return its file path"""
+    qr_worker.submit(payload, qr_filename(payload))
+    return qr_image_path(payload)
+
+def generate_qr_codes(payloads):
+    """Queue a batch of QR code images and return their file paths"""
+    qr_worker.submit_many((payload, qr_filename(payload)) for payload in payloads)
+    return [qr_image_path(payload) for payload in payloads]
+
+def collect_qr_garbage():
+    """Delete QR images that no pending or in-progress package refers to"""
+    with db.pooled_connection() as conn:
+        keep = {
+            os.path.basename(row[0]) for row in conn.execute('''
+                SELECT qr_code_image_path FROM packages
+                WHERE status IN ('pending', 'assigned', 'picked_up') AND qr_code_image_path IS NOT NULL
+            ''')
+        }
+    return qr_worker.collect_garbage(keep, QR_GC_GRACE_SECONDS)
+
+def start_qr_garbage_collector(interval=QR_GC_INTERVAL_SECONDS):
+    """Run collect_qr_garbage() every `interval` seconds on a daemon thread"""
+    def sweep():
+        while True:
+            time.sleep(interval)
+            try:
+                removed = collect_qr_garbage()
+                if removed:
+                    print(f"Removed {removed} unused QR images")
+            except Exception as e:
+                print(f"QR image cleanup failed: {e}")
     
-    # Create QR code
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
-    )
+    threading.Thread(target=sweep, name='qr-gc', daemon=True).start()
+
+def qr_payload(qr_code_data):
+    """What a package's QR code encodes: its token, or the full JSON on older rows"""
+    try:
+        legacy = json.loads(qr_code_data)
+    except (TypeError, ValueError):
+        return qr_code_data
+    return legacy if isinstance(legacy, dict) else qr_code_data
+
+def generate_pickup_pin():
+    """Generate a 4-digit PIN for package pickup confirmation"""
+    return f"{random.randint(1000, 9999)}"
+
+PACKAGE_FIELDS = (
+    'id', 'store_name', 'store_email', 'weight_lbs', 'food_type',
+    'pickup_window_start', 'pickup_window_end', 'special_instructions',
+    'qr_code_data', 'qr_code_image_path', 'pickup_pin', 'status',
+    'created_at', 'volunteer_id', 'pickup_completed_at'
+)
+
+# Derived from the store, added to listings that join store locations
+PACKAGE_LOCATION_FIELDS = ('store_address', 'store_lat', 'store_lng')
+# Joined from store_profiles (aliased s) as the location fallback for package_to_dict
+STORE_LOCATION_COLUMNS = 's.address AS profile_address, s.latitude AS profile_lat, s.longitude AS profile_lng'
+RECENT_DELIVERY_FIELDS = ('id', 'store_name', 'store_email', 'weight_lbs', 'food_type',
+                          'volunteer_id', 'pickup_completed_at', 'store_address')
+
+def parse_profile_data(profile_data):
+    """Parse a profile_data JSON column, returning {} if it is missing or invalid"""
+    if not profile_data:
+        return {}
+    try:
+        store_data = json.loads(profile_data)
+    except json.JSONDecodeError:
+        return {}
+    return store_data if isinstance(store_data, dict) else {}
+
+def store_location(store_data):
+    """Extract (address, latitude, longitude) from parsed store profile data"""
+    address = store_data.get('address') or 'Address not available'
+    lat = float(store_data['latitude']) if store_data.get('latitude') else None
+    lng = float(store_data['longitude']) if store_data.get('longitude') else None
+    return address, lat, lng
+
+def lookup_store_location(cursor, store_email):
+    """(address, latitude, longitude) from the store profile's location columns"""
+    cursor.execute('SELECT address, latitude, longitude FROM store_profiles WHERE email = ?', (store_email,))
+    store = cursor.fetchone()
+    if not store:
+        return 'Address not available', None, None
+    return store['address'] or 'Address not available', store['latitude'], store['longitude']
+
+def package_to_dict(package, fields=None):
+    """Convert a packages row, optionally joined with STORE_LOCATION_COLUMNS, to a dictionary
+    
+    `fields` limits the result to those keys (see parse_package_fields).
+    """
+    fields = fields or PACKAGE_FIELDS + PACKAGE_LOCATION_FIELDS
+    package_dict = {field: package[field] for field in fields if field in PACKAGE_FIELDS}
+    if not any(field in PACKAGE_LOCATION_FIELDS for field in fields):
+        return package_dict
+    
+    # Location is copied onto the package at creation time; only older rows
+    # without it fall back to the store profile's location columns
+    store_address = package['store_address']
+    store_lat = package['store_lat']
+    store_lng = package['store_lng']
+    if not store_address or store_lat is None or store_lng is None:
+        joined = 'profile_address' in package.keys()
+        store_address = store_address or (joined and package['profile_address']) or 'Address not available'
+        if store_lat is None and joined:
+            store_lat = package['profile_lat']
+        if store_lng is None and joined:
+            store_lng = package['profile_lng']
+    
+    location = {'store_address': store_address, 'store_lat': store_lat, 'store_lng': store_lng}
+    package_dict.update((field, location[field]) for field in fields if field in location)
+    return package_dict
+
+def parse_package_fields(raw_fields):
+    """Parse a ?fields=a,b,c projection; None means every field"""
+    if not raw_fields:
+        return None
+    fields = tuple(field.strip() for field in raw_fields.split(',') if field.strip())
+    unknown = [field for field in fields if field not in PACKAGE_FIELDS + PACKAGE_LOCATION_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+def encode_cursor(sort_value, package_id):
+    """Opaque keyset cursor pointing just past the given row"""
+    return base64.urlsafe_b64encode(json.dumps([sort_value, package_id]).encode()).decode().rstrip('=')
+
+def decode_cursor(token):
+    try:
+        sort_value, package_id = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        # Only scalars bind as SQL parameters; a list or dict would fail in SQLite
+        if sort_value is not None and not isinstance(sort_value, (str, int, float)):
+            raise TypeError(f'Unsupported sort value: {type(sort_value).__name__}')
+        return sort_value, int(package_id)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+def keyset_condition(column, descending, cursor):
+    """WHERE clause selecting rows after `cursor` in ORDER BY column, id order"""
+    sort_value, package_id = cursor
+    if sort_value is None:
+        # NULLs sort first ascending and last descending
+        if descending:
+            return f'({column} IS NULL AND p.id < ?)', [package_id]
+        return f'({column} IS NOT NULL OR p.id > ?)', [package_id]
+    # A bare row-value comparison lets SQLite seek straight to the cursor in the
+    # index. Descending listings sort on created_at, which is never NULL, so no
+    # NULL rows can hide behind it.
+    op = '<' if descending else '>'
+    return f'({column}, p.id) {op} (?, ?)', [sort_value, package_id]
+
+def list_packages(where, params, sort_column, descending=True, join_store=True):
+    """Run a package listing query, applying ?limit=, ?cursor= and ?fields=
+    
+    Pages are keyset-paginated on (sort_column, id), so each page costs the
+    same however much history sits behind it. Without limit or cursor the full
+    list is returned, as older clients expect. Raises ValueError on bad params.
+    Returns (package_list, next_cursor).
+    """
+    fields = parse_package_fields(request.args.get('fields'))
+    after = request.args.get('cursor')
+    limit = request.args.get('limit', LIST_DEFAULT_LIMIT if after else None, type=int)
+    if ('limit' in request.args and limit is None) or (limit is not None and not 0 < limit <= LIST_MAX_LIMIT):
+        raise ValueError(f'limit must be between 1 and {LIST_MAX_LIMIT}')
     
-    qr.add_data(json.dumps(package_data))
-    qr.make(fit=True)
+    # Only read the columns the projection needs (skips qr_code_data and friends)
+    if fields is None:
+        wants_location = join_store
+    else:
+        wants_location = any(field in PACKAGE_LOCATION_FIELDS for field in fields)
+    if fields is None:
+        columns = ['p.*']
+    else:
+        needed = {'id', sort_column}.union(field for field in fields if field in PACKAGE_FIELDS)
+        if wants_location:
+            needed.update(PACKAGE_LOCATION_FIELDS)
+        columns = [f'p.{column}' for column in sorted(needed)]
+    join = ''
+    if wants_location:
+        columns.append(STORE_LOCATION_COLUMNS)
+        join = 'LEFT JOIN store_profiles s ON p.store_email = s.email'
     
-    # Create QR code image
-    qr_image = qr.make_image(fill_color="black", back_color="white")
+    conditions, query_params = [where], list(params)
+    if after:
+        condition, cursor_params = keyset_condition(f'p.{sort_column}', descending, decode_cursor(after))
+        conditions.append(condition)
+        query_params.extend(cursor_params)
+    direction = 'DESC' if descending else 'ASC'
+    sql = f'''
+        SELECT {', '.join(columns)}
+        FROM packages p
+        {join}
+        WHERE {' AND '.join(conditions)}
+        ORDER BY p.{sort_column} {direction}, p.id {direction}
+    '''
+    if limit is not None:
+        # One extra row tells us whether there is a next page
+        sql += ' LIMIT ?'
+        query_params.append(limit + 1)
     
-    # Save QR code image
-    qr_filename = f'qr-{package_id}.png'
-    qr_path = os.path.join('uploads', qr_filename)
-    qr_image.save(qr_path)
+    cursor = get_db().cursor()
+    cursor.execute(sql, query_params)
+    packages = cursor.fetchall()
     
-    return qr_path
+    next_cursor = None
+    if limit is not None and len(packages) > limit:
+        packages = packages[:limit]
+        next_cursor = encode_cursor(packages[-1][sort_column], packages[-1]['id'])
+    
+    if fields is None and not join_store:
+        fields = PACKAGE_FIELDS
+    return [package_to_dict(package, fields) for package in packages], next_cursor
 
-def generate_pickup_pin():
-    """Generate a 4-digit PIN for package pickup confirmation"""
-    return f"{random.randint(1000, 9999)}"
+def transition_package(cursor, package_id, from_status, updates, pin=None, volunteer_id=None):
+    """Atomically move a package out of `from_status`, applying `updates`
+    
+    The state check and the write are one conditional UPDATE, so when two
+    requests race for the same package exactly one of them matches. Returns
+    True if this call performed the transition; callers look the package up
+    only on failure, to explain why.
+    """
+    assignments = ', '.join(f'{column} = ?' for column in updates)
+    conditions = ['id = ?', 'status = ?']
+    params = list(updates.values()) + [package_id, from_status]
+    if pin is not None:
+        conditions.append('pickup_pin = ?')
+        params.append(str(pin))
+    if volunteer_id is not None:
+        conditions.append('volunteer_id = ?')
+        params.append(volunteer_id)
+    
+    cursor.execute(f'UPDATE packages SET {assignments} WHERE {" AND ".join(conditions)}', params)
+    return cursor.rowcount == 1
+
+package_events = EventBus()
+
+def publish_package_events(conn, event_type, package_ids):
+    """Push committed package changes to /api/stream/packages subscribers"""
+    package_ids = list(package_ids)
+    if not package_ids:
+        return
+    packages = conn.execute(f'''
+        SELECT p.*, {STORE_LOCATION_COLUMNS}
+        FROM packages p
+        LEFT JOIN store_profiles s ON p.store_email = s.email
+        WHERE p.id IN ({', '.join('?' * len(package_ids))})
+        ORDER BY p.id
+    ''', package_ids).fetchall()
+    version = get_packages_version(conn)
+    for package in packages:
+        package_events.publish(event_type, package_to_dict(package, PUBLIC_PACKAGE_FIELDS), version=version)
+
+def publish_package_event(conn, event_type, package_id):
+    """Push a committed package change to /api/stream/packages subscribers"""
+    publish_package_events(conn, event_type, [package_id])
+
+def missing_package_field(data):
+    """First required package field that is absent or empty in `data`, if any"""
+    for field in PACKAGE_REQUIRED_FIELDS:
+        if field not in data or not data[field]:
+            return field
+    return None
 
 @app.route('/api/packages/create', methods=['POST'])
 def create_package():
@@ -131,63 +563,22 @@ def create_package():
         data = request.get_json()
         
         # Validate required fields
-        required_fields = ['store_name', 'store_email', 'weight_lbs', 'food_type', 
-                          'pickup_window_start', 'pickup_window_end']
+        missing = missing_package_field(data)
+        if missing:
+            return jsonify({'success': False, 'error': f'Missing required field: {missing}'}), 400
         
-        for field in required_fields:
-            if field not in data or not data[field]:
-                return jsonify({'success': False, 'error': f'Missing required field: {field}'}), 400
-        
-        # Generate unique package ID and pickup PIN
-        package_id = str(int(datetime.now().timestamp() * 1000))
         pickup_pin = generate_pickup_pin()
         
-        # Create QR code data
-        qr_data = {
-            'package_id': package_id,
-            'store_name': data['store_name'],
-            'store_email': data['store_email'],
-            'weight_lbs': float(data['weight_lbs']),
-            'food_type': data['food_type'],
-            'pickup_window_start': data['pickup_window_start'],
-            'pickup_window_end': data['pickup_window_end'],
-            'special_instructions': data.get('special_instructions', ''),
-            'created_at': datetime.now().isoformat()
-        }
-        
-        # Generate QR code image
-        qr_image_path = generate_qr_code(qr_data, package_id)
-        
         # Get store address from store profile
-        conn = sqlite3.connect(DATABASE)
+        conn = get_db()
         cursor = conn.cursor()
-        
-        # Add store_address column if it doesn't exist
-        try:
-            cursor.execute('ALTER TABLE packages ADD COLUMN store_address TEXT')
-            conn.commit()
-        except sqlite3.OperationalError:
-            # Column already exists
-            pass
-        
-        # Get store profile data
-        cursor.execute('SELECT profile_data FROM store_profiles WHERE email = ?', (data['store_email'],))
-        store_profile = cursor.fetchone()
-        
-        store_address = 'Address not available'
-        if store_profile and store_profile[0]:
-            try:
-                profile_data = json.loads(store_profile[0])
-                if isinstance(profile_data, dict) and profile_data.get('address'):
-                    store_address = profile_data['address']
-            except json.JSONDecodeError:
-                pass
+        store_address, store_lat, store_lng = lookup_store_location(cursor, data['store_email'])
         
         cursor.execute('''
             INSERT INTO packages (
                 store_name, store_email, weight_lbs, food_type,
                 pickup_window_start, pickup_window_end, special_instructions,
-                qr_code_data, qr_code_image_path, pickup_pin, status, store_address
+                pickup_pin, status, store_address, store_lat, store_lng
             ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', (
             data['store_name'],
@@ -197,80 +588,180 @@ def create_package():
             data['pickup_window_start'],
             data['pickup_window_end'],
             data.get('special_instructions', ''),
-            json.dumps(qr_data),
-            qr_image_path,
             pickup_pin,
             'pending',
-            store_address
+            store_address,
+            store_lat,
+            store_lng
         ))
+        package_id = cursor.lastrowid
+        
+        # The QR code only carries a signed token for the package ID; scanners
+        # look the package up through /api/qr/resolve/<token>
+        qr_token = make_token(package_id)
+        cursor.execute('''
+            UPDATE packages SET qr_code_data = ?, qr_code_image_path = ? WHERE id = ?
+        ''', (qr_token, qr_image_path(qr_token), package_id))
         
         conn.commit()
-        conn.close()
+        
+        # Queue the QR code image; a worker renders it after we respond
+        qr_path = generate_qr_code(qr_token)
+        publish_package_event(conn, 'create', package_id)
         
         return jsonify({
             'success': True,
             'package_id': package_id,
             'pickup_pin': pickup_pin,
-            'qr_code_image_path': qr_image_path,
+            'qr_token': qr_token,
+            'qr_code_image_path': qr_path,
+            'qr_code_url': f'/{qr_path}',
             'message': 'Package created successfully'
         })
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/api/packages/store/<store_email>', methods=['GET'])
-def get_packages_by_store(store_email):
-    """Get all packages for a specific store"""
+@app.route('/api/packages/bulk', methods=['POST'])
+def create_packages_bulk():
+    """Create many packages for one store in a single transaction
+    
+    Body: store_name, store_email and `packages`, a list of package objects.
+    Other top-level fields (pickup windows, instructions, ...) are defaults
+    for every item. Invalid items are reported in `results` and skipped; the
+    rest are created together.
+    """
     try:
-        conn = sqlite3.connect(DATABASE)
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'success': False, 'error': 'Request body must be a JSON object'}), 400
+        items = data.get('packages')
+        
+        if not isinstance(items, list) or not items:
+            return jsonify({'success': False, 'error': 'packages must be a non-empty list'}), 400
+        if len(items) > BULK_MAX_PACKAGES:
+            return jsonify({'success': False, 'error': f'At most {BULK_MAX_PACKAGES} packages per request'}), 400
+        for field in ('store_name', 'store_email'):
+            if not data.get(field):
+                return jsonify({'success': False, 'error': f'Missing required field: {field}'}), 400
+        
+        defaults = {key: value for key, value in data.items() if key != 'packages'}
+        results = [None] * len(items)
+        rows, row_indexes, pins = [], [], []
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                results[index] = {'index': index, 'success': False, 'error': 'Package must be an object'}
+                continue
+            package = {**defaults, **item, 'store_name': data['store_name'], 'store_email': data['store_email']}
+            missing = missing_package_field(package)
+            if missing:
+                results[index] = {'index': index, 'success': False, 'error': f'Missing required field: {missing}'}
+                continue
+            try:
+                weight_lbs = float(package['weight_lbs'])
+            except (TypeError, ValueError):
+                results[index] = {'index': index, 'success': False, 'error': 'weight_lbs must be a number'}
+                continue
+            
+            pickup_pin = generate_pickup_pin()
+            rows.append((
+                package['store_name'],
+                package['store_email'],
+                weight_lbs,
+                package['food_type'],
+                package['pickup_window_start'],
+                package['pickup_window_end'],
+                package.get('special_instructions', ''),
+                pickup_pin,
+            ))
+            row_indexes.append(index)
+            pins.append(pickup_pin)
+        
+        if not rows:
+            return jsonify({'success': False, 'created': 0, 'failed': len(items), 'results': results}), 400
+        
+        conn = get_db()
         cursor = conn.cursor()
         
-        cursor.execute('''
-            SELECT * FROM packages 
-            WHERE store_email = ? 
-            ORDER BY created_at DESC
-        ''', (store_email,))
-        
-        packages = cursor.fetchall()
-        conn.close()
-        
-        # Convert to list of dictionaries
-        package_list = []
-        for package in packages:
-            package_dict = {
-                'id': package[0],
-                'store_name': package[1],
-                'store_email': package[2],
-                'weight_lbs': package[3],
-                'food_type': package[4],
-                'pickup_window_start': package[5],
-                'pickup_window_end': package[6],
-                'special_instructions': package[7],
-                'qr_code_data': package[8],
-                'qr_code_image_path': package[9],
-                'pickup_pin': package[10],
-                'status': package[11],
-                'created_at': package[12],
-                'volunteer_id': package[13],
-                'pickup_completed_at': package[14]
+        # One store profile lookup for the whole batch
+        location = lookup_store_location(cursor, data['store_email'])
+        
+        try:
+            # Take the write lock first, so every id above the current maximum
+            # is one of ours, in insertion order
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute('SELECT COALESCE(MAX(id), 0) FROM packages')
+            previous_max_id = cursor.fetchone()[0]
+            
+            cursor.executemany('''
+                INSERT INTO packages (
+                    store_name, store_email, weight_lbs, food_type,
+                    pickup_window_start, pickup_window_end, special_instructions,
+                    pickup_pin, status, store_address, store_lat, store_lng
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'pending', ?, ?, ?)
+            ''', [row + location for row in rows])
+            
+            cursor.execute('SELECT id FROM packages WHERE id > ? ORDER BY id', (previous_max_id,))
+            package_ids = [row[0] for row in cursor.fetchall()]
+            qr_tokens = [make_token(package_id) for package_id in package_ids]
+            cursor.executemany('''
+                UPDATE packages SET qr_code_data = ?, qr_code_image_path = ? WHERE id = ?
+            ''', [(token, qr_image_path(token), package_id) for token, package_id in zip(qr_tokens, package_ids)])
+            
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        
+        # Queue all QR code images at once; workers render them after we respond
+        qr_paths = generate_qr_codes(qr_tokens)
+        publish_package_events(conn, 'create', package_ids)
+        
+        for index, package_id, pickup_pin, qr_token, qr_path in zip(row_indexes, package_ids, pins, qr_tokens, qr_paths):
+            results[index] = {
+                'index': index,
+                'success': True,
+                'package_id': package_id,
+                'pickup_pin': pickup_pin,
+                'qr_token': qr_token,
+                'qr_code_image_path': qr_path,
+                'qr_code_url': f'/{qr_path}',
             }
-            package_list.append(package_dict)
         
-        return jsonify({'success': True, 'packages': package_list})
+        return jsonify({
+            'success': True,
+            'created': len(package_ids),
+            'failed': len(items) - len(package_ids),
+            'results': results
+        })
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/packages/store/<store_email>', methods=['GET'])
+def get_packages_by_store(store_email):
+    """Get packages for a specific store, newest first (?limit=&cursor=&fields=)"""
+    try:
+        package_list, next_cursor = list_packages(
+            'p.store_email = ?', (store_email,), 'created_at', join_store=False
+        )
+        
+        return jsonify({'success': True, 'packages': package_list, 'next_cursor': next_cursor})
+        
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/packages/<int:package_id>', methods=['GET'])
 def get_package(package_id):
     """Get a specific package by ID"""
     try:
-        conn = sqlite3.connect(DATABASE)
+        conn = get_db()
         cursor = conn.cursor()
         
         cursor.execute('SELECT * FROM packages WHERE id = ?', (package_id,))
         package = cursor.fetchone()
-        conn.close()
         
         if not package:
             return jsonify({'success': False, 'error': 'Package not found'}), 404
@@ -309,7 +800,7 @@ def update_package_status(package_id):
         if not status:
             return jsonify({'success': False, 'error': 'Status is required'}), 400
         
-        conn = sqlite3.connect(DATABASE)
+        conn = get_db()
         cursor = conn.cursor()
         
         pickup_time = datetime.now().isoformat() if status == 'completed' else None
@@ -321,7 +812,7 @@ def update_package_status(package_id):
         ''', (status, volunteer_id, pickup_time, package_id))
         
         conn.commit()
-        conn.close()
+        publish_package_event(conn, 'status', package_id)
         
         return jsonify({'success': True, 'message': 'Package status updated'})
         
@@ -332,24 +823,73 @@ def update_package_status(package_id):
 def get_qr_data(package_id):
     """Get QR code data for volunteers"""
     try:
-        conn = sqlite3.connect(DATABASE)
+        conn = get_db()
         cursor = conn.cursor()
         
-        cursor.execute('SELECT qr_code_data FROM packages WHERE id = ?', (package_id,))
-        result = cursor.fetchone()
-        conn.close()
+        cursor.execute('SELECT * FROM packages WHERE id = ?', (package_id,))
+        package = cursor.fetchone()
         
-        if not result:
+        if not package:
             return jsonify({'success': False, 'error': 'Package not found'}), 404
         
-        qr_data = json.loads(result[0])
+        qr_data = qr_payload(package['qr_code_data'])
+        if not isinstance(qr_data, dict):
+            # Token-era packages: same shape the QR JSON used to have
+            qr_data = {
+                'package_id': package['id'],
+                'token': qr_data,
+                'store_name': package['store_name'],
+                'store_email': package['store_email'],
+                'weight_lbs': package['weight_lbs'],
+                'food_type': package['food_type'],
+                'pickup_window_start': package['pickup_window_start'],
+                'pickup_window_end': package['pickup_window_end'],
+                'special_instructions': package['special_instructions'],
+                'created_at': package['created_at'],
+            }
         return jsonify({'success': True, 'package_data': qr_data})
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/qr/resolve/<token>', methods=['GET'])
+def resolve_qr_token(token):
+    """Look up the package behind a scanned QR token"""
+    try:
+        package_id = parse_token(token)
+        if package_id is None:
+            return jsonify({'success': False, 'error': 'Invalid QR code'}), 400
+        
+        cursor = get_db().cursor()
+        cursor.execute(f'''
+            SELECT p.*, {STORE_LOCATION_COLUMNS}
+            FROM packages p
+            LEFT JOIN store_profiles s ON p.store_email = s.email
+            WHERE p.id = ?
+        ''', (package_id,))
+        package = cursor.fetchone()
+        
+        if not package:
+            return jsonify({'success': False, 'error': 'Package not found'}), 404
+        
+        return jsonify({'success': True, 'package': package_to_dict(package, PUBLIC_PACKAGE_FIELDS)})
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 # User Profile API endpoints
 
+# Profile tables, in the order a UID with several roles resolves to
+USER_TYPES = ('volunteer', 'store', 'foodbank')
+
+# Existence/role answers for the login path; see user_cache.py
+user_lookup_cache = UserLookupCache()
+
+def lookup_user_type(conn, firebase_uid):
+    """Return the user's role from the users directory, or None if they have no profile"""
+    roles = user_lookup_cache.roles_for_uid(conn, firebase_uid)
+    return next((user_type for user_type in USER_TYPES if user_type in roles), None)
+
 @app.route('/api/users/profile', methods=['POST'])
 def create_user_profile():
     """Create or update a user profile"""
@@ -361,14 +901,18 @@ def create_user_profile():
             if field not in data:
                 return jsonify({'success': False, 'error': f'Missing required field: {field}'}), 400
         
-        conn = sqlite3.connect(DATABASE)
+        conn = get_db()
         cursor = conn.cursor()
         
         user_type = data['user_type']
+        if user_type not in USER_TYPES:
+            return jsonify({'success': False, 'error': 'Invalid user type'}), 400
+        
+        # The users directory is kept in step by triggers on the profile tables
         table_name = f"{user_type}_profiles"
         
         # Check if user already exists
-        cursor.execute(f'SELECT id FROM {table_name} WHERE firebase_uid = ?', (data['firebase_uid'],))
+        cursor.execute(f'SELECT id, email FROM {table_name} WHERE firebase_uid = ?', (data['firebase_uid'],))
         existing_user = cursor.fetchone()
         
         if existing_user:
@@ -385,8 +929,19 @@ def create_user_profile():
                 VALUES (?, ?, ?)
             ''', (data['firebase_uid'], data['email'], json.dumps(data['profile_data'])))
         
+        if user_type == 'store' and isinstance(data['profile_data'], dict):
+            # Keep the location copied onto still-open packages in step with the profile
+            store_address, store_lat, store_lng = store_location(data['profile_data'])
+            cursor.execute('''
+                UPDATE packages
+                SET store_address = ?, store_lat = ?, store_lng = ?
+                WHERE store_email = ? AND status = 'pending'
+            ''', (store_address, store_lat, store_lng, data['email']))
+        
         conn.commit()
-        conn.close()
+        user_lookup_cache.invalidate(
+            data['firebase_uid'], data['email'], existing_user['email'] if existing_user else None
+        )
         
         return jsonify({'success': True, 'message': 'Profile saved successfully'})
         
@@ -397,26 +952,19 @@ def create_user_profile():
 def get_user_profile(firebase_uid):
     """Get user profile by Firebase UID"""
     try:
-        conn = sqlite3.connect(DATABASE)
+        conn = get_db()
         cursor = conn.cursor()
         
-        # Check all user type tables
-        user_types = ['volunteer', 'store', 'foodbank']
+        # Find the user's role in the directory, then read that role's profile
+        user_type = lookup_user_type(conn, firebase_uid)
         profile = None
-        user_type = None
         
-        for ut in user_types:
+        if user_type:
             cursor.execute(f'''
                 SELECT email, profile_data, created_at, updated_at
-                FROM {ut}_profiles WHERE firebase_uid = ?
+                FROM {user_type}_profiles WHERE firebase_uid = ?
             ''', (firebase_uid,))
-            result = cursor.fetchone()
-            if result:
-                profile = result
-                user_type = ut
-                break
-        
-        conn.close()
+            profile = cursor.fetchone()
         
         if profile:
             return jsonify({
@@ -439,27 +987,13 @@ def get_user_profile(firebase_uid):
 def check_profile_completion(firebase_uid):
     """Check if user has completed their profile"""
     try:
-        conn = sqlite3.connect(DATABASE)
-        cursor = conn.cursor()
-        
-        # Check all user type tables
-        user_types = ['volunteer', 'store', 'foodbank']
-        profile_found = False
-        user_type = None
+        conn = get_db()
         
-        for ut in user_types:
-            cursor.execute(f'SELECT id FROM {ut}_profiles WHERE firebase_uid = ?', (firebase_uid,))
-            result = cursor.fetchone()
-            if result:
-                profile_found = True
-                user_type = ut
-                break
-        
-        conn.close()
+        user_type = lookup_user_type(conn, firebase_uid)
         
         return jsonify({
             'success': True,
-            'profile_completed': profile_found,
+            'profile_completed': user_type is not None,
             'user_type': user_type
         })
             
@@ -470,21 +1004,14 @@ def check_profile_completion(firebase_uid):
 def check_specific_profile_completion(user_type, firebase_uid):
     """Check if user has completed their profile for a specific user type"""
     try:
-        if user_type not in ['volunteer', 'store', 'foodbank']:
+        if user_type not in USER_TYPES:
             return jsonify({'success': False, 'error': 'Invalid user type'}), 400
         
-        conn = sqlite3.connect(DATABASE)
-        cursor = conn.cursor()
-        
-        table_name = f"{user_type}_profiles"
-        cursor.execute(f'SELECT id FROM {table_name} WHERE firebase_uid = ?', (firebase_uid,))
-        result = cursor.fetchone()
-        
-        conn.close()
+        conn = get_db()
         
         return jsonify({
             'success': True,
-            'profile_completed': bool(result)
+            'profile_completed': user_type in user_lookup_cache.roles_for_uid(conn, firebase_uid)
         })
         
     except Exception as e:
@@ -494,123 +1021,281 @@ def check_specific_profile_completion(user_type, firebase_uid):
 def check_email_exists(user_type, email):
     """Check if email exists in a specific user type table"""
     try:
-        if user_type not in ['volunteer', 'store', 'foodbank']:
+        if user_type not in USER_TYPES:
             return jsonify({'success': False, 'error': 'Invalid user type'}), 400
         
-        conn = sqlite3.connect(DATABASE)
-        cursor = conn.cursor()
-        
-        table_name = f"{user_type}_profiles"
-        cursor.execute(f'SELECT id FROM {table_name} WHERE email = ?', (email,))
-        result = cursor.fetchone()
-        
-        conn.close()
+        conn = get_db()
         
         return jsonify({
             'success': True,
-            'email_exists': bool(result)
+            'email_exists': user_type in user_lookup_cache.roles_for_email(conn, email)
         })
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/users/cache-stats', methods=['GET'])
+def get_user_cache_stats():
+    """Hit rate and latency counters for the login-path lookup cache"""
+    return jsonify({'success': True, 'stats': user_lookup_cache.stats()})
+
 @app.route('/api/packages/available', methods=['GET'])
 def get_available_packages():
-    """Get all available packages for volunteers (status = 'pending')"""
+    """Get available packages for volunteers (status = 'pending')
+    
+    With ?lat=&lng= only packages within radius_km of that point are returned,
+    nearest first and capped at limit; otherwise pending packages are listed
+    newest first (?limit=&cursor=). Both modes accept ?fields=.
+    """
     try:
-        conn = sqlite3.connect(DATABASE)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT p.*, s.profile_data
-            FROM packages p
-            LEFT JOIN store_profiles s ON p.store_email = s.email
-            WHERE p.status = 'pending'
-            ORDER BY p.created_at DESC
-        ''')
-        
-        packages = cursor.fetchall()
-        conn.close()
-        
-        # Convert to list of dictionaries with store location info
-        package_list = []
-        for package in packages:
-            # Parse store profile data if available
-            store_data = None
-            if package[15]:  # profile_data column (shifted due to pickup_pin)
-                try:
-                    store_data = json.loads(package[15])
-                except json.JSONDecodeError:
-                    store_data = None
-            
-            package_dict = {
-                'id': package[0],
-                'store_name': package[1],
-                'store_email': package[2],
-                'weight_lbs': package[3],
-                'food_type': package[4],
-                'pickup_window_start': package[5],
-                'pickup_window_end': package[6],
-                'special_instructions': package[7],
-                'qr_code_data': package[8],
-                'qr_code_image_path': package[9],
-                'pickup_pin': package[10],
-                'status': package[11],
-                'created_at': package[12],
-                'volunteer_id': package[13],
-                'pickup_completed_at': package[14],
-                'store_address': package[15] if len(package) > 15 and package[15] else (store_data.get('address', 'Address not available') if store_data and isinstance(store_data, dict) else 'Address not available'),
-                'store_lat': float(store_data.get('latitude', 0)) if store_data and isinstance(store_data, dict) and store_data.get('latitude') else None,
-                'store_lng': float(store_data.get('longitude', 0)) if store_data and isinstance(store_data, dict) and store_data.get('longitude') else None
-            }
-            package_list.append(package_dict)
+        # Read the version before the data: if a write lands in between, the
+        # client just refetches on its next poll
+        version = get_packages_version(get_db())
+        etag = f'packages-{version}'
+        if request.if_none_match.contains(etag):
+            response = app.response_class(status=304)
+            response.set_etag(etag)
+            return response
+        
+        if 'since' in request.args:
+            response = get_package_changes(version)
+        elif 'lat' in request.args or 'lng' in request.args:
+            response = get_nearby_packages()
+        else:
+            package_list, next_cursor = list_packages("p.status = 'pending'", (), 'created_at')
+            response = jsonify({'success': True, 'packages': package_list, 'next_cursor': next_cursor, 'version': version})
         
-        return jsonify({'success': True, 'packages': package_list})
+        response = app.make_response(response)
+        if response.status_code == 200:
+            response.set_etag(etag)
+        return response
         
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def get_packages_version(conn):
+    """Current packages_version, bumped by triggers on every packages write"""
+    return conn.execute('SELECT version FROM packages_version WHERE id = 1').fetchone()[0]
+
+def get_package_changes(version):
+    """Change feed for ?since=: available packages changed since then, and removed IDs"""
+    since = request.args.get('since', type=int)
+    if since is None or since < 0:
+        raise ValueError('since must be a non-negative packages version')
+    fields = parse_package_fields(request.args.get('fields'))
+    
+    cursor = get_db().cursor()
+    cursor.execute(f'''
+        SELECT c.package_id, c.deleted, p.*, {STORE_LOCATION_COLUMNS}
+        FROM package_changes c
+        LEFT JOIN packages p ON p.id = c.package_id
+        LEFT JOIN store_profiles s ON p.store_email = s.email
+        WHERE c.version > ? AND c.version <= ?
+        ORDER BY c.version
+    ''', (since, version))
+    
+    changed, removed = [], []
+    for row in cursor.fetchall():
+        if not row['deleted'] and row['status'] == 'pending':
+            changed.append(package_to_dict(row, fields))
+        else:
+            removed.append(row['package_id'])
+    
+    return jsonify({'success': True, 'version': version, 'since': since, 'changed': changed, 'removed': removed})
+
+def get_nearby_packages():
+    """Pending packages around ?lat=&lng=, sorted by great-circle distance"""
+    lat = request.args.get('lat', type=float)
+    lng = request.args.get('lng', type=float)
+    radius_km = request.args.get('radius_km', NEARBY_DEFAULT_RADIUS_KM, type=float)
+    limit = request.args.get('limit', NEARBY_DEFAULT_LIMIT, type=int)
+    fields = parse_package_fields(request.args.get('fields'))
+    
+    if lat is None or lng is None or not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return jsonify({'success': False, 'error': 'lat and lng must be valid coordinates'}), 400
+    if radius_km is None or not 0 < radius_km <= NEARBY_MAX_RADIUS_KM:
+        return jsonify({'success': False, 'error': f'radius_km must be between 0 and {NEARBY_MAX_RADIUS_KM}'}), 400
+    if limit is None or not 0 < limit <= NEARBY_MAX_LIMIT:
+        return jsonify({'success': False, 'error': f'limit must be between 1 and {NEARBY_MAX_LIMIT}'}), 400
+    
+    conn = get_db()
+    cursor = conn.cursor()
+    
+    # The R*Tree only holds pending packages, so this reads the local area only
+    min_lat, max_lat, min_lng, max_lng = bounding_box(lat, lng, radius_km)
+    cursor.execute(f'''
+        SELECT p.*, {STORE_LOCATION_COLUMNS}
+        FROM packages_geo g
+        JOIN packages p ON p.id = g.id
+        LEFT JOIN store_profiles s ON p.store_email = s.email
+        WHERE g.max_lat >= ? AND g.min_lat <= ?
+        AND g.max_lng >= ? AND g.min_lng <= ?
+        AND p.status = 'pending'
+    ''', (min_lat, max_lat, min_lng, max_lng))
+    
+    # The box is wider than the circle; trim the corners with the exact distance
+    candidates = []
+    for package in cursor.fetchall():
+        distance = haversine_km(lat, lng, package['store_lat'], package['store_lng'])
+        if distance <= radius_km:
+            candidates.append((distance, package['id'], package))
+    
+    package_list = []
+    for distance, _, package in heapq.nsmallest(limit, candidates, key=lambda c: (c[0], c[1])):
+        package_dict = package_to_dict(package, fields)
+        package_dict['distance_km'] = round(distance, 2)
+        package_list.append(package_dict)
+    
+    return jsonify({'success': True, 'packages': package_list})
+
+def parse_bbox(raw_bbox):
+    """Parse ?bbox=min_lat,min_lng,max_lat,max_lng; None if absent"""
+    if not raw_bbox:
+        return None
+    try:
+        min_lat, min_lng, max_lat, max_lng = (float(value) for value in raw_bbox.split(','))
+    except ValueError:
+        raise ValueError('bbox must be min_lat,min_lng,max_lat,max_lng')
+    if not (-90 <= min_lat <= max_lat <= 90 and -180 <= min_lng <= max_lng <= 180):
+        raise ValueError('bbox must be min_lat,min_lng,max_lat,max_lng')
+    return min_lat, min_lng, max_lat, max_lng
+
+def format_sse(event_type, data, event_id=None):
+    """One Server-Sent Events message"""
+    message = f'event: {event_type}\n'
+    if event_id is not None:
+        message += f'id: {event_id}\n'
+    return message + f'data: {json.dumps(data)}\n\n'
+
+@app.route('/api/stream/packages', methods=['GET'])
+def stream_packages():
+    """Server-Sent Events stream of package lifecycle events
+    
+    Filters: ?role=volunteer|store|foodbank, ?store_email=, ?volunteer_id=,
+    ?bbox=min_lat,min_lng,max_lat,max_lng. Events are create, assign, pickup,
+    deliver, complete and status; `resync` means events were dropped and the
+    client should refetch its list.
+    """
+    try:
+        event_filter = StreamFilter(
+            role=request.args.get('role'),
+            store_email=request.args.get('store_email'),
+            volunteer_id=request.args.get('volunteer_id'),
+            bbox=parse_bbox(request.args.get('bbox')),
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    subscription = package_events.subscribe(event_filter)
+    
+    def events():
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                event = subscription.get(STREAM_HEARTBEAT_SECONDS)
+                if subscription.overflowed:
+                    subscription.drain()
+                    yield format_sse('resync', {})
+                elif event is None:
+                    yield ': keep-alive\n\n'
+                else:
+                    yield format_sse(event['type'], event, event['id'])
+        finally:
+            package_events.unsubscribe(subscription)
+    
+    return Response(events(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
+@app.route('/api/stream/stats', methods=['GET'])
+def get_stream_stats():
+    """Subscriber and delivery counters for the package event stream"""
+    return jsonify({'success': True, 'stats': package_events.stats()})
+
+def store_location_to_dict(store):
+    """Map marker for a store_profiles row"""
+    return {
+        'id': store['firebase_uid'],
+        'name': store['store_name'] or 'Unnamed Store',
+        'address': store['address'] or 'No address',
+        'lat': store['latitude'],
+        'lng': store['longitude'],
+        'email': store['email']
+    }
+
+# Cluster index over every store with coordinates, rebuilt when
+# store_locations_version moves
+store_clusters = {'version': None, 'index': None}
+store_clusters_lock = threading.Lock()
+
+def get_store_cluster_index(conn):
+    """GridClusterIndex of all store markers, current as of store_locations_version"""
+    version = conn.execute('SELECT version FROM store_locations_version WHERE id = 1').fetchone()[0]
+    with store_clusters_lock:
+        if store_clusters['version'] == version:
+            return store_clusters['index']
+    
+    # Reading the rows after the version means a concurrent write at worst
+    # triggers one extra rebuild
+    stores = conn.execute('''
+        SELECT firebase_uid, email, store_name, address, latitude, longitude
+        FROM store_profiles
+        WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+    ''').fetchall()
+    index = GridClusterIndex(
+        [(store['latitude'], store['longitude'], store_location_to_dict(store)) for store in stores],
+        STORE_CLUSTER_MAX_ZOOM
+    )
+    with store_clusters_lock:
+        store_clusters['version'] = version
+        store_clusters['index'] = index
+    return index
+
 @app.route('/api/stores/locations', methods=['GET'])
 def get_store_locations():
-    """Get all store locations for map display"""
+    """Get store locations for map display
+    
+    ?bbox=min_lat,min_lng,max_lat,max_lng returns only stores in view, and
+    ?zoom= groups stores sharing a grid cell at that zoom into clusters, so
+    the payload is bounded by the viewport rather than the number of stores.
+    Past STORE_CLUSTER_MAX_ZOOM every store is returned individually.
+    """
     try:
-        conn = sqlite3.connect(DATABASE)
+        bbox = parse_bbox(request.args.get('bbox'))
+        zoom = request.args.get('zoom', type=int)
+        if 'zoom' in request.args and (zoom is None or not 0 <= zoom <= MAP_MAX_ZOOM):
+            return jsonify({'success': False, 'error': f'zoom must be between 0 and {MAP_MAX_ZOOM}'}), 400
+        
+        conn = get_db()
+        
+        if zoom is not None and zoom <= STORE_CLUSTER_MAX_ZOOM:
+            stores, clusters = get_store_cluster_index(conn).query(zoom, bbox)
+            return jsonify({'success': True, 'zoom': zoom, 'stores': stores, 'clusters': clusters})
+        
+        # Stores without coordinates have NULL latitude/longitude
+        conditions = ['latitude IS NOT NULL AND longitude IS NOT NULL']
+        params = []
+        if bbox:
+            min_lat, min_lng, max_lat, max_lng = bbox
+            conditions.append('latitude BETWEEN ? AND ? AND longitude BETWEEN ? AND ?')
+            params.extend((min_lat, max_lat, min_lng, max_lng))
         cursor = conn.cursor()
-        
-        # Get all stores with their profile data
-        cursor.execute('''
-            SELECT firebase_uid, email, profile_data
+        cursor.execute(f'''
+            SELECT firebase_uid, email, store_name, address, latitude, longitude
             FROM store_profiles
-        ''')
+            WHERE {' AND '.join(conditions)}
+        ''', params)
         
-        stores = cursor.fetchall()
-        conn.close()
-        
-        # Convert to list of dictionaries
-        store_locations = []
-        for store in stores:
-            try:
-                profile_data = json.loads(store[2])  # Parse JSON from profile_data
-                
-                # Only include stores that have location data
-                if profile_data.get('latitude') and profile_data.get('longitude'):
-                    store_locations.append({
-                        'id': store[0],  # firebase_uid as id
-                        'name': profile_data.get('storeName', 'Unnamed Store'),
-                        'address': profile_data.get('address', 'No address'),
-                        'lat': float(profile_data.get('latitude')),
-                        'lng': float(profile_data.get('longitude')),
-                        'email': store[1]
-                    })
-            except json.JSONDecodeError:
-                # Skip stores with invalid JSON data
-                continue
-        
-        return jsonify({
-            'success': True,
-            'stores': store_locations
-        })
+        response = {'success': True, 'stores': [store_location_to_dict(store) for store in cursor.fetchall()], 'clusters': []}
+        if zoom is not None:
+            response['zoom'] = zoom
+        return jsonify(response)
         
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -625,35 +1310,26 @@ def verify_pickup_pin(package_id):
         if not entered_pin or not volunteer_id:
             return jsonify({'success': False, 'error': 'PIN and volunteer ID are required'}), 400
         
-        conn = sqlite3.connect(DATABASE)
+        conn = get_db()
         cursor = conn.cursor()
         
-        # Check if package exists and get its PIN
-        cursor.execute('SELECT id, pickup_pin, status FROM packages WHERE id = ?', (package_id,))
-        package = cursor.fetchone()
-        
-        if not package:
-            conn.close()
-            return jsonify({'success': False, 'error': 'Package not found'}), 404
-        
-        if package[2] != 'pending':
-            conn.close()
-            return jsonify({'success': False, 'error': 'Package is no longer available'}), 400
-        
-        # Verify PIN
-        if str(entered_pin) != str(package[1]):
-            conn.close()
+        # Assign only if the package is still pending and the PIN matches
+        if not transition_package(cursor, package_id, 'pending',
+                                  {'status': 'assigned', 'volunteer_id': volunteer_id},
+                                  pin=entered_pin):
+            cursor.execute('SELECT status FROM packages WHERE id = ?', (package_id,))
+            package = cursor.fetchone()
+            
+            if not package:
+                return jsonify({'success': False, 'error': 'Package not found'}), 404
+            
+            if package['status'] != 'pending':
+                return jsonify({'success': False, 'error': 'Package is no longer available'}), 400
+            
             return jsonify({'success': False, 'error': 'Invalid PIN. Please check with the store.'}), 400
         
-        # PIN is correct - assign package to volunteer
-        cursor.execute('''
-            UPDATE packages 
-            SET status = 'assigned', volunteer_id = ?
-            WHERE id = ?
-        ''', (volunteer_id, package_id))
-        
         conn.commit()
-        conn.close()
+        publish_package_event(conn, 'assign', package_id)
         
         return jsonify({
             'success': True, 
@@ -675,30 +1351,20 @@ def assign_package_to_volunteer(package_id):
         if not volunteer_id:
             return jsonify({'success': False, 'error': 'Volunteer ID is required'}), 400
         
-        conn = sqlite3.connect(DATABASE)
+        conn = get_db()
         cursor = conn.cursor()
         
-        # Check if package exists and is available
-        cursor.execute('SELECT id, status FROM packages WHERE id = ?', (package_id,))
-        package = cursor.fetchone()
-        
-        if not package:
-            conn.close()
-            return jsonify({'success': False, 'error': 'Package not found'}), 404
-        
-        if package[1] != 'pending':
-            conn.close()
+        # Assign only if the package is still pending
+        if not transition_package(cursor, package_id, 'pending',
+                                  {'status': 'assigned', 'volunteer_id': volunteer_id}):
+            cursor.execute('SELECT id FROM packages WHERE id = ?', (package_id,))
+            if not cursor.fetchone():
+                return jsonify({'success': False, 'error': 'Package not found'}), 404
+            
             return jsonify({'success': False, 'error': 'Package is no longer available'}), 400
         
-        # Update package status and assign to volunteer
-        cursor.execute('''
-            UPDATE packages 
-            SET status = 'assigned', volunteer_id = ?
-            WHERE id = ?
-        ''', (volunteer_id, package_id))
-        
         conn.commit()
-        conn.close()
+        publish_package_event(conn, 'assign', package_id)
         
         return jsonify({
             'success': True, 
@@ -714,87 +1380,49 @@ def assign_package_to_volunteer(package_id):
 def get_volunteer_packages(volunteer_id):
     """Get active packages assigned to a specific volunteer (excludes completed packages)"""
     try:
-        conn = sqlite3.connect(DATABASE)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT p.*, s.profile_data
-            FROM packages p
-            LEFT JOIN store_profiles s ON p.store_email = s.email
-            WHERE p.volunteer_id = ? AND p.status != 'completed'
-            ORDER BY p.created_at DESC
-        ''', (volunteer_id,))
-        
-        packages = cursor.fetchall()
-        conn.close()
-        
-        # Convert to list of dictionaries with store location info
-        package_list = []
-        for package in packages:
-            # Parse store profile data if available
-            store_data = None
-            if package[15]:  # profile_data column (shifted due to pickup_pin)
-                try:
-                    store_data = json.loads(package[15])
-                except json.JSONDecodeError:
-                    store_data = None
-            
-            package_dict = {
-                'id': package[0],
-                'store_name': package[1],
-                'store_email': package[2],
-                'weight_lbs': package[3],
-                'food_type': package[4],
-                'pickup_window_start': package[5],
-                'pickup_window_end': package[6],
-                'special_instructions': package[7],
-                'qr_code_data': package[8],
-                'qr_code_image_path': package[9],
-                'pickup_pin': package[10],
-                'status': package[11],
-                'created_at': package[12],
-                'volunteer_id': package[13],
-                'pickup_completed_at': package[14],
-                'store_address': package[15] if len(package) > 15 and package[15] else (store_data.get('address', 'Address not available') if store_data and isinstance(store_data, dict) else 'Address not available'),
-                'store_lat': float(store_data.get('latitude', 0)) if store_data and isinstance(store_data, dict) and store_data.get('latitude') else None,
-                'store_lng': float(store_data.get('longitude', 0)) if store_data and isinstance(store_data, dict) and store_data.get('longitude') else None
-            }
-            package_list.append(package_dict)
+        package_list, next_cursor = list_packages(
+            "p.volunteer_id = ? AND p.status != 'completed'", (volunteer_id,), 'created_at'
+        )
         
-        return jsonify({'success': True, 'packages': package_list})
+        return jsonify({'success': True, 'packages': package_list, 'next_cursor': next_cursor})
         
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/volunteer/<volunteer_id>/stats', methods=['GET'])
 def get_volunteer_stats(volunteer_id):
-    """Get volunteer statistics including completed pickups, food saved, etc."""
+    """Get volunteer statistics including completed pickups, food saved, etc.
+    
+    The totals are one row read. The rank is a range count on the points
+    index, so it costs O(rank): cheap near the top of the leaderboard, a
+    scan of every volunteer ahead for those near the bottom.
+    """
     try:
-        conn = sqlite3.connect(DATABASE)
+        conn = get_db()
         cursor = conn.cursor()
         
-        # Get all packages for this volunteer
+        # Totals are kept up to date by triggers on packages (see migrations.py)
         cursor.execute('''
-            SELECT status, weight_lbs, pickup_completed_at
-            FROM packages 
+            SELECT completed_pickups, food_saved_lbs, points, co2_reduced_kg
+            FROM volunteer_stats
             WHERE volunteer_id = ?
         ''', (volunteer_id,))
         
-        packages = cursor.fetchall()
-        conn.close()
-        
-        # Calculate statistics
-        completed_pickups = len([p for p in packages if p[0] == 'completed'])
-        total_food_saved = sum(p[1] for p in packages if p[0] == 'completed')
-        
-        # Calculate CO2 reduced (rough estimate: 1 lb food waste = ~1.13 kg CO2)
-        co2_reduced = total_food_saved * 1.13
+        row = cursor.fetchone()
+        completed_pickups = row['completed_pickups'] if row else 0
+        total_food_saved = row['food_saved_lbs'] if row else 0
+        points = row['points'] if row else 0
+        co2_reduced = row['co2_reduced_kg'] if row else 0
         
         # Calculate meals provided (rough estimate: 1 lb food = ~2.3 meals)
         meals_provided = total_food_saved * 2.3
         
-        # Calculate points (rough estimate: 10 points per lb of food saved)
-        points = int(total_food_saved * 10)
+        # Rank = 1 + volunteers with strictly more points (ties share a rank).
+        # SQLite counts the index entries above `points` one by one: O(rank)
+        cursor.execute('SELECT COUNT(*) FROM volunteer_stats WHERE points > ?', (points,))
+        rank = cursor.fetchone()[0] + 1
         
         stats = {
             'completed_pickups': completed_pickups,
@@ -802,7 +1430,7 @@ def get_volunteer_stats(volunteer_id):
             'co2_reduced_kg': round(co2_reduced, 1),
             'meals_provided': round(meals_provided, 0),
             'points': points,
-            'rank': 1  # TODO: Implement ranking system
+            'rank': rank
         }
         
         return jsonify({'success': True, 'stats': stats})
@@ -810,29 +1438,95 @@ def get_volunteer_stats(volunteer_id):
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/volunteers/leaderboard', methods=['GET'])
+def get_volunteer_leaderboard():
+    """Top volunteers by points, read in order from the volunteer_stats points index"""
+    try:
+        limit = request.args.get('limit', 10, type=int)
+        if limit is None or not 0 < limit <= LEADERBOARD_MAX_LIMIT:
+            return jsonify({'success': False, 'error': f'limit must be between 1 and {LEADERBOARD_MAX_LIMIT}'}), 400
+        
+        conn = get_db()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT v.volunteer_id, v.completed_pickups, v.food_saved_lbs, v.points, v.co2_reduced_kg,
+                   p.profile_data
+            FROM volunteer_stats v
+            LEFT JOIN volunteer_profiles p ON p.firebase_uid = v.volunteer_id
+            WHERE v.points > 0
+            ORDER BY v.points DESC, v.volunteer_id
+            LIMIT ?
+        ''', (limit,))
+        
+        leaderboard = []
+        rank = 0
+        previous_points = None
+        for position, row in enumerate(cursor.fetchall(), start=1):
+            # Ties share a rank, same as /api/volunteer/<id>/stats
+            if row['points'] != previous_points:
+                rank = position
+                previous_points = row['points']
+            
+            profile = parse_profile_data(row['profile_data'])
+            name = f"{profile.get('firstName', '')} {profile.get('lastName', '')}".strip()
+            
+            leaderboard.append({
+                'rank': rank,
+                'volunteer_id': row['volunteer_id'],
+                'name': name or 'Volunteer',
+                'completed_pickups': row['completed_pickups'],
+                'food_saved_lbs': round(row['food_saved_lbs'], 1),
+                'co2_reduced_kg': round(row['co2_reduced_kg'], 1),
+                'points': row['points']
+            })
+        
+        return jsonify({'success': True, 'leaderboard': leaderboard})
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/foodbank/dashboard', methods=['GET'])
 def get_foodbank_dashboard():
-    """Get food bank dashboard data including recent deliveries and KPIs"""
+    """Get food bank dashboard data including recent deliveries and KPIs
+    
+    Totals come from daily_rollups, so they cover whole days in constant time;
+    ?days=N widens the impact KPIs from today (the default) to the last N days.
+    """
     try:
-        conn = sqlite3.connect(DATABASE)
+        days = request.args.get('days', 1, type=int)
+        if not days or days < 1 or days > ROLLUP_MAX_DAYS:
+            return jsonify({'success': False, 'error': f'days must be between 1 and {ROLLUP_MAX_DAYS}'}), 400
+        
+        conn = get_db()
         cursor = conn.cursor()
         
-        # Get today's deliveries (completed packages)
         today = datetime.now().strftime('%Y-%m-%d')
+        period_start = (datetime.now() - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+        
         cursor.execute('''
-            SELECT COUNT(*), COALESCE(SUM(weight_lbs), 0)
-            FROM packages 
-            WHERE status = 'completed' 
-            AND DATE(pickup_completed_at) = ?
+            SELECT COALESCE(SUM(deliveries), 0), COALESCE(SUM(weight_lbs), 0)
+            FROM daily_rollups
+            WHERE day = ?
         ''', (today,))
+        today_deliveries, today_weight = cursor.fetchone()
         
-        today_result = cursor.fetchone()
-        today_deliveries = today_result[0] if today_result else 0
-        today_weight = today_result[1] if today_result else 0
+        cursor.execute('''
+            SELECT COALESCE(SUM(deliveries), 0), COALESCE(SUM(weight_lbs), 0)
+            FROM daily_rollups
+            WHERE day >= ?
+        ''', (period_start,))
+        period_deliveries, period_weight = cursor.fetchone()
         
-        # Get total completed packages for recent deliveries
         cursor.execute('''
-            SELECT p.*, s.profile_data
+            SELECT COUNT(DISTINCT volunteer_id)
+            FROM daily_rollup_volunteers
+            WHERE day >= ?
+        ''', (period_start,))
+        active_volunteers = cursor.fetchone()[0]
+        
+        cursor.execute(f'''
+            SELECT p.*, {STORE_LOCATION_COLUMNS}
             FROM packages p
             LEFT JOIN store_profiles s ON p.store_email = s.email
             WHERE p.status = 'completed'
@@ -840,48 +1534,33 @@ def get_foodbank_dashboard():
             LIMIT 10
         ''')
         
-        recent_deliveries = cursor.fetchall()
-        
-        # Format recent deliveries
-        delivery_list = []
-        for delivery in recent_deliveries:
-            store_data = None
-            if delivery[14]:  # profile_data column (index 14, not 15)
-                try:
-                    store_data = json.loads(delivery[14])
-                except json.JSONDecodeError:
-                    store_data = None
-            
-            delivery_list.append({
-                'id': delivery[0],
-                'store_name': delivery[1],
-                'store_email': delivery[2],
-                'weight_lbs': delivery[3],
-                'food_type': delivery[4],
-                'volunteer_id': delivery[13],
-                'pickup_completed_at': delivery[14],
-                'store_address': store_data.get('address', 'Address not available') if store_data and isinstance(store_data, dict) else 'Address not available'
-            })
+        delivery_list = [
+            package_to_dict(delivery, RECENT_DELIVERY_FIELDS)
+            for delivery in cursor.fetchall()
+        ]
         
-        # Calculate KPIs
-        total_weight = sum(d['weight_lbs'] for d in delivery_list)
-        co2_prevented = total_weight * 1.13  # kg CO2 per lb of food
-        meals_provided = total_weight * 2.3
+        co2_prevented = period_weight * 1.13  # kg CO2 per lb of food
+        meals_provided = period_weight * 2.3
         
         kpi_data = {
             'todayDeliveries': today_deliveries,
             'foodReceived': f'{today_weight:.1f} lbs today',
-            'activeVolunteers': len(set(d['volunteer_id'] for d in delivery_list if d['volunteer_id'])),
+            'activeVolunteers': active_volunteers,
             'co2Prevented': f'{co2_prevented:.1f} lbs',
             'mealsProvided': f'{meals_provided:.0f} meals provided',
             'familiesHelped': f'{meals_provided/4:.0f} families helped',
         }
         
-        conn.close()
-        
         return jsonify({
             'success': True,
             'kpi': kpi_data,
+            'period': {
+                'days': days,
+                'start': period_start,
+                'deliveries': period_deliveries,
+                'weight_lbs': round(period_weight, 2),
+                'active_volunteers': active_volunteers,
+            },
             'recent_deliveries': delivery_list
         })
         
@@ -892,55 +1571,15 @@ def get_foodbank_dashboard():
 def get_pending_deliveries():
     """Get packages that are ready for food bank delivery confirmation (status = 'picked_up')"""
     try:
-        conn = sqlite3.connect(DATABASE)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT p.*, s.profile_data
-            FROM packages p
-            LEFT JOIN store_profiles s ON p.store_email = s.email
-            WHERE p.status = 'picked_up'
-            ORDER BY p.pickup_completed_at ASC
-        ''')
-        
-        packages = cursor.fetchall()
-        conn.close()
-        
-        # Convert to list of dictionaries with store location info
-        package_list = []
-        for package in packages:
-            # Parse store profile data if available
-            store_data = None
-            if len(package) > 15 and package[15]:  # profile_data column (index 15)
-                try:
-                    store_data = json.loads(package[15])
-                except json.JSONDecodeError:
-                    store_data = None
-            
-            package_dict = {
-                'id': package[0],
-                'store_name': package[1],
-                'store_email': package[2],
-                'weight_lbs': package[3],
-                'food_type': package[4],
-                'pickup_window_start': package[5],
-                'pickup_window_end': package[6],
-                'special_instructions': package[7],
-                'qr_code_data': package[8],
-                'qr_code_image_path': package[9],
-                'pickup_pin': package[10],
-                'status': package[11],
-                'created_at': package[12],
-                'volunteer_id': package[13],
-                'pickup_completed_at': package[14],
-                'store_address': package[15] if len(package) > 15 and package[15] else (store_data.get('address', 'Address not available') if store_data and isinstance(store_data, dict) else 'Address not available'),
-                'store_lat': float(store_data.get('latitude', 0)) if store_data and isinstance(store_data, dict) and store_data.get('latitude') else None,
-                'store_lng': float(store_data.get('longitude', 0)) if store_data and isinstance(store_data, dict) and store_data.get('longitude') else None
-            }
-            package_list.append(package_dict)
+        # Oldest pickup first, so cursors run on pickup_completed_at rather than created_at
+        package_list, next_cursor = list_packages(
+            "p.status = 'picked_up'", (), 'pickup_completed_at', descending=False
+        )
         
-        return jsonify({'success': True, 'packages': package_list})
+        return jsonify({'success': True, 'packages': package_list, 'next_cursor': next_cursor})
         
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -948,31 +1587,24 @@ def get_pending_deliveries():
 def delete_package(package_id):
     """Delete a package from the database"""
     try:
-        conn = sqlite3.connect(DATABASE)
+        conn = get_db()
         cursor = conn.cursor()
         
-        # Check if package exists
-        cursor.execute('SELECT id, status FROM packages WHERE id = ?', (package_id,))
-        package = cursor.fetchone()
-        
-        if not package:
-            conn.close()
-            return jsonify({'success': False, 'error': 'Package not found'}), 404
-        
-        # Don't allow deletion of packages that are assigned, picked up, or completed
-        if package[1] in ['assigned', 'picked_up', 'completed']:
-            conn.close()
-            return jsonify({'success': False, 'error': 'Cannot delete package that is assigned, picked up, or completed'}), 400
-        
-        # Delete the package
-        cursor.execute('DELETE FROM packages WHERE id = ?', (package_id,))
+        # Delete the package unless it is assigned, picked up, or completed,
+        # in one statement so a volunteer can't claim it mid-delete
+        cursor.execute('''
+            DELETE FROM packages
+            WHERE id = ? AND status NOT IN ('assigned', 'picked_up', 'completed')
+        ''', (package_id,))
         
         if cursor.rowcount == 0:
-            conn.close()
-            return jsonify({'success': False, 'error': 'Package not found or already deleted'}), 404
+            cursor.execute('SELECT id FROM packages WHERE id = ?', (package_id,))
+            if not cursor.fetchone():
+                return jsonify({'success': False, 'error': 'Package not found'}), 404
+            
+            return jsonify({'success': False, 'error': 'Cannot delete package that is assigned, picked up, or completed'}), 400
         
         conn.commit()
-        conn.close()
         
         return jsonify({
             'success': True,
@@ -994,41 +1626,29 @@ def confirm_pickup(package_id):
         if not entered_pin or not volunteer_id:
             return jsonify({'success': False, 'error': 'PIN and volunteer_id are required'}), 400
         
-        conn = sqlite3.connect(DATABASE)
+        conn = get_db()
         cursor = conn.cursor()
         
-        # Get package details and verify assignment
-        cursor.execute('SELECT id, pickup_pin, status, volunteer_id FROM packages WHERE id = ?', (package_id,))
-        package = cursor.fetchone()
-        
-        if not package:
-            conn.close()
-            return jsonify({'success': False, 'error': 'Package not found'}), 404
-        
-        # Verify package is assigned to this volunteer
-        if package[3] != volunteer_id:
-            conn.close()
-            return jsonify({'success': False, 'error': 'Package not assigned to this volunteer'}), 403
-        
-        # Verify package status
-        if package[2] != 'assigned':
-            conn.close()
-            return jsonify({'success': False, 'error': f'Package status is {package[2]}, expected assigned'}), 400
-        
-        # Verify PIN
-        if str(entered_pin) != str(package[1]):
-            conn.close()
+        # Move to picked_up only if assigned to this volunteer and the PIN matches
+        if not transition_package(cursor, package_id, 'assigned',
+                                  {'status': 'picked_up', 'pickup_completed_at': datetime.now().isoformat()},
+                                  pin=entered_pin, volunteer_id=volunteer_id):
+            cursor.execute('SELECT status, volunteer_id FROM packages WHERE id = ?', (package_id,))
+            package = cursor.fetchone()
+            
+            if not package:
+                return jsonify({'success': False, 'error': 'Package not found'}), 404
+            
+            if package['volunteer_id'] != volunteer_id:
+                return jsonify({'success': False, 'error': 'Package not assigned to this volunteer'}), 403
+            
+            if package['status'] != 'assigned':
+                return jsonify({'success': False, 'error': f"Package status is {package['status']}, expected assigned"}), 400
+            
             return jsonify({'success': False, 'error': 'Invalid PIN. Please check with the store.'}), 400
         
-        # Update status to picked_up
-        cursor.execute('''
-            UPDATE packages 
-            SET status = 'picked_up', pickup_completed_at = ?
-            WHERE id = ?
-        ''', (datetime.now().isoformat(), package_id))
-        
         conn.commit()
-        conn.close()
+        publish_package_event(conn, 'pickup', package_id)
         
         return jsonify({
             'success': True,
@@ -1051,36 +1671,24 @@ def confirm_delivery(package_id):
         if not entered_pin:
             return jsonify({'success': False, 'error': 'PIN is required'}), 400
         
-        conn = sqlite3.connect(DATABASE)
+        conn = get_db()
         cursor = conn.cursor()
         
-        # Get package details
-        cursor.execute('SELECT id, pickup_pin, status FROM packages WHERE id = ?', (package_id,))
-        package = cursor.fetchone()
-        
-        if not package:
-            conn.close()
-            return jsonify({'success': False, 'error': 'Package not found'}), 404
-        
-        # Verify package status
-        if package[2] != 'picked_up':
-            conn.close()
-            return jsonify({'success': False, 'error': f'Package status is {package[2]}, expected picked_up'}), 400
-        
-        # Verify PIN
-        if str(entered_pin) != str(package[1]):
-            conn.close()
+        # Complete only if picked up and the PIN matches
+        if not transition_package(cursor, package_id, 'picked_up', {'status': 'completed'}, pin=entered_pin):
+            cursor.execute('SELECT status FROM packages WHERE id = ?', (package_id,))
+            package = cursor.fetchone()
+            
+            if not package:
+                return jsonify({'success': False, 'error': 'Package not found'}), 404
+            
+            if package['status'] != 'picked_up':
+                return jsonify({'success': False, 'error': f"Package status is {package['status']}, expected picked_up"}), 400
+            
             return jsonify({'success': False, 'error': 'Invalid PIN. Please check with the volunteer.'}), 400
         
-        # Update status to completed
-        cursor.execute('''
-            UPDATE packages 
-            SET status = 'completed'
-            WHERE id = ?
-        ''', (package_id,))
-        
         conn.commit()
-        conn.close()
+        publish_package_event(conn, 'deliver', package_id)
         
         return jsonify({
             'success': True,
@@ -1094,12 +1702,68 @@ def confirm_delivery(package_id):
 
 @app.route('/uploads/<filename>')
 def serve_qr_code(filename):
-    """Serve QR code images"""
+    """Serve QR code images from memory, rendering any the worker hasn't written yet"""
     try:
-        return send_file(f'uploads/{filename}')
+        if filename.startswith('.'):
+            raise FileNotFoundError(filename)
+        
+        immutable = is_content_addressed(filename)
+        if immutable:
+            # The name is the content hash, so a revalidation needs no read at all
+            etag = filename[3:-4]
+            if request.if_none_match.contains(etag):
+                response = app.response_class(status=304)
+                response.set_etag(etag)
+                response.cache_control.public = True
+                response.cache_control.max_age = QR_IMMUTABLE_MAX_AGE
+                response.cache_control.immutable = True
+                return response
+        
+        def load_payload():
+            # Not queued in this process and not on disk: rebuild it from the
+            # package's stored QR payload
+            cursor = get_db().cursor()
+            cursor.execute('SELECT qr_code_data FROM packages WHERE qr_code_image_path = ?',
+                           (f'uploads/{filename}',))
+            package = cursor.fetchone()
+            if package and package['qr_code_data']:
+                return qr_payload(package['qr_code_data'])
+            return None
+        
+        data = qr_worker.read(filename, load_payload)
+        response = Response(data, mimetype='image/png')
+        response.cache_control.public = True
+        if immutable:
+            response.set_etag(etag)
+            response.cache_control.max_age = QR_IMMUTABLE_MAX_AGE
+            response.cache_control.immutable = True
+        else:
+            response.set_etag(hashlib.sha256(data).hexdigest()[:24])
+            response.cache_control.max_age = QR_LEGACY_MAX_AGE
+        return response.make_conditional(request)
     except FileNotFoundError:
         return jsonify({'error': 'QR code not found'}), 404
 
+@app.route('/api/qr/cache-stats', methods=['GET'])
+def get_qr_cache_stats():
+    """Hit rate and size of the in-memory QR image cache"""
+    stats = qr_worker.cache.stats()
+    stats['pending_renders'] = qr_worker.pending()
+    return jsonify({'success': True, 'stats': stats})
+
+@app.route('/api/llm/stats', methods=['GET'])
+def get_llm_gateway_stats():
+    """Call counts, retries and circuit breaker state per LLM provider"""
+    return jsonify({'success': True, 'stats': get_gateway().stats()})
+
+@app.route('/api/analyze-food-image/cache-stats', methods=['GET'])
+def get_analysis_cache_stats():
+    """Hit rate and size of the perceptual-hash analysis cache"""
+    try:
+        return jsonify({'success': True, 'stats': analysis_cache.stats(get_db())})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/packages/<int:package_id>/complete', methods=['POST'])
 def complete_package(package_id):
     """Mark a package as completed after QR code verification"""
@@ -1110,34 +1774,27 @@ def complete_package(package_id):
         if not volunteer_id:
             return jsonify({'success': False, 'error': 'Volunteer ID is required'}), 400
         
-        conn = sqlite3.connect(DATABASE)
+        conn = get_db()
         cursor = conn.cursor()
         
-        # Check if package exists and is assigned to this volunteer
-        cursor.execute('SELECT id, status, volunteer_id FROM packages WHERE id = ?', (package_id,))
-        package = cursor.fetchone()
-        
-        if not package:
-            conn.close()
-            return jsonify({'success': False, 'error': 'Package not found'}), 404
-        
-        if package[1] != 'assigned':
-            conn.close()
-            return jsonify({'success': False, 'error': 'Package is not assigned'}), 400
-        
-        if package[2] != volunteer_id:
-            conn.close()
+        # Complete only if assigned to this volunteer (timestamp in SQLite's datetime('now') format)
+        completed_at = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        if not transition_package(cursor, package_id, 'assigned',
+                                  {'status': 'completed', 'pickup_completed_at': completed_at},
+                                  volunteer_id=volunteer_id):
+            cursor.execute('SELECT status FROM packages WHERE id = ?', (package_id,))
+            package = cursor.fetchone()
+            
+            if not package:
+                return jsonify({'success': False, 'error': 'Package not found'}), 404
+            
+            if package['status'] != 'assigned':
+                return jsonify({'success': False, 'error': 'Package is not assigned'}), 400
+            
             return jsonify({'success': False, 'error': 'Package is not assigned to this volunteer'}), 403
         
-        # Update package status to completed
-        cursor.execute('''
-            UPDATE packages 
-            SET status = 'completed', pickup_completed_at = datetime('now')
-            WHERE id = ?
-        ''', (package_id,))
-        
         conn.commit()
-        conn.close()
+        publish_package_event(conn, 'complete', package_id)
         
         return jsonify({
             'success': True, 
@@ -1153,10 +1810,9 @@ def health_check():
     """Health check endpoint for AWS deployment"""
     try:
         # Test database connection
-        conn = sqlite3.connect(DATABASE)
+        conn = get_db()
         cursor = conn.cursor()
         cursor.execute('SELECT 1')
-        conn.close()
         
         return jsonify({
             'status': 'healthy',
@@ -1170,54 +1826,80 @@ def health_check():
             'error': str(e)
         }), 500
 
-@app.route('/api/analyze-food-image', methods=['POST'])
-def analyze_food_image():
-    """Analyze food image using Anthropic Claude to determine food type and estimate weight"""
+def extract_response_json(claude_response):
+    """The JSON object in a model response, ignoring any text around it"""
+    # Find JSON in the response (in case Claude adds extra text)
+    start_idx = claude_response.find('{')
+    end_idx = claude_response.rfind('}') + 1
+    
+    if start_idx >= 0 and end_idx > start_idx:
+        return json.loads(claude_response[start_idx:end_idx])
+    raise ValueError("No valid JSON found in response")
+
+def normalize_food_analysis(analysis_result):
+    """Check a food_type/weight estimate has every field and a sane weight"""
+    # Validate the response structure
+    required_keys = ['food_type', 'estimated_weight_lbs', 'confidence', 'description']
+    if not isinstance(analysis_result, dict) or not all(key in analysis_result for key in required_keys):
+        raise ValueError("Missing required keys in response")
+    
+    # Reasoning is optional but helpful
+    if 'reasoning' not in analysis_result:
+        analysis_result['reasoning'] = "Weight estimated based on visual analysis"
+    
+    # Ensure weight is a number and reasonable
+    weight = float(analysis_result['estimated_weight_lbs'])
+    if weight < 0.1 or weight > 100:  # Reasonable bounds
+        weight = max(0.5, min(weight, 50))  # Clamp to reasonable range
+    analysis_result['estimated_weight_lbs'] = round(weight, 1)
+    return analysis_result
+
+def analyze_food_photo(photo, deadline):
+    """Food type and weight estimate for a SpooledPhoto, as (response body, HTTP status)
+    
+    Runs on the analysis job pool; `deadline` is the time.monotonic() by
+    which the job must finish.
+    """
     try:
-        data = request.get_json()
-        
-        if 'image' not in data:
-            return jsonify({'success': False, 'error': 'No image data provided'}), 400
-        
-        # Extract base64 image data (remove data:image/jpeg;base64, prefix if present)
-        image_data = data['image']
-        if image_data.startswith('data:image'):
-            image_data = image_data.split(',')[1]
-        
-        # Validate the image
+        # Validate the image, downscaled and re-encoded in a worker process
+        # that reads it straight from the spooled upload
         try:
-            image_bytes = base64.b64decode(image_data)
-            image = Image.open(io.BytesIO(image_bytes))
-            
-            # Convert to RGB if necessary and resize if too large
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            
-            # Resize if image is too large (max 1024x1024)
-            if image.width > 1024 or image.height > 1024:
-                image.thumbnail((1024, 1024), Image.Resampling.LANCZOS)
-            
-            # Convert back to base64
-            output_buffer = io.BytesIO()
-            image.save(output_buffer, format='JPEG', quality=85)
-            processed_image_data = base64.b64encode(output_buffer.getvalue()).decode()
+            prepared = image_preprocessor.process(photo.source)
+            processed_image_data = base64.b64encode(prepared.data).decode()
             
+        except PreprocessorBusy as e:
+            return {'success': False, 'error': str(e)}, 503
         except Exception as e:
-            return jsonify({'success': False, 'error': f'Invalid image data: {str(e)}'}), 400
+            return {'success': False, 'error': f'Invalid image data: {str(e)}'}, 400
+        
+        # A near-duplicate of a recently analyzed photo reuses that analysis
+        with db.pooled_connection() as conn:
+            cached = analysis_cache.get(conn, prepared.dhash, FOOD_ANALYSIS_MODEL)
+        if cached is not None:
+            analysis_result, distance = cached
+            return {
+                'success': True,
+                'analysis': analysis_result,
+                'cached': True,
+                'hash_distance': distance
+            }, 200
         
         # Check if Anthropic API key is configured
         if not os.getenv('ANTHROPIC_API_KEY'):
-            return jsonify({
+            return {
                 'success': False, 
                 'error': 'Anthropic API key not configured on server'
-            }), 500
+            }, 500
         
-        # Analyze image with Claude
+        # Analyze image with Claude, giving up when the job's deadline passes
         try:
-            message = anthropic_client.messages.create(
-                model="claude-3-5-sonnet-20241022",
-                max_tokens=500,
-                messages=[{
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return {'success': False, 'error': 'Image analysis timed out'}, 504
+            message = get_gateway().anthropic_messages(os.getenv('ANTHROPIC_API_KEY'), {
+                "model": FOOD_ANALYSIS_MODEL,
+                "max_tokens": 500,
+                "messages": [{
                     "role": "user",
                     "content": [
                         {
@@ -1230,91 +1912,300 @@ def analyze_food_image():
                         },
                         {
                             "type": "text",
-                            "text": """You are an expert food analyst helping stores estimate food waste for donation. Analyze this food image and provide accurate weight estimates.
-
-WEIGHT ESTIMATION GUIDELINES:
-- Use common food references: 1 slice bread = ~1oz, 1 apple = ~6oz, 1 sandwich = ~8oz
-- Consider container weight: plastic containers +0.1-0.3 lbs, paper bags +0.05-0.1 lbs
-- Look for size references: hands, utensils, plates, or packaging for scale
-- Account for food density: bread is light, soup/sauces are heavy, fresh produce varies
-- Be conservative but realistic: round to nearest 0.1 lbs
-
-COMMON ESTIMATES:
-- Single bagel/donut: 0.2-0.4 lbs
-- Loaf of bread: 1.5-2.5 lbs  
-- Large pizza: 2-4 lbs
-- Prepared sandwich: 0.4-0.8 lbs
-- Bunch of bananas (5-6): 2-3 lbs
-- Large prepared meal: 1-2 lbs
-
-Provide a JSON response with:
-1. food_type: Specific, descriptive name (e.g., "Fresh Baked Bread Loaves", "Prepared Deli Sandwiches", "Mixed Produce - Apples & Bananas")
-2. estimated_weight_lbs: Your best weight estimate in pounds (be realistic, consider all visible items + containers)
-3. confidence: Your confidence level (high/medium/low)
-4. description: Brief description including what you see and why you estimated this weight
-5. reasoning: Explain your weight calculation approach
-
-Respond ONLY with valid JSON in this exact format:
-{
-  "food_type": "string",
-  "estimated_weight_lbs": number,
-  "confidence": "high|medium|low", 
-  "description": "string",
-  "reasoning": "string"
-}"""
+                            "text": FOOD_ANALYSIS_PROMPT
                         }
                     ]
                 }]
-            )
+            }, timeout=remaining)
             
             # Parse Claude's response
-            claude_response = message.content[0].text.strip()
+            claude_response = message_text(message).strip()
             
             # Try to extract JSON from the response
             try:
-                # Find JSON in the response (in case Claude adds extra text)
-                start_idx = claude_response.find('{')
-                end_idx = claude_response.rfind('}') + 1
+                analysis_result = normalize_food_analysis(extract_response_json(claude_response))
                 
-                if start_idx >= 0 and end_idx > start_idx:
-                    json_str = claude_response[start_idx:end_idx]
-                    analysis_result = json.loads(json_str)
-                else:
-                    raise ValueError("No valid JSON found in response")
+                with db.pooled_connection() as conn:
+                    analysis_cache.put(conn, prepared.dhash, FOOD_ANALYSIS_MODEL, analysis_result)
                 
-                # Validate the response structure
-                required_keys = ['food_type', 'estimated_weight_lbs', 'confidence', 'description']
-                if not all(key in analysis_result for key in required_keys):
-                    raise ValueError("Missing required keys in response")
+                return {
+                    'success': True,
+                    'analysis': analysis_result,
+                    'cached': False
+                }, 200
                 
-                # Reasoning is optional but helpful
-                if 'reasoning' not in analysis_result:
-                    analysis_result['reasoning'] = "Weight estimated based on visual analysis"
+            except (json.JSONDecodeError, ValueError) as e:
+                return {
+                    'success': False,
+                    'error': f'Failed to parse AI response: {str(e)}',
+                    'raw_response': claude_response
+                }, 500
                 
-                # Ensure weight is a number and reasonable
-                weight = float(analysis_result['estimated_weight_lbs'])
-                if weight < 0.1 or weight > 100:  # Reasonable bounds
-                    weight = max(0.5, min(weight, 50))  # Clamp to reasonable range
-                analysis_result['estimated_weight_lbs'] = round(weight, 1)
+        except CircuitOpen as e:
+            return {'success': False, 'error': f'AI analysis temporarily unavailable: {str(e)}'}, 503
+        except DeadlineExceeded:
+            return {'success': False, 'error': 'Image analysis timed out'}, 504
+        except Exception as e:
+            return {
+                'success': False,
+                'error': f'AI analysis failed: {str(e)}'
+            }, 500
+            
+    except Exception as e:
+        return {'success': False, 'error': str(e)}, 500
+
+def analyze_food_photo_batch(photos, deadline):
+    """Per-photo and combined estimates for several photos of one donation,
+    from a single model call, as (response body, HTTP status)"""
+    try:
+        # All photos are preprocessed in parallel worker processes
+        try:
+            prepared = image_preprocessor.process_many([photo.source for photo in photos])
+        except PreprocessorBusy as e:
+            return {'success': False, 'error': str(e)}, 503
+        except Exception as e:
+            return {'success': False, 'error': f'Invalid image data: {str(e)}'}, 400
+        
+        if not os.getenv('ANTHROPIC_API_KEY'):
+            return {
+                'success': False,
+                'error': 'Anthropic API key not configured on server'
+            }, 500
+        
+        # Each image block is labelled so the model can refer to it by number
+        content = []
+        for number, image in enumerate(prepared, start=1):
+            content.append({"type": "text", "text": f"Photo {number}:"})
+            content.append({
+                "type": "image",
+                "source": {
+                    "type": "base64",
+                    "media_type": "image/jpeg",
+                    "data": base64.b64encode(image.data).decode()
+                }
+            })
+        content.append({"type": "text", "text": FOOD_BATCH_ANALYSIS_PROMPT.format(count=len(prepared))})
+        
+        try:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return {'success': False, 'error': 'Image analysis timed out'}, 504
+            message = get_gateway().anthropic_messages(os.getenv('ANTHROPIC_API_KEY'), {
+                "model": FOOD_ANALYSIS_MODEL,
+                "max_tokens": 500 + 250 * len(prepared),
+                "messages": [{"role": "user", "content": content}]
+            }, timeout=remaining)
+            claude_response = message_text(message).strip()
+            
+            try:
+                batch_result = extract_response_json(claude_response)
+                images = batch_result.get('images') if isinstance(batch_result, dict) else None
+                if not isinstance(images, list) or len(images) != len(prepared):
+                    raise ValueError(f"Expected estimates for {len(prepared)} photos")
+                images = [normalize_food_analysis(image) for image in images]
+                for number, image in enumerate(images, start=1):
+                    image['photo'] = number
+                combined = normalize_food_analysis(batch_result.get('combined'))
                 
-                return jsonify({
+                return {
                     'success': True,
-                    'analysis': analysis_result
-                })
+                    'photo_count': len(images),
+                    'images': images,
+                    'combined': combined
+                }, 200
                 
-            except (json.JSONDecodeError, ValueError) as e:
-                return jsonify({
+            except (json.JSONDecodeError, ValueError, TypeError) as e:
+                return {
                     'success': False,
                     'error': f'Failed to parse AI response: {str(e)}',
                     'raw_response': claude_response
-                }), 500
+                }, 500
                 
+        except CircuitOpen as e:
+            return {'success': False, 'error': f'AI analysis temporarily unavailable: {str(e)}'}, 503
+        except DeadlineExceeded:
+            return {'success': False, 'error': 'Image analysis timed out'}, 504
         except Exception as e:
-            return jsonify({
+            return {
                 'success': False,
                 'error': f'AI analysis failed: {str(e)}'
-            }), 500
+            }, 500
             
+    except Exception as e:
+        return {'success': False, 'error': str(e)}, 500
+
+def read_food_photo():
+    """SpooledPhoto of the photo in this request
+    
+    Accepts a multipart/form-data file (field 'image'), a raw image/* body,
+    or JSON {"image": "<base64 or data: URL>"}. Raises ValueError when there
+    is no usable photo, PhotoTooLarge past PHOTO_MAX_BYTES and
+    RequestEntityTooLarge past the request size limit.
+    """
+    if request.mimetype == 'multipart/form-data':
+        upload = request.files.get('image') or next(iter(request.files.values()), None)
+        if upload is None:
+            raise ValueError('No image file provided')
+        return take_upload(upload)
+    
+    if request.mimetype.startswith('image/'):
+        return spool_stream(request.stream, PHOTO_MAX_BYTES, PHOTO_MEMORY_BYTES)
+    
+    data = request.get_json(silent=True)
+    if not data or 'image' not in data:
+        raise ValueError('No image data provided')
+    return spool_base64_photo(data['image'])
+
+def spool_base64_photo(image_data):
+    """SpooledPhoto of a base64 string or data: URL"""
+    # Extract base64 image data (remove data:image/jpeg;base64, prefix if present)
+    if not isinstance(image_data, str):
+        raise ValueError('Invalid image data: expected a base64 string')
+    if image_data.startswith('data:image'):
+        image_data = image_data.split(',')[1]
+    try:
+        image_bytes = base64.b64decode(image_data)
+    except Exception as e:
+        raise ValueError(f'Invalid image data: {str(e)}')
+    return spool_bytes(image_bytes, PHOTO_MAX_BYTES, PHOTO_MEMORY_BYTES)
+
+def read_food_photos():
+    """SpooledPhotos of every photo in a batch request
+    
+    Accepts multipart/form-data files (field 'images', or any file fields)
+    or JSON {"images": ["<base64 or data: URL>", ...]}.
+    """
+    if request.mimetype == 'multipart/form-data':
+        sources = request.files.getlist('images') or list(request.files.values())
+        spool = take_upload
+    else:
+        data = request.get_json(silent=True)
+        sources = data.get('images') if isinstance(data, dict) else None
+        if not isinstance(sources, list):
+            raise ValueError('images must be a list of base64 images')
+        spool = spool_base64_photo
+    
+    if not sources:
+        raise ValueError('No image data provided')
+    if len(sources) > ANALYSIS_BATCH_MAX_PHOTOS:
+        raise ValueError(f'At most {ANALYSIS_BATCH_MAX_PHOTOS} photos per batch')
+    
+    photos = []
+    try:
+        for source in sources:
+            photos.append(spool(source))
+    except BaseException:
+        for photo in photos:
+            photo.close()
+        raise
+    return photos
+
+def submit_food_photo_job(photo):
+    """Queue analyze_food_photo(); the spooled photo is removed when the job ends"""
+    try:
+        return analysis_jobs.submit(
+            lambda deadline: analyze_food_photo(photo, deadline),
+            cleanup=photo.close
+        )
+    except JobQueueFull:
+        photo.close()
+        raise
+
+def submit_food_photo_batch_job(photos):
+    """Queue analyze_food_photo_batch(); the spooled photos are removed when the job ends"""
+    def cleanup():
+        for photo in photos:
+            photo.close()
+    
+    try:
+        return analysis_jobs.submit(
+            lambda deadline: analyze_food_photo_batch(photos, deadline),
+            cleanup=cleanup
+        )
+    except JobQueueFull:
+        cleanup()
+        raise
+
+@app.route('/api/analyze-food-image/jobs', methods=['POST'])
+def create_food_image_job():
+    """Queue a food photo analysis and return its job ID straight away
+    
+    Takes the photo the same ways as /api/analyze-food-image. Poll
+    GET /api/analyze-food-image/jobs/<job_id> for the result.
+    """
+    try:
+        job = submit_food_photo_job(read_food_photo())
+        return jsonify({
+            'success': True,
+            'job_id': job.id,
+            'status': job.status,
+            'poll_url': f'/api/analyze-food-image/jobs/{job.id}'
+        }), 202
+        
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except (PhotoTooLarge, RequestEntityTooLarge) as e:
+        return jsonify({'success': False, 'error': str(e)}), 413
+    except JobQueueFull as e:
+        return jsonify({'success': False, 'error': str(e)}), 503
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/analyze-food-image/jobs/<job_id>', methods=['GET'])
+def get_food_image_job(job_id):
+    """Status of an analysis job, with the analysis once it has finished"""
+    job = analysis_jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found or expired'}), 404
+    return jsonify({'success': True, 'job': job.to_dict()})
+
+@app.route('/api/analyze-food-image/jobs/stats', methods=['GET'])
+def get_food_image_job_stats():
+    """Queue depth and outcome counts for analysis jobs"""
+    return jsonify({'success': True, 'stats': analysis_jobs.stats()})
+
+@app.route('/api/analyze-food-image', methods=['POST'])
+def analyze_food_image():
+    """Analyze food image using Anthropic Claude to determine food type and estimate weight
+    
+    The photo can be sent as multipart/form-data (field 'image'), as a raw
+    image/jpeg body, or base64-encoded in JSON {"image": ...}. Runs as an
+    analysis job and waits for it, so it shares the job pool's concurrency
+    limit and deadline.
+    """
+    try:
+        job = submit_food_photo_job(read_food_photo())
+        body, status_code = analysis_jobs.wait(job)
+        return jsonify(body), status_code
+        
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except (PhotoTooLarge, RequestEntityTooLarge) as e:
+        return jsonify({'success': False, 'error': str(e)}), 413
+    except JobQueueFull as e:
+        return jsonify({'success': False, 'error': str(e)}), 503
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/analyze-food-image/batch', methods=['POST'])
+def analyze_food_image_batch():
+    """Analyze several photos of one donation in a single model call
+    
+    Returns an estimate per photo and a combined food_type/weight for the
+    whole donation. Photos come as multipart/form-data files (field
+    'images') or JSON {"images": [...]} of base64 strings.
+    """
+    try:
+        job = submit_food_photo_batch_job(read_food_photos())
+        body, status_code = analysis_jobs.wait(job)
+        return jsonify(body), status_code
+        
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except (PhotoTooLarge, RequestEntityTooLarge) as e:
+        return jsonify({'success': False, 'error': str(e)}), 413
+    except JobQueueFull as e:
+        return jsonify({'success': False, 'error': str(e)}), 503
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -1780,6 +2671,10 @@ if __name__ == '__main__':
     init_db()
     print("Database initialized successfully")
     
+    start_qr_garbage_collector()
+    # Warns now, rather than at the first scan, if no private signing key is set
+    get_qr_token_secret()
+    
     # Get port from environment variable (Railway/Vercel requirement)
     port = int(os.environ.get('PORT', 5001))
     
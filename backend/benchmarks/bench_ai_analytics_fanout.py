@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+AIAnalytics full analysis: sequential provider calls vs. concurrent fan-out
+
+Points the LLM gateway at a local fake provider with a fixed latency per API
+(OpenAI for the executive summary and predictions, Anthropic for the detailed
+report) and compares calling the three generators one after another with
+AIAnalytics.generate_full_analysis(). Scenarios:
+
+- healthy: fan-out should take about as long as the slowest call, not the sum.
+- slow report: the Anthropic call outlasts the deadline. The analysis must
+  return at the deadline with the fallback report and the other two parts
+  from the provider.
+
+Usage: python benchmarks/bench_ai_analytics_fanout.py [--runs 5] [--openai-ms 300] [--anthropic-ms 600]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ['DATABASE_URL'] = os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['QR_IMAGE_DIR'] = tempfile.mkdtemp()
+
+PREDICTIONS = {'next_week_volume': 'Fake provider forecast', 'peak_days': [], 'recommendations': []}
+
+
+class FakeProvider(BaseHTTPRequestHandler):
+    """Anthropic/OpenAI lookalike with a per-path latency from `server.latency`"""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(self.server.latency[self.path])
+        if self.path == '/v1/messages':
+            body = {'content': [{'type': 'text', 'text': 'Report from the fake provider'}]}
+        else:
+            body = {'choices': [{'message': {'content': json.dumps(PREDICTIONS)}}]}
+        data = json.dumps(body).encode()
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up at its deadline
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+def start_fake_provider(openai_seconds, anthropic_seconds):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeProvider)
+    server.daemon_threads = True
+    server.latency = {'/v1/chat/completions': openai_seconds, '/v1/messages': anthropic_seconds}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def sequential_analysis(analytics, metrics, packages):
+    return {
+        'executive_summary': analytics.generate_executive_summary_openai(metrics, 'Bench Store'),
+        'detailed_report': analytics.generate_detailed_report_claude(metrics, packages, 'Bench Store'),
+        'predictions': analytics.generate_ai_predictions(metrics, packages),
+    }
+
+
+def median_seconds(fn, runs):
+    seconds = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = fn()
+        seconds.append(time.perf_counter() - start)
+    return statistics.median(seconds), result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--openai-ms', type=int, default=300)
+    parser.add_argument('--anthropic-ms', type=int, default=600)
+    args = parser.parse_args()
+
+    logging.getLogger('llm_gateway').setLevel(logging.ERROR)
+    openai_seconds, anthropic_seconds = args.openai_ms / 1000, args.anthropic_ms / 1000
+    server, base_url = start_fake_provider(openai_seconds, anthropic_seconds)
+    os.environ.update({'ANTHROPIC_BASE_URL': base_url, 'OPENAI_BASE_URL': base_url, 'LLM_MAX_RETRIES': '0'})
+
+    import app as backend
+    from ai_analytics import AIAnalytics
+
+    backend.init_db()
+    analytics = AIAnalytics(os.environ['DATABASE_URL'])
+    analytics.openai_key = analytics.anthropic_key = 'fake-key'
+    packages = []
+    metrics = analytics.calculate_core_metrics(packages)
+    failures = []
+
+    def check(condition, message):
+        print(f"   {'✅' if condition else '❌'} {message}")
+        if not condition:
+            failures.append(message)
+
+    print(f"🚀 Fake provider at {base_url}: OpenAI {args.openai_ms} ms, Anthropic {args.anthropic_ms} ms, "
+          f"{args.runs} runs each")
+
+    print("healthy: every call answers")
+    slowest = max(openai_seconds, anthropic_seconds)
+    sequential, _ = median_seconds(lambda: sequential_analysis(analytics, metrics, packages), args.runs)
+    fanout, analysis = median_seconds(
+        lambda: analytics.generate_full_analysis(metrics, packages, 'Bench Store'), args.runs)
+    print(f"   sequential {sequential * 1000:.0f} ms, fan-out {fanout * 1000:.0f} ms "
+          f"({sequential / fanout:.1f}x)")
+    check(fanout < slowest * 1.5, f"fan-out took about the slowest call ({slowest * 1000:.0f} ms)")
+    check(analysis['detailed_report'] == 'Report from the fake provider' and analysis['predictions'] == PREDICTIONS
+          and not analysis['timed_out'], "all three parts came from the provider")
+
+    print("slow report: Anthropic takes 3 s, analysis deadline 1 s")
+    server.latency['/v1/messages'] = 3.0
+    elapsed, analysis = median_seconds(
+        lambda: analytics.generate_full_analysis(metrics, packages, 'Bench Store', deadline_seconds=1.0), 1)
+    print(f"   returned after {elapsed * 1000:.0f} ms, timed out: {analysis['timed_out']}")
+    check(elapsed < 1.3, "analysis returned at its deadline")
+    check(analysis['detailed_report'] == analytics._fallback_detailed_report(metrics, 'Bench Store'),
+          "detailed report fell back")
+    check(analysis['predictions'] == PREDICTIONS, "predictions from the provider were kept")
+    # The abandoned report call gives up at the same deadline; let it print its error quietly
+    with contextlib.redirect_stdout(io.StringIO()):
+        time.sleep(0.2)
+
+    backend.image_preprocessor.shutdown()
+    server.shutdown()
+
+    if failures:
+        print(f"❌ {len(failures)} check(s) failed")
+        sys.exit(1)
+    print("✅ Full analysis waits for the slowest call and falls back per part at the deadline")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Benchmark: N single package creates vs. one bulk create
+
+Starts the Flask app on a local port and creates the same N packages twice:
+once as N calls to POST /api/packages/create, once as a single call to
+POST /api/packages/bulk. Reports wall time and per-package cost of each, and
+checks that both runs produced N packages with distinct QR tokens.
+
+Usage: python benchmarks/bench_bulk_create.py [--packages 200]
+"""
+
+import argparse
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ['DATABASE_URL'] = os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['QR_IMAGE_DIR'] = tempfile.mkdtemp()
+
+import db  # noqa: E402
+import app as backend  # noqa: E402
+from werkzeug.serving import make_server  # noqa: E402
+
+STORE = {'store_name': 'Bench Store', 'store_email': 'bench@store.com'}
+
+
+def package(number):
+    return {
+        'weight_lbs': 1 + number % 20,
+        'food_type': ('Produce', 'Bakery', 'Dairy', 'Prepared Foods')[number % 4],
+        'pickup_window_start': '8:00 PM',
+        'pickup_window_end': '9:30 PM',
+        'special_instructions': f'Bin {number}',
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--packages', type=int, default=200)
+    args = parser.parse_args()
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    backend.init_db()
+    server = make_server('127.0.0.1', 0, backend.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{server.server_port}'
+    session = requests.Session()
+    items = [package(number) for number in range(args.packages)]
+
+    print(f"🚀 Creating {args.packages} packages one by one, then in one bulk request")
+    start = time.perf_counter()
+    single_tokens = []
+    for item in items:
+        response = session.post(f'{base}/api/packages/create', json={**STORE, **item})
+        single_tokens.append(response.json()['qr_token'])
+    single = time.perf_counter() - start
+
+    start = time.perf_counter()
+    response = session.post(f'{base}/api/packages/bulk', json={**STORE, 'packages': items})
+    bulk = time.perf_counter() - start
+    server.shutdown()
+
+    body = response.json()
+    bulk_tokens = [result['qr_token'] for result in body['results'] if result['success']]
+
+    conn = sqlite3.connect(db.DATABASE)
+    stored = conn.execute('SELECT COUNT(*) FROM packages').fetchone()[0]
+    conn.close()
+
+    print(f"{'mode':<8} {'total ms':>10} {'ms/package':>11}")
+    print(f"{'single':<8} {single * 1000:>10.1f} {single * 1000 / args.packages:>11.2f}")
+    print(f"{'bulk':<8} {bulk * 1000:>10.1f} {bulk * 1000 / args.packages:>11.2f}")
+    print(f"Speedup: {single / bulk:.1f}x")
+
+    expected = 2 * args.packages
+    if body.get('created') != args.packages or stored != expected or len(set(single_tokens + bulk_tokens)) != expected:
+        print(f"❌ Expected {expected} packages with distinct tokens, found {stored} "
+              f"(bulk created {body.get('created')})")
+        sys.exit(1)
+    print("✅ Both runs created every package")
+
+
+if __name__ == '__main__':
+    main()
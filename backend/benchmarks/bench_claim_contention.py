@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Contention benchmark for package claiming
+
+Starts the Flask app on a local port and lets many volunteer threads race to
+claim the same packages through POST /api/packages/<id>/assign. Every package
+must end up with exactly one winning volunteer, and that volunteer must be the
+one recorded in the database. Reports claim attempts/sec and claims/sec.
+
+Usage: python benchmarks/bench_claim_contention.py [--packages 300] [--volunteers 16]
+"""
+
+import argparse
+import logging
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ['DATABASE_URL'] = os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['QR_IMAGE_DIR'] = tempfile.mkdtemp()
+
+import db  # noqa: E402
+import app as backend  # noqa: E402
+from werkzeug.serving import make_server  # noqa: E402
+
+
+def seed(count):
+    conn = sqlite3.connect(db.DATABASE)
+    conn.executemany('''
+        INSERT INTO packages (
+            store_name, store_email, weight_lbs, food_type,
+            pickup_window_start, pickup_window_end, special_instructions,
+            qr_code_data, qr_code_image_path, pickup_pin, status
+        ) VALUES ('Bench Store', 'bench@store.com', 5.0, 'Produce', '2:00 PM', '6:00 PM', '',
+                  '{}', '', '1234', 'pending')
+    ''', [()] * count)
+    conn.commit()
+    ids = [row[0] for row in conn.execute('SELECT id FROM packages ORDER BY id')]
+    conn.close()
+    return ids
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--packages', type=int, default=300)
+    parser.add_argument('--volunteers', type=int, default=16)
+    args = parser.parse_args()
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    backend.init_db()
+    package_ids = seed(args.packages)
+    server = make_server('127.0.0.1', 0, backend.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{server.server_port}'
+
+    winners = defaultdict(list)
+    statuses = Counter()
+    lock = threading.Lock()
+    start_gate = threading.Barrier(args.volunteers)
+
+    def volunteer(number):
+        volunteer_id = f'volunteer-{number}'
+        session = requests.Session()
+        order = package_ids[:]
+        random.shuffle(order)
+        start_gate.wait()
+        for package_id in order:
+            response = session.post(f'{base}/api/packages/{package_id}/assign',
+                                    json={'volunteer_id': volunteer_id})
+            with lock:
+                statuses[response.status_code] += 1
+                if response.status_code == 200:
+                    winners[package_id].append(volunteer_id)
+
+    print(f"🚀 {args.volunteers} volunteers racing for {args.packages} packages")
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.volunteers) as pool:
+        list(pool.map(volunteer, range(args.volunteers)))
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+
+    conn = sqlite3.connect(db.DATABASE)
+    recorded = dict(conn.execute('SELECT id, volunteer_id FROM packages'))
+    conn.close()
+
+    double_claims = {pid: names for pid, names in winners.items() if len(names) > 1}
+    unclaimed = [pid for pid in package_ids if pid not in winners]
+    mismatched = [pid for pid, names in winners.items() if len(names) == 1 and recorded[pid] != names[0]]
+
+    attempts = sum(statuses.values())
+    print(f"Attempts: {attempts} in {elapsed:.2f}s ({attempts / elapsed:.0f} attempts/sec)")
+    print(f"Claims:   {len(winners)} ({len(winners) / elapsed:.0f} claims/sec)")
+    print(f"Status codes: {dict(statuses)}")
+
+    if double_claims or unclaimed or mismatched:
+        print(f"❌ double claims: {len(double_claims)}, unclaimed: {len(unclaimed)}, "
+              f"winner not recorded: {len(mismatched)}")
+        sys.exit(1)
+    print("✅ Exactly one winner per package")
+
+
+if __name__ == '__main__':
+    main()
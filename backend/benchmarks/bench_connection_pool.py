@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Before/after benchmark for the pooled SQLite connection layer
+
+Runs the real Flask app on a local port against a throwaway database and
+hits /api/packages/available and /api/packages/<id>/pickup at several
+concurrency levels, once with the legacy connect-per-request behaviour and
+once with the pool from db.py.
+
+Usage: python benchmarks/bench_connection_pool.py [--packages 2000] [--requests 400]
+"""
+
+import argparse
+import logging
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ['DATABASE_URL'] = os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['QR_IMAGE_DIR'] = tempfile.mkdtemp()
+
+import db  # noqa: E402
+import app as backend  # noqa: E402
+from werkzeug.serving import make_server  # noqa: E402
+
+CONCURRENCY_LEVELS = (1, 4, 16, 32)
+PIN = '1234'
+VOLUNTEER = 'bench-volunteer'
+
+
+def seed(pending, assigned):
+    """Fill the database with pending packages and packages ready for pickup"""
+    conn = sqlite3.connect(db.DATABASE)
+    conn.execute('DELETE FROM packages')
+    rows = [
+        ('Bench Store', 'bench@store.com', 5.0, 'Produce', '2:00 PM', '6:00 PM', '',
+         '{}', '', PIN, status, volunteer)
+        for status, volunteer, count in (('pending', None, pending), ('assigned', VOLUNTEER, assigned))
+        for _ in range(count)
+    ]
+    conn.executemany('''
+        INSERT INTO packages (
+            store_name, store_email, weight_lbs, food_type,
+            pickup_window_start, pickup_window_end, special_instructions,
+            qr_code_data, qr_code_image_path, pickup_pin, status, volunteer_id
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+    conn.commit()
+    ids = [r[0] for r in conn.execute("SELECT id FROM packages WHERE status = 'assigned' ORDER BY id")]
+    conn.close()
+    return ids
+
+
+def use_legacy_connections():
+    """Reproduce the old behaviour: plain connect on entry, close on exit"""
+    # journal_mode is stored in the file, so undo the WAL switch from init_db
+    sqlite3.connect(db.DATABASE).execute('PRAGMA journal_mode = DELETE').close()
+    db.acquire = lambda: sqlite3.connect(db.DATABASE)
+    db.release = lambda conn: conn.close()
+
+
+def use_pool():
+    sqlite3.connect(db.DATABASE).execute('PRAGMA journal_mode = WAL').close()
+    db.acquire = ORIGINAL_ACQUIRE
+    db.release = ORIGINAL_RELEASE
+
+
+ORIGINAL_ACQUIRE = db.acquire
+ORIGINAL_RELEASE = db.release
+
+
+def run(url_for, total, concurrency):
+    """Fire `total` requests with `concurrency` workers; return latency stats"""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=concurrency)
+    session.mount('http://', adapter)
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one(i):
+        nonlocal errors
+        method, url, body = url_for(i)
+        start = time.perf_counter()
+        response = session.request(method, url, json=body)
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            if response.status_code != 200:
+                errors += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total)))
+    wall = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'rps': total / wall,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p99_ms': latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        'errors': errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--packages', type=int, default=2000, help='pending packages in the table')
+    parser.add_argument('--requests', type=int, default=400, help='requests per run')
+    args = parser.parse_args()
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    backend.init_db()
+    server = make_server('127.0.0.1', 0, backend.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{server.server_port}'
+
+    print(f"🚀 Benchmarking against {db.DATABASE} ({args.packages} pending packages)")
+    print(f"{'mode':<8} {'endpoint':<10} {'conc':>4} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>6}")
+
+    for mode, configure in (('before', use_legacy_connections), ('after', use_pool)):
+        configure()
+        for concurrency in CONCURRENCY_LEVELS:
+            seed(args.packages, 0)
+            stats = run(lambda i: ('GET', f'{base}/api/packages/available', None),
+                        args.requests, concurrency)
+            print(f"{mode:<8} {'available':<10} {concurrency:>4} {stats['rps']:>9.1f} "
+                  f"{stats['p50_ms']:>8.2f} {stats['p99_ms']:>8.2f} {stats['errors']:>6}")
+
+            ids = seed(0, args.requests)
+            stats = run(lambda i: ('POST', f'{base}/api/packages/{ids[i]}/pickup',
+                                   {'pin': PIN, 'volunteer_id': VOLUNTEER}),
+                        args.requests, concurrency)
+            print(f"{mode:<8} {'pickup':<10} {concurrency:>4} {stats['rps']:>9.1f} "
+                  f"{stats['p50_ms']:>8.2f} {stats['p99_ms']:>8.2f} {stats['errors']:>6}")
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
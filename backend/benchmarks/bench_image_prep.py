@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Food photo preprocessing benchmark: request thread vs. process pool + draft
+
+Runs every photo in a corpus through the preprocessing /api/analyze-food-image
+used to do inline (full decode, RGB convert, LANCZOS thumbnail, JPEG encode)
+and through ImagePreprocessor (draft decode in a worker process). Each mode
+runs in its own child process so peak RSS is measured separately. Reports
+median and p95 latency, peak RSS, and the longest stall a 5 ms ticker thread
+saw while the photos were processed, i.e. how long other requests on the
+server would have been held up.
+
+Without --corpus, 12MP (4032x3024) JPEGs are generated; point --corpus at a
+directory of real phone photos for representative numbers.
+
+Usage: python benchmarks/bench_image_prep.py [--corpus DIR] [--photos 8]
+"""
+
+import argparse
+import io
+import json
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from PIL import Image, ImageDraw, ImageFilter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from image_prep import ImagePreprocessor  # noqa: E402
+
+PHOTO_SIZE = (4032, 3024)
+TICK_SECONDS = 0.005
+
+
+def synthetic_photo(seed):
+    """A 12MP JPEG with enough texture to compress like a real photo"""
+    rng = random.Random(seed)
+    small = Image.new('RGB', (PHOTO_SIZE[0] // 8, PHOTO_SIZE[1] // 8))
+    draw = ImageDraw.Draw(small)
+    for _ in range(400):
+        x, y = rng.randrange(small.width), rng.randrange(small.height)
+        radius = rng.randrange(4, 60)
+        color = tuple(rng.randrange(256) for _ in range(3))
+        draw.ellipse((x - radius, y - radius, x + radius, y + radius), fill=color)
+    image = small.resize(PHOTO_SIZE, Image.Resampling.BICUBIC).filter(ImageFilter.GaussianBlur(2))
+    noise = Image.effect_noise(PHOTO_SIZE, 24).convert('RGB')
+    image = Image.blend(image, noise, 0.15)
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=92)
+    return buffer.getvalue()
+
+
+def load_corpus(directory, count):
+    if directory:
+        names = sorted(name for name in os.listdir(directory)
+                       if name.lower().endswith(('.jpg', '.jpeg', '.png', '.heic', '.webp')))
+        photos = []
+        for name in names:
+            with open(os.path.join(directory, name), 'rb') as photo:
+                photos.append(photo.read())
+        return photos
+
+    cache = os.path.join(tempfile.gettempdir(), 'bench_image_prep')
+    os.makedirs(cache, exist_ok=True)
+    photos = []
+    for number in range(count):
+        path = os.path.join(cache, f'photo{number}.jpg')
+        if not os.path.exists(path):
+            with open(path, 'wb') as photo:
+                photo.write(synthetic_photo(number))
+        with open(path, 'rb') as photo:
+            photos.append(photo.read())
+    return photos
+
+
+def inline_prepare(image_bytes):
+    """What the endpoint did before, on the request thread"""
+    image = Image.open(io.BytesIO(image_bytes))
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    if image.width > 1024 or image.height > 1024:
+        image.thumbnail((1024, 1024), Image.Resampling.LANCZOS)
+    output_buffer = io.BytesIO()
+    image.save(output_buffer, format='JPEG', quality=85)
+    return output_buffer.getvalue()
+
+
+def run_mode(mode, photos):
+    """Process every photo in this process and return the measurements"""
+    if mode == 'pool':
+        preprocessor = ImagePreprocessor()
+        preprocessor.process(photos[0])  # start the workers outside the timing
+        prepare = lambda photo: preprocessor.process(photo).data  # noqa: E731
+    else:
+        prepare = inline_prepare
+
+    stalls = []
+    done = threading.Event()
+
+    def tick():
+        last = time.perf_counter()
+        while not done.is_set():
+            time.sleep(TICK_SECONDS)
+            now = time.perf_counter()
+            stalls.append(now - last - TICK_SECONDS)
+            last = now
+
+    ticker = threading.Thread(target=tick, daemon=True)
+    ticker.start()
+    timings = []
+    sizes = []
+    for photo in photos:
+        start = time.perf_counter()
+        sizes.append(len(prepare(photo)))
+        timings.append(time.perf_counter() - start)
+    done.set()
+    ticker.join()
+
+    if mode == 'pool':
+        preprocessor.shutdown()
+    timings.sort()
+    return {
+        'median_ms': statistics.median(timings) * 1000,
+        'p95_ms': timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000,
+        'max_stall_ms': max(stalls) * 1000 if stalls else 0.0,
+        'output_bytes': statistics.median(sizes),
+        # ru_maxrss is in KB on Linux; pool workers are this process's children
+        'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'worker_rss_mb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--corpus', help='directory of photos (default: generated 12MP JPEGs)')
+    parser.add_argument('--photos', type=int, default=8)
+    parser.add_argument('--mode', choices=('generate', 'inline', 'pool'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    child = [sys.executable, __file__, '--photos', str(args.photos)]
+    if args.corpus:
+        child += ['--corpus', args.corpus]
+    if args.mode == 'generate':
+        load_corpus(args.corpus, args.photos)
+        return
+    if args.mode:
+        print(json.dumps(run_mode(args.mode, load_corpus(args.corpus, args.photos))))
+        return
+
+    # Generated in a child too: peak RSS carries over into processes forked
+    # from this one, so this process stays small
+    subprocess.run(child + ['--mode', 'generate'], check=True)
+    photos = load_corpus(args.corpus, args.photos)
+    if not photos:
+        print(f"❌ No photos found in {args.corpus}")
+        sys.exit(1)
+
+    first = Image.open(io.BytesIO(photos[0]))
+    print(f"🚀 Preprocessing {len(photos)} photos ({first.width}x{first.height} "
+          f"{first.format}, {statistics.median(map(len, photos)) / 1e6:.1f} MB median)")
+
+    results = {}
+    for mode in ('inline', 'pool'):
+        output = subprocess.run(child + ['--mode', mode], check=True, capture_output=True, text=True).stdout
+        results[mode] = json.loads(output.strip().splitlines()[-1])
+
+    print(f"{'mode':<8} {'p50 ms':>8} {'p95 ms':>8} {'stall ms':>9} {'rss MB':>8} {'worker MB':>10} {'out KB':>7}")
+    for mode, result in results.items():
+        print(f"{mode:<8} {result['median_ms']:>8.1f} {result['p95_ms']:>8.1f} {result['max_stall_ms']:>9.1f} "
+              f"{result['rss_mb']:>8.1f} {result['worker_rss_mb']:>10.1f} {result['output_bytes'] / 1024:>7.0f}")
+
+    inline, pool = results['inline'], results['pool']
+    print(f"Latency {inline['median_ms'] / pool['median_ms']:.1f}x lower, "
+          f"longest stall {inline['max_stall_ms']:.0f} ms -> {pool['max_stall_ms']:.0f} ms")
+    print(f"Peak RSS {inline['rss_mb']:.0f} MB inline -> {pool['worker_rss_mb']:.0f} MB per worker")
+
+    if pool['median_ms'] >= inline['median_ms'] or pool['worker_rss_mb'] >= inline['rss_mb']:
+        print("❌ Draft decoding in the pool is not faster and leaner than inline preprocessing")
+        sys.exit(1)
+    print("✅ Preprocessing is faster, leaner and off the request thread")
+
+
+if __name__ == '__main__':
+    main()
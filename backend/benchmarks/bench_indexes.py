@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Query-plan check and benchmark for the hot read paths
+
+Builds a synthetic database (1M packages by default) and applies the
+migrations. It then calls the read endpoints through the Flask test client
+and records the SELECTs each one actually runs, with a trace callback on the
+pooled connection. The recorded statements are timed with the secondary
+indexes in place and again with them dropped. Because the SQL comes from
+app.py itself, listings, keyset pages, the since= feed and the rollup and
+volunteer_stats reads are checked exactly as they ship.
+
+Every statement's EXPLAIN QUERY PLAN must reach packages and the
+trigger-maintained tables through an index. The script exits non-zero if any
+of them falls back to a full table scan, so `--rows 20000` doubles as a quick
+regression check after schema or query changes.
+
+Usage: python benchmarks/bench_indexes.py [--rows 1000000] [--repeat 5]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ['DATABASE_URL'] = os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['QR_IMAGE_DIR'] = tempfile.mkdtemp()
+
+import db  # noqa: E402
+from migrations import run_migrations  # noqa: E402
+
+STORES = 500
+VOLUNTEERS = 2000
+
+# Endpoint reads to check. A (first page URL, second page URL or None) entry
+# checks the second page, fetched with the first page's next_cursor; {since}
+# is the packages version just before a few recent edits.
+ENDPOINTS = {
+    'available': '/api/packages/available',
+    'available_page': ('/api/packages/available?limit=10', '/api/packages/available?limit=10&fields=id,status'),
+    'available_since': '/api/packages/available?since={since}',
+    'nearby': '/api/packages/available?lat=42.36&lng=-71.09&radius_km=5',
+    'store': '/api/packages/store/store7@bench.com',
+    'store_page': ('/api/packages/store/store7@bench.com?limit=5', None),
+    'volunteer': '/api/packages/volunteer/vol7',
+    'volunteer_stats': '/api/volunteer/vol7/stats',
+    'leaderboard': '/api/volunteers/leaderboard',
+    'pending_deliveries': '/api/foodbank/pending-deliveries',
+    'foodbank_dashboard': '/api/foodbank/dashboard?days=30',
+}
+
+# Plan lines naming these (or their aliases in app.py) must not be bare scans
+WATCHED_TABLES = {'packages', 'p', 'volunteer_stats', 'v', 'daily_rollups', 'daily_rollup_volunteers',
+                  'package_changes', 'c'}
+
+
+def create_base_schema():
+    """The schema init_db() creates, before any migration has run"""
+    import app as backend
+    backend.run_migrations = lambda conn: 0
+    backend.init_db()
+    return backend
+
+
+def seed(conn, rows):
+    """Insert `rows` packages: ~1% pending, 1% assigned, 1% picked up, rest completed"""
+    conn.executemany(
+        'INSERT INTO store_profiles (firebase_uid, email, profile_data) VALUES (?, ?, ?)',
+        [(f'uid{i}', f'store{i}@bench.com', '{"address": "1 Main St", "latitude": 42.36, "longitude": -71.09}')
+         for i in range(STORES)],
+    )
+    conn.execute(f'''
+        WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?)
+        INSERT INTO packages (
+            store_name, store_email, weight_lbs, food_type,
+            pickup_window_start, pickup_window_end, special_instructions,
+            qr_code_data, qr_code_image_path, pickup_pin, status,
+            created_at, volunteer_id, pickup_completed_at
+        )
+        SELECT
+            'Store ' || (i % {STORES}), 'store' || (i % {STORES}) || '@bench.com',
+            (i % 50) / 2.0 + 0.5, 'Produce', '2:00 PM', '6:00 PM', '', '{{}}', '', '1234',
+            CASE i % 100 WHEN 0 THEN 'pending' WHEN 1 THEN 'assigned' WHEN 2 THEN 'picked_up' ELSE 'completed' END,
+            datetime('now', '-' || (i % 365) || ' days', '-' || (i % 86400) || ' seconds'),
+            CASE WHEN i % 100 = 0 THEN NULL ELSE 'vol' || (i % {VOLUNTEERS}) END,
+            CASE WHEN i % 100 >= 2 THEN datetime('now', '-' || (i % 365) || ' days') END
+        FROM n
+    ''', (rows,))
+    conn.commit()
+
+
+def capture(client, conn, url):
+    """(response, SELECT statements run on `conn`) for one GET"""
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        response = client.get(url)
+    finally:
+        conn.set_trace_callback(None)
+    if response.status_code != 200:
+        raise RuntimeError(f'{url} answered {response.status_code}: {response.get_data(as_text=True)[:200]}')
+    return response, [sql for sql in statements if sql.lstrip().upper().startswith('SELECT')]
+
+
+def edit_recent_packages(conn, count=20):
+    """Touch a few pending packages, as a poller's since= window would see; returns the version before"""
+    since = conn.execute('SELECT version FROM packages_version WHERE id = 1').fetchone()[0]
+    conn.execute('''
+        UPDATE packages SET special_instructions = 'Ring the bell'
+        WHERE id IN (SELECT id FROM packages WHERE status = 'pending' ORDER BY id DESC LIMIT ?)
+    ''', (count,))
+    conn.commit()
+    return since
+
+
+def capture_queries(backend, conn):
+    """{name: SQL} for every statement the ENDPOINTS run"""
+    since = edit_recent_packages(conn)
+    # The pool is a LIFO stack, so requests on this thread borrow `conn`
+    db.release(conn)
+    client = backend.app.test_client()
+    queries = {}
+    for name, url in ENDPOINTS.items():
+        if isinstance(url, tuple):
+            first, second = url
+            response, _ = capture(client, conn, first)
+            next_cursor = response.get_json()['next_cursor']
+            url = f"{second or first}&cursor={next_cursor}"
+        url = url.format(since=since)
+        _, statements = capture(client, conn, url)
+        # packages_version is read by every listing for its ETag: a single-row lookup
+        statements = [sql for sql in statements if 'packages_version' not in sql]
+        for index, sql in enumerate(statements, start=1):
+            queries[name if len(statements) == 1 else f'{name}[{index}]'] = sql
+    db.acquire()
+    return queries
+
+
+def time_query(conn, sql, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        conn.execute(sql).fetchall()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def full_scans(conn, sql):
+    """Plan lines that read a watched table without an index"""
+    plan = [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}')]
+    return [line for line in plan
+            if line.startswith('SCAN') and 'USING' not in line and line.split()[1] in WATCHED_TABLES]
+
+
+def drop_secondary_indexes(conn):
+    # sql IS NULL for the automatic indexes behind PRIMARY KEY and UNIQUE
+    names = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL")]
+    for name in names:
+        conn.execute(f'DROP INDEX {name}')
+    conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    backend = create_base_schema()
+    conn = db.connect()
+    print(f"🚀 Seeding {args.rows:,} packages into {db.DATABASE}")
+    seed(conn, args.rows)
+    run_migrations(conn)
+
+    queries = capture_queries(backend, conn)
+    indexed = {name: time_query(conn, sql, args.repeat) for name, sql in queries.items()}
+    plans = {name: full_scans(conn, sql) for name, sql in queries.items()}
+    drop_secondary_indexes(conn)
+    unindexed = {name: time_query(conn, sql, args.repeat) for name, sql in queries.items()}
+
+    failures = 0
+    print(f"{'query':<24} {'no index ms':>12} {'indexed ms':>11} {'speedup':>8}  plan")
+    for name in queries:
+        scans = plans[name]
+        failures += bool(scans)
+        verdict = '❌ ' + '; '.join(scans) if scans else '✅ index'
+        print(f"{name:<24} {unindexed[name]:>12.2f} {indexed[name]:>11.2f} "
+              f"{unindexed[name] / max(indexed[name], 1e-6):>7.1f}x  {verdict}")
+
+    conn.close()
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+LLM gateway against a local fake provider
+
+Starts an HTTP server that speaks just enough of the Anthropic messages and
+OpenAI chat completions APIs, with configurable latency and error rate, and
+points the gateway at it. Scenarios:
+
+- flaky: 30% of calls answer 529. Compares the success rate of plain
+  requests.post against the gateway's retries, and checks the server never
+  sees more concurrent calls than the gateway's limit.
+- outage: every call fails. The breaker should open and the rest of the calls
+  fail fast without reaching the server; once reset, a trial call closes it.
+- deadline: the provider hangs; calls must give up at their deadline, and
+  callers with tight deadlines must not trip the breaker for everyone.
+- fallback: AIAnalytics during an outage still returns its fallback summary,
+  and /api/analyze-food-image answers 503 instead of hanging.
+
+Usage: python benchmarks/bench_llm_gateway.py [--calls 200] [--threads 32]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ['DATABASE_URL'] = os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['QR_IMAGE_DIR'] = tempfile.mkdtemp()
+
+from llm_gateway import CircuitOpen, DeadlineExceeded, LLMError, LLMGateway  # noqa: E402
+
+ANALYSIS = {'food_type': 'Bread', 'estimated_weight_lbs': 2.5, 'confidence': 'high', 'description': 'Loaves'}
+
+
+class FakeProvider(BaseHTTPRequestHandler):
+    """Anthropic/OpenAI lookalike driven by the server's `behaviour` dict"""
+
+    def do_POST(self):
+        server = self.server
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        with server.lock:
+            server.requests += 1
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            behaviour = server.behaviour
+            time.sleep(behaviour['latency'])
+            if random.random() < behaviour['error_rate']:
+                self._reply(behaviour['error_status'], {'error': {'type': 'overloaded_error'}})
+            elif self.path == '/v1/messages':
+                self._reply(200, {'content': [{'type': 'text', 'text': json.dumps(ANALYSIS)}]})
+            else:
+                self._reply(200, {'choices': [{'message': {'content': 'Summary from the fake provider'}}]})
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        try:
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up at its deadline
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+def start_fake_provider():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeProvider)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.requests = server.in_flight = server.max_in_flight = 0
+    server.behaviour = {'latency': 0.0, 'error_rate': 0.0, 'error_status': 529}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def reset(server, **behaviour):
+    with server.lock:
+        server.requests = server.in_flight = server.max_in_flight = 0
+    server.behaviour = {'latency': 0.0, 'error_rate': 0.0, 'error_status': 529, **behaviour}
+
+
+def payload():
+    return {'model': 'fake', 'max_tokens': 10, 'messages': [{'role': 'user', 'content': 'hi'}]}
+
+
+def timed(fn):
+    start = time.perf_counter()
+    try:
+        fn()
+        ok = True
+    except Exception:
+        ok = False
+    return ok, time.perf_counter() - start
+
+
+def run_calls(fn, calls, threads):
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(lambda _: timed(fn), range(calls)))
+    successes = sum(ok for ok, _ in results)
+    seconds = sorted(elapsed for _, elapsed in results)
+    return successes, statistics.median(seconds) * 1000, seconds[int(len(seconds) * 0.99) - 1] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--concurrency', type=int, default=8)
+    args = parser.parse_args()
+
+    logging.getLogger('llm_gateway').setLevel(logging.ERROR)
+    random.seed(3)
+    server, base_url = start_fake_provider()
+    failures = []
+
+    def check(condition, message):
+        print(f"   {'✅' if condition else '❌'} {message}")
+        if not condition:
+            failures.append(message)
+
+    print(f"🚀 Fake provider at {base_url}; {args.calls} calls from {args.threads} threads")
+
+    # Flaky provider: plain requests vs. the gateway
+    print("flaky: 30% of calls answer 529, 50 ms latency")
+    reset(server, latency=0.05, error_rate=0.3)
+
+    def plain_call():
+        response = requests.post(f'{base_url}/v1/messages', json=payload(), timeout=10)
+        response.raise_for_status()
+
+    plain_ok, plain_p50, plain_p99 = run_calls(plain_call, args.calls, args.threads)
+    plain_peak = server.max_in_flight
+
+    reset(server, latency=0.05, error_rate=0.3)
+    gateway = LLMGateway(anthropic_base_url=base_url, openai_base_url=base_url,
+                         max_concurrency=args.concurrency, backoff_base=0.02, breaker_threshold=50)
+    gateway_ok, gateway_p50, gateway_p99 = run_calls(
+        lambda: gateway.anthropic_messages('key', payload(), timeout=10), args.calls, args.threads)
+    stats = gateway.stats()['providers']['anthropic']
+    print(f"   {'client':<8} {'ok':>5} {'p50 ms':>8} {'p99 ms':>8} {'peak in flight':>15}")
+    print(f"   {'plain':<8} {plain_ok:>5} {plain_p50:>8.1f} {plain_p99:>8.1f} {plain_peak:>15}")
+    print(f"   {'gateway':<8} {gateway_ok:>5} {gateway_p50:>8.1f} {gateway_p99:>8.1f} {server.max_in_flight:>15}"
+          f"   ({stats['retries']} retries)")
+    check(gateway_ok > plain_ok, f"retries recovered {gateway_ok - plain_ok} calls plain requests lost")
+    check(server.max_in_flight <= args.concurrency, f"never more than {args.concurrency} calls in flight")
+
+    # Outage: the breaker opens and later calls fail fast
+    print("outage: every call answers 503")
+    reset(server, error_rate=1.0, error_status=503)
+    gateway = LLMGateway(anthropic_base_url=base_url, openai_base_url=base_url, max_concurrency=args.concurrency,
+                         max_retries=1, backoff_base=0.01, breaker_threshold=5, breaker_reset_seconds=0.5)
+    outcomes = []
+    for _ in range(50):
+        start = time.perf_counter()
+        try:
+            gateway.anthropic_messages('key', payload(), timeout=5)
+        except CircuitOpen:
+            outcomes.append(('open', time.perf_counter() - start))
+        except LLMError:
+            outcomes.append(('error', time.perf_counter() - start))
+    fast = [elapsed for outcome, elapsed in outcomes if outcome == 'open']
+    print(f"   {len(fast)} of 50 calls short-circuited (median {statistics.median(fast) * 1000:.2f} ms), "
+          f"server saw {server.requests} requests")
+    check(gateway.breakers['anthropic'].state == 'open' and server.requests <= 6, "breaker opened after 5 failures")
+
+    reset(server)
+    time.sleep(0.6)
+    recovered = timed(lambda: gateway.anthropic_messages('key', payload(), timeout=5))[0]
+    check(recovered and gateway.breakers['anthropic'].state == 'closed', "half-open trial call closed the breaker")
+
+    # Hanging provider: the deadline wins
+    print("deadline: provider takes 2 s, calls allow 0.3 s")
+    reset(server, latency=2.0)
+    start = time.perf_counter()
+    try:
+        gateway.anthropic_messages('key', payload(), timeout=0.3)
+        timed_out = False
+    except DeadlineExceeded:
+        timed_out = True
+    elapsed = time.perf_counter() - start
+    print(f"   gave up after {elapsed * 1000:.0f} ms")
+    check(timed_out and elapsed < 0.6, "call raised DeadlineExceeded at its deadline")
+
+    with ThreadPoolExecutor(max_workers=10) as pool:
+        list(pool.map(lambda _: timed(lambda: gateway.anthropic_messages('key', payload(), timeout=0.1)), range(20)))
+    check(gateway.breakers['anthropic'].state == 'closed', "20 tight-deadline timeouts left the breaker closed")
+
+    # Callers fall back while the provider is down
+    print("fallback: callers during an outage")
+    reset(server, error_rate=1.0, error_status=503)
+    os.environ.update({'ANTHROPIC_BASE_URL': base_url, 'OPENAI_BASE_URL': base_url,
+                       'ANTHROPIC_API_KEY': 'fake-key', 'LLM_MAX_RETRIES': '1'})
+    import app as backend
+    from ai_analytics import AIAnalytics
+    import llm_gateway
+
+    backend.init_db()
+    shared = llm_gateway.get_gateway()
+    analytics = AIAnalytics(os.environ['DATABASE_URL'])
+    analytics.openai_key = 'fake-key'
+    metrics = analytics.calculate_core_metrics([])
+    # AIAnalytics prints each provider error; keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        summaries = [timed(lambda: analytics.generate_executive_summary_openai(metrics, 'Bench Store'))[1]
+                     for _ in range(10)]
+        summary = analytics.generate_executive_summary_openai(metrics, 'Bench Store')
+    print(f"   executive summary: circuit {shared.breakers['openai'].state}, "
+          f"last call {summaries[-1] * 1000:.2f} ms")
+    check(summary == analytics._fallback_summary(metrics, 'Bench Store'), "AIAnalytics returned its fallback summary")
+    check(shared.breakers['openai'].state == 'open' and summaries[-1] < 0.05, "fallback was immediate once the breaker opened")
+
+    # Trip the breaker directly rather than waiting out a photo analysis per failure
+    for _ in range(shared.breakers['anthropic'].threshold):
+        shared.breakers['anthropic'].record_failure()
+    image = io.BytesIO()
+    Image.effect_noise((400, 300), 50).convert('RGB').save(image, 'JPEG')
+    client = backend.app.test_client()
+    response = client.post('/api/analyze-food-image', data=image.getvalue(), content_type='image/jpeg')
+    print(f"   /api/analyze-food-image: {response.status_code} {response.get_json()['error']}")
+    check(response.status_code == 503, "photo analysis answered 503 while the circuit is open")
+
+    reset(server)
+    shared.breakers['anthropic'].record_success()
+    response = client.post('/api/analyze-food-image', data=image.getvalue(), content_type='image/jpeg')
+    check(response.status_code == 200 and response.get_json()['analysis']['food_type'] == 'Bread',
+          "photo analysis succeeded through the fake provider once it recovered")
+    backend.image_preprocessor.shutdown()
+    server.shutdown()
+
+    if failures:
+        print(f"❌ {len(failures)} check(s) failed")
+        sys.exit(1)
+    print("✅ Gateway retried, limited, tripped and recovered as expected")
+
+
+if __name__ == '__main__':
+    main()
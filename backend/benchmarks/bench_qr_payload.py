@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+QR payload benchmark: full package JSON vs. signed token
+
+Renders the QR code a package used to carry (the whole qr_data JSON) and the
+signed token it carries now, and reports the QR version, PNG size and median
+render time of each. Also times /api/qr/resolve/<token>, the lookup a scan
+now costs.
+
+Usage: python benchmarks/bench_qr_payload.py [--repeat 50]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import qrcode
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ['DATABASE_URL'] = os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['QR_IMAGE_DIR'] = tempfile.mkdtemp()
+
+import app as backend  # noqa: E402
+from qr_token import make_token  # noqa: E402
+from qr_worker import render_qr_code  # noqa: E402
+
+PACKAGE_ID = 48213
+
+# What create_package used to encode
+LEGACY_PAYLOAD = {
+    'package_id': str(int(datetime.now().timestamp() * 1000)),
+    'store_name': 'Trader Joe\'s Kendall Square',
+    'store_email': 'manager.kendall@traderjoes-example.com',
+    'weight_lbs': 12.5,
+    'food_type': 'Bakery & Bread',
+    'pickup_window_start': '8:00 PM',
+    'pickup_window_end': '9:30 PM',
+    'special_instructions': 'Ask for the manager at the service desk; bags are by the back door.',
+    'created_at': datetime.now().isoformat(),
+}
+
+
+def measure(payload, repeat, directory):
+    path = os.path.join(directory, 'qr.png')
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        render_qr_code(payload, path)
+        timings.append(time.perf_counter() - start)
+
+    qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_L)
+    qr.add_data(payload if isinstance(payload, str) else json.dumps(payload))
+    qr.make(fit=True)
+    return qr.version, os.path.getsize(path), statistics.median(timings) * 1000
+
+
+def time_resolve(repeat):
+    backend.init_db()
+    client = backend.app.test_client()
+    created = client.post('/api/packages/create', json={
+        'store_name': LEGACY_PAYLOAD['store_name'], 'store_email': LEGACY_PAYLOAD['store_email'],
+        'weight_lbs': 12.5, 'food_type': 'Bakery & Bread',
+        'pickup_window_start': '8:00 PM', 'pickup_window_end': '9:30 PM',
+    }).get_json()
+    token = created['qr_token']
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get(f'/api/qr/resolve/{token}')
+        timings.append(time.perf_counter() - start)
+        assert response.status_code == 200
+    return token, statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    token = make_token(PACKAGE_ID)
+    print(f"🚀 Rendering each payload {args.repeat} times")
+    before = measure(LEGACY_PAYLOAD, args.repeat, directory)
+    after = measure(token, args.repeat, directory)
+
+    print(f"{'payload':<8} {'chars':>6} {'version':>8} {'png bytes':>10} {'render ms':>10}")
+    legacy_chars = len(json.dumps(LEGACY_PAYLOAD))
+    for name, chars, (version, size, render_ms) in (
+        ('json', legacy_chars, before),
+        ('token', len(token), after),
+    ):
+        print(f"{name:<8} {chars:>6} {version:>8} {size:>10} {render_ms:>10.2f}")
+    print(f"Render speedup: {before[2] / after[2]:.1f}x, PNG {before[1] / after[1]:.1f}x smaller")
+
+    resolve_token, resolve_ms = time_resolve(args.repeat)
+    print(f"Resolve /api/qr/resolve/{resolve_token}: {resolve_ms:.2f} ms median")
+
+    if after[0] >= before[0]:
+        print("❌ Token QR code is not smaller than the JSON one")
+        sys.exit(1)
+    print("✅ Token QR code is smaller and faster to render")
+
+
+if __name__ == '__main__':
+    main()
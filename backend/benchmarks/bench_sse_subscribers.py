@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Load test for the /api/stream/packages Server-Sent Events endpoint
+
+Starts the Flask app on a local port, opens 1,000 concurrent subscribers
+(a third each as volunteer, store and foodbank), then drives packages through
+create -> assign -> pickup -> deliver over the REST API. Every subscriber
+must receive exactly the events its filter selects; the script reports
+connect time, publish-to-receive latency percentiles across all deliveries,
+and exits non-zero if any subscriber missed or duplicated an event.
+
+Reading is done with one selector loop over raw sockets, so the client side
+doesn't need a thread per connection.
+
+Usage: python benchmarks/bench_sse_subscribers.py [--subscribers 1000] [--packages 20]
+"""
+
+import argparse
+import json
+import logging
+import os
+import selectors
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ['DATABASE_URL'] = os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['QR_IMAGE_DIR'] = tempfile.mkdtemp()
+
+import app as backend  # noqa: E402
+from werkzeug.serving import make_server  # noqa: E402
+
+STORE_EMAIL = 'bench@store.com'
+
+# Subscriber kinds: query string and the event types it should see
+KINDS = {
+    'volunteer': ('role=volunteer', {'create', 'assign'}),
+    'store': (f'role=store&store_email={STORE_EMAIL}', {'create', 'assign', 'pickup', 'deliver'}),
+    'foodbank': ('role=foodbank', {'pickup', 'deliver'}),
+}
+
+
+class Subscriber:
+    def __init__(self, kind, port):
+        self.kind = kind
+        self.buffer = b''
+        self.events = Counter()
+        self.latencies = []
+        self.sock = socket.create_connection(('127.0.0.1', port))
+        query = KINDS[kind][0]
+        self.sock.sendall(f'GET /api/stream/packages?{query} HTTP/1.1\r\nHost: localhost\r\n'
+                          'Accept: text/event-stream\r\n\r\n'.encode())
+        self.sock.setblocking(False)
+
+    def feed(self, data, sent_at):
+        self.buffer += data
+        *lines, self.buffer = self.buffer.split(b'\n')
+        now = time.perf_counter()
+        for line in lines:
+            if line.startswith(b'data: '):
+                event = json.loads(line[6:])
+                if 'type' not in event:
+                    continue
+                key = (event['type'], event['package']['id'])
+                self.events[key] += 1
+                if key in sent_at:
+                    self.latencies.append(now - sent_at[key])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--subscribers', type=int, default=1000)
+    parser.add_argument('--packages', type=int, default=20)
+    args = parser.parse_args()
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    backend.init_db()
+    server = make_server('127.0.0.1', 0, backend.app, threaded=True)
+    server.request_queue_size = args.subscribers
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_port
+    base = f'http://127.0.0.1:{port}'
+
+    print(f"🚀 Opening {args.subscribers} stream subscribers")
+    start = time.perf_counter()
+    kinds = list(KINDS)
+    subscribers = [Subscriber(kinds[i % len(kinds)], port) for i in range(args.subscribers)]
+    while backend.package_events.stats()['subscribers'] < args.subscribers:
+        time.sleep(0.05)
+    print(f"Connected in {time.perf_counter() - start:.2f}s")
+
+    selector = selectors.DefaultSelector()
+    for subscriber in subscribers:
+        selector.register(subscriber.sock, selectors.EVENT_READ, subscriber)
+
+    sent_at = {}
+    stop = threading.Event()
+
+    def read_loop():
+        while not stop.is_set():
+            for key, _ in selector.select(timeout=0.1):
+                try:
+                    data = key.fileobj.recv(65536)
+                except BlockingIOError:
+                    continue
+                if data:
+                    key.data.feed(data, sent_at)
+
+    reader = threading.Thread(target=read_loop, daemon=True)
+    reader.start()
+
+    session = requests.Session()
+    package_ids = []
+    for package_id in range(1, args.packages + 1):
+        # Fresh database, so AUTOINCREMENT hands out 1..N
+        sent_at[('create', package_id)] = time.perf_counter()
+        session.post(f'{base}/api/packages/create', json={
+            'store_name': 'Bench Store', 'store_email': STORE_EMAIL, 'weight_lbs': 5,
+            'food_type': 'Produce', 'pickup_window_start': '2:00 PM', 'pickup_window_end': '6:00 PM',
+        })
+        package_ids.append(package_id)
+
+    for package_id in package_ids:
+        pin = session.get(f'{base}/api/packages/{package_id}').json()['package']['pickup_pin']
+        for event_type, path, body in (
+            ('assign', 'assign', {'volunteer_id': 'bench-volunteer'}),
+            ('pickup', 'pickup', {'volunteer_id': 'bench-volunteer', 'pin': pin}),
+            ('deliver', 'deliver', {'pin': pin}),
+        ):
+            sent_at[(event_type, package_id)] = time.perf_counter()
+            session.post(f'{base}/api/packages/{package_id}/{path}', json=body)
+
+    # Wait for the fan-out to drain
+    deadline = time.perf_counter() + 30
+    expected = {kind: len(types) * args.packages for kind, (_, types) in KINDS.items()}
+    while time.perf_counter() < deadline:
+        if all(sum(s.events.values()) >= expected[s.kind] for s in subscribers):
+            break
+        time.sleep(0.1)
+    stop.set()
+    reader.join()
+    server.shutdown()
+
+    failures = 0
+    for subscriber in subscribers:
+        wanted = {(event_type, package_id) for event_type in KINDS[subscriber.kind][1] for package_id in package_ids}
+        if set(subscriber.events) != wanted or any(count != 1 for count in subscriber.events.values()):
+            failures += 1
+
+    latencies = sorted(latency for s in subscribers for latency in s.latencies)
+    delivered = len(latencies)
+    print(f"Deliveries: {delivered:,} events to {args.subscribers} subscribers")
+    if latencies:
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        print(f"Latency ms: p50 {statistics.median(latencies) * 1000:.1f}, "
+              f"p99 {p99 * 1000:.1f}, max {latencies[-1] * 1000:.1f}")
+    print(f"Bus stats: {backend.package_events.stats()}")
+
+    if failures:
+        print(f"❌ {failures} subscribers missed or duplicated events")
+        sys.exit(1)
+    print("✅ Every subscriber received exactly its filtered events")
+
+
+if __name__ == '__main__':
+    main()
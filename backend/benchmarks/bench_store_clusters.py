@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Payload and latency benchmark for /api/stores/locations clustering
+
+Seeds thousands of stores around a few metro areas, then requests the map
+the old way (every store) and with ?bbox=&zoom= for a handful of typical
+viewports. Reports marker count, payload size and median response time, and
+exits non-zero if a clustered response returns more markers than there are
+grid cells in its viewport.
+
+Usage: python benchmarks/bench_store_clusters.py [--stores 5000] [--repeat 20]
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ['DATABASE_URL'] = os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['QR_IMAGE_DIR'] = tempfile.mkdtemp()
+
+import db  # noqa: E402
+import app as backend  # noqa: E402
+from geo import grid_cell  # noqa: E402
+
+METROS = [
+    (42.36, -71.06),   # Boston
+    (40.71, -74.01),   # New York
+    (41.88, -87.63),   # Chicago
+    (37.77, -122.42),  # San Francisco
+    (29.76, -95.37),   # Houston
+]
+
+# (name, bbox, zoom); bbox is min_lat,min_lng,max_lat,max_lng
+VIEWPORTS = [
+    ('country', (24.0, -125.0, 50.0, -66.0), 4),
+    ('region', (40.0, -76.0, 44.0, -69.0), 7),
+    ('city', (42.25, -71.20, 42.45, -70.95), 11),
+    ('street', (42.35, -71.07, 42.37, -71.05), 15),
+]
+
+
+def seed(count):
+    random.seed(7)
+    conn = db.connect()
+    rows = []
+    for number in range(count):
+        lat, lng = random.choice(METROS)
+        profile = {
+            'storeName': f'Store {number}',
+            'address': f'{number} Main St',
+            'latitude': lat + random.gauss(0, 0.3),
+            'longitude': lng + random.gauss(0, 0.3),
+        }
+        rows.append((f'uid{number}', f'store{number}@bench.com', json.dumps(profile)))
+    conn.executemany('INSERT INTO store_profiles (firebase_uid, email, profile_data) VALUES (?, ?, ?)', rows)
+    conn.commit()
+    conn.close()
+
+
+def measure(client, query, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get(f'/api/stores/locations{query}')
+        timings.append(time.perf_counter() - start)
+    body = response.get_json()
+    markers = len(body['stores']) + len(body['clusters'])
+    return markers, len(response.data), statistics.median(timings) * 1000
+
+
+def cell_bound(bbox, zoom):
+    """Most grid cells a bbox can touch at a zoom level"""
+    min_lat, min_lng, max_lat, max_lng = bbox
+    left, bottom = grid_cell(min_lat, min_lng, zoom)
+    right, top = grid_cell(max_lat, max_lng, zoom)
+    return (right - left + 1) * (bottom - top + 1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--stores', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    backend.init_db()
+    print(f"🚀 Seeding {args.stores:,} stores")
+    seed(args.stores)
+    client = backend.app.test_client()
+
+    print(f"{'view':<10} {'markers':>8} {'bytes':>10} {'ms':>8}")
+    markers, size, ms = measure(client, '', args.repeat)
+    print(f"{'all':<10} {markers:>8} {size:>10,} {ms:>8.2f}")
+
+    failures = 0
+    for name, bbox, zoom in VIEWPORTS:
+        query = f"?bbox={','.join(map(str, bbox))}&zoom={zoom}"
+        markers, size, ms = measure(client, query, args.repeat)
+        bound = cell_bound(bbox, zoom)
+        verdict = '✅' if markers <= bound else f'❌ > {bound} cells'
+        failures += markers > bound
+        print(f"{name:<10} {markers:>8} {size:>10,} {ms:>8.2f}  z{zoom} {verdict}")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
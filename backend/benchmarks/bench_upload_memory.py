@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Peak memory of the web process per food photo upload format
+
+Starts the Flask app in a child process for each format (base64 JSON,
+multipart/form-data, raw image/jpeg) and posts the same 12MP photos to
+/api/analyze-food-image from several client threads at once. The child runs
+without an Anthropic key, so each request stops right after preprocessing:
+what's measured is the upload path itself. Reports bytes on the wire, median
+latency and the web process's peak RSS above its warmed-up baseline (the
+preprocessing workers are separate processes and not included).
+
+Also checks that a multipart batch cut short by an oversized photo answers
+413 and leaves none of its earlier photos' spool files behind.
+
+Usage: python benchmarks/bench_upload_memory.py [--corpus DIR] [--photos 8] [--concurrency 4]
+"""
+
+import argparse
+import base64
+import glob
+import io
+import json
+import logging
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from bench_image_prep import load_corpus  # noqa: E402
+
+FORMATS = ('json', 'multipart', 'raw')
+
+
+def serve():
+    """Child process: run the app, answering 'rss' on stdin with its peak RSS"""
+    os.environ['DATABASE_URL'] = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    os.environ['QR_IMAGE_DIR'] = tempfile.mkdtemp()
+    os.environ['ANTHROPIC_API_KEY'] = ''
+    import app as backend
+    from werkzeug.serving import make_server
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    backend.init_db()
+    server = make_server('127.0.0.1', 0, backend.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(server.server_port, flush=True)
+    for line in sys.stdin:
+        if line.strip() == 'rss':
+            # ru_maxrss is in KB on Linux
+            print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, flush=True)
+    server.shutdown()
+    backend.image_preprocessor.shutdown()
+
+
+def serve_limits():
+    """Child process: post a 1 MB + 3 MB batch against a 2 MB photo limit"""
+    os.environ['DATABASE_URL'] = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    os.environ['QR_IMAGE_DIR'] = tempfile.mkdtemp()
+    os.environ['PHOTO_MAX_BYTES'] = str(2 * 1024 * 1024)
+    import app as backend
+
+    backend.init_db()
+    # Spool files land here, so any left over are this request's
+    tempfile.tempdir = spool_dir = tempfile.mkdtemp()
+    files = [(io.BytesIO(os.urandom(size)), f'photo{i}.jpg') for i, size in enumerate((1024 * 1024, 3 * 1024 * 1024))]
+    response = backend.app.test_client().post('/api/analyze-food-image/batch', data={'images': files},
+                                              content_type='multipart/form-data')
+    print(json.dumps({'status': response.status_code,
+                      'leftover': len(glob.glob(os.path.join(spool_dir, 'photo-*.upload')))}), flush=True)
+    backend.image_preprocessor.shutdown()
+
+
+def check_oversized_batch():
+    child = subprocess.run([sys.executable, __file__, '--serve-limits'], capture_output=True, text=True, check=True)
+    return json.loads(child.stdout.splitlines()[-1])
+
+
+def post(session, url, fmt, photo):
+    if fmt == 'json':
+        body = json.dumps({'image': 'data:image/jpeg;base64,' + base64.b64encode(photo).decode()})
+        response = session.post(url, data=body, headers={'Content-Type': 'application/json'})
+        sent = len(body)
+    elif fmt == 'multipart':
+        response = session.post(url, files={'image': ('photo.jpg', photo, 'image/jpeg')})
+        sent = len(response.request.body)
+    else:
+        response = session.post(url, data=photo, headers={'Content-Type': 'image/jpeg'})
+        sent = len(photo)
+    return response, sent
+
+
+def run_format(fmt, photos, concurrency):
+    child = subprocess.Popen([sys.executable, __file__, '--serve'], stdin=subprocess.PIPE,
+                             stdout=subprocess.PIPE, text=True)
+
+    def rss_kb():
+        child.stdin.write('rss\n')
+        child.stdin.flush()
+        return int(child.stdout.readline())
+
+    try:
+        url = f'http://127.0.0.1:{int(child.stdout.readline())}/api/analyze-food-image'
+        session = requests.Session()
+        # One request first so the preprocessing pool and imports are warm
+        post(session, url, fmt, photos[0])
+        baseline = rss_kb()
+
+        def upload(photo):
+            start = time.perf_counter()
+            response, sent = post(requests.Session(), url, fmt, photo)
+            # No API key in the child: preprocessing succeeded if we got that far
+            ok = 'not configured' in response.json().get('error', '')
+            return time.perf_counter() - start, sent, ok
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(upload, photos))
+        peak = rss_kb()
+    finally:
+        child.stdin.close()
+        child.wait()
+
+    return {
+        'sent_mb': statistics.median(sent for _, sent, _ in results) / 1e6,
+        'median_ms': statistics.median(seconds for seconds, _, _ in results) * 1000,
+        'peak_mb': (peak - baseline) / 1024,
+        'ok': all(ok for _, _, ok in results),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--corpus', help='directory of photos (default: generated 12MP JPEGs)')
+    parser.add_argument('--photos', type=int, default=8)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--serve-limits', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve()
+        return
+    if args.serve_limits:
+        serve_limits()
+        return
+
+    photos = load_corpus(args.corpus, args.photos)
+    print(f"🚀 Uploading {len(photos)} photos ({statistics.median(map(len, photos)) / 1e6:.1f} MB median), "
+          f"{args.concurrency} at a time, in each format")
+
+    results = {fmt: run_format(fmt, photos, args.concurrency) for fmt in FORMATS}
+
+    print(f"{'format':<10} {'sent MB':>8} {'p50 ms':>8} {'peak RSS +MB':>13}")
+    for fmt, result in results.items():
+        print(f"{fmt:<10} {result['sent_mb']:>8.2f} {result['median_ms']:>8.1f} {result['peak_mb']:>13.1f}")
+
+    if not all(result['ok'] for result in results.values()):
+        print("❌ Some uploads were not preprocessed")
+        sys.exit(1)
+
+    limits = check_oversized_batch()
+    print(f"1 MB + 3 MB batch, 2 MB limit: {limits['status']}, {limits['leftover']} spool file(s) left")
+    if limits['status'] != 413 or limits['leftover']:
+        print("❌ Oversized batch did not answer 413 with its spool files deleted")
+        sys.exit(1)
+
+    streamed = max(results['multipart']['peak_mb'], results['raw']['peak_mb'])
+    if streamed >= results['json']['peak_mb']:
+        print("❌ Streamed uploads did not use less memory than base64 JSON")
+        sys.exit(1)
+    print("✅ Streamed uploads use less memory than base64 JSON, oversized batches leave no spool files")
+
+
+if __name__ == '__main__':
+    main()
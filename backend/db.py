@@ -0,0 +1,88 @@
+"""
+SQLite connection layer for the Flask backend
+"""
+
+import os
+import queue
+import sqlite3
+from contextlib import contextmanager
+
+from flask import g
+
+# Database setup
+DATABASE = os.getenv('DATABASE_URL', 'packages.db')
+
+# Number of idle connections kept around between requests
+POOL_SIZE = int(os.getenv('SQLITE_POOL_SIZE', 8))
+
+# Applied once when a connection is opened; pooled connections keep them for life
+CONNECTION_PRAGMAS = (
+    ('journal_mode', 'WAL'),                                         # readers don't block the writer
+    ('synchronous', 'NORMAL'),                                       # safe with WAL, no fsync per commit
+    ('busy_timeout', int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))),  # wait instead of "database is locked"
+    ('cache_size', -int(os.getenv('SQLITE_CACHE_KB', 16384))),        # negative value = KiB
+    ('mmap_size', int(os.getenv('SQLITE_MMAP_BYTES', 128 * 1024 * 1024))),
+    ('temp_store', 'MEMORY'),
+    ('foreign_keys', 'ON'),
+)
+
+_pool = queue.LifoQueue(maxsize=POOL_SIZE)
+
+
+def connect(database=None):
+    """Open a new connection with the tuning pragmas applied"""
+    # check_same_thread is off because pooled connections move between
+    # request threads; a connection is only ever used by one thread at a time
+    conn = sqlite3.connect(database or DATABASE, timeout=30, check_same_thread=False)
+    # Row still supports positional access, so tuple-style handlers keep working
+    conn.row_factory = sqlite3.Row
+    for name, value in CONNECTION_PRAGMAS:
+        conn.execute(f'PRAGMA {name} = {value}')
+    return conn
+
+
+def acquire():
+    """Take an idle connection from the pool, opening one if none is free"""
+    try:
+        return _pool.get_nowait()
+    except queue.Empty:
+        return connect()
+
+
+def release(conn):
+    """Return a connection to the pool, discarding it if the pool is full"""
+    try:
+        if conn.in_transaction:
+            conn.rollback()
+        _pool.put_nowait(conn)
+    except (queue.Full, sqlite3.Error):
+        conn.close()
+
+
+@contextmanager
+def pooled_connection():
+    """Borrow a pooled connection outside of a request (scripts, workers)"""
+    conn = acquire()
+    try:
+        yield conn
+    finally:
+        release(conn)
+
+
+def get_db():
+    """Get the connection bound to the current request"""
+    if 'db' not in g:
+        g.db = acquire()
+    return g.db
+
+
+def close_db(exception=None):
+    """Hand the request's connection back to the pool"""
+    conn = g.pop('db', None)
+    if conn is not None:
+        release(conn)
+
+
+def init_app(app):
+    """Register the pool with the Flask app"""
+    app.teardown_appcontext(close_db)
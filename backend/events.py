@@ -0,0 +1,140 @@
+"""
+In-process event bus for package lifecycle updates
+
+Transition handlers publish an event after they commit; every open
+/api/stream/packages connection holds a Subscription with its own bounded
+queue and a filter, so publishing never blocks on a slow client. A client
+that falls too far behind gets a single `resync` event and should refetch
+its list instead of replaying what it missed.
+
+Like the user lookup cache, the bus lives in the process, which matches the
+single `python app.py` deployment.
+"""
+
+import itertools
+import queue
+import threading
+
+# Which event types each role's screens react to when no volunteer_id matches
+ROLE_EVENTS = {
+    # Packages appearing on and disappearing from the map
+    'volunteer': {'create', 'assign', 'status'},
+    # Everything that happens to the store's own packages
+    'store': {'create', 'assign', 'pickup', 'deliver', 'complete', 'status'},
+    # The pending-deliveries board
+    'foodbank': {'pickup', 'deliver', 'complete', 'status'},
+}
+
+
+class StreamFilter:
+    """Which package events a subscriber wants
+
+    store_email and bbox (min_lat, min_lng, max_lat, max_lng) narrow every
+    event. Events for packages assigned to volunteer_id always pass; otherwise
+    role picks the event types, and with neither role nor volunteer_id every
+    event passes.
+    """
+
+    def __init__(self, role=None, store_email=None, volunteer_id=None, bbox=None):
+        if role is not None and role not in ROLE_EVENTS:
+            raise ValueError(f"role must be one of: {', '.join(ROLE_EVENTS)}")
+        self.role = role
+        self.store_email = store_email
+        self.volunteer_id = volunteer_id
+        self.bbox = bbox
+
+    def matches(self, event_type, package):
+        if self.store_email and package.get('store_email') != self.store_email:
+            return False
+        if self.volunteer_id and package.get('volunteer_id') == self.volunteer_id:
+            return True
+        if self.bbox:
+            lat, lng = package.get('store_lat'), package.get('store_lng')
+            if lat is None or lng is None:
+                return False
+            min_lat, min_lng, max_lat, max_lng = self.bbox
+            if not (min_lat <= lat <= max_lat and min_lng <= lng <= max_lng):
+                return False
+        if self.role:
+            return event_type in ROLE_EVENTS[self.role]
+        return not self.volunteer_id
+
+
+class Subscription:
+    """One subscriber's filtered, bounded event queue"""
+
+    def __init__(self, event_filter, maxsize):
+        self.filter = event_filter
+        self._queue = queue.Queue(maxsize)
+        self.overflowed = False
+
+    def offer(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout):
+        """Next event, or None if nothing arrived within `timeout` seconds"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def drain(self):
+        """Drop queued events, e.g. after telling the client to resync"""
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+        self.overflowed = False
+
+
+class EventBus:
+    """Fan package events out to the subscribers whose filter matches"""
+
+    def __init__(self, queue_size=256):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._ids = itertools.count(1)
+        self._stats = {'published': 0, 'delivered': 0, 'overflows': 0}
+
+    def subscribe(self, event_filter):
+        subscription = Subscription(event_filter, self.queue_size)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, event_type, package, version=None):
+        event = {
+            'id': next(self._ids),
+            'type': event_type,
+            'version': version,
+            'package': package,
+        }
+        with self._lock:
+            subscribers = list(self._subscribers)
+            self._stats['published'] += 1
+        delivered = overflows = 0
+        for subscription in subscribers:
+            if subscription.filter.matches(event_type, package):
+                was_overflowed = subscription.overflowed
+                subscription.offer(event)
+                delivered += 1
+                overflows += subscription.overflowed and not was_overflowed
+        with self._lock:
+            self._stats['delivered'] += delivered
+            self._stats['overflows'] += overflows
+        return delivered
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['subscribers'] = len(self._subscribers)
+        return stats
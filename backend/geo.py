@@ -0,0 +1,153 @@
+"""
+Geospatial helpers for location-based package and store queries
+"""
+
+import math
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = 111.32
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance between two points in kilometres"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(lat, lng, radius_km):
+    """(min_lat, max_lat, min_lng, max_lng) enclosing a circle around a point"""
+    dlat = radius_km / KM_PER_DEGREE_LAT
+    # Longitude degrees shrink towards the poles; clamp to avoid dividing by ~0
+    dlng = radius_km / (KM_PER_DEGREE_LAT * max(math.cos(math.radians(lat)), 0.01))
+    return (
+        max(lat - dlat, -90.0),
+        min(lat + dlat, 90.0),
+        max(lng - dlng, -180.0),
+        min(lng + dlng, 180.0),
+    )
+
+
+# Marker clustering: a grid of CLUSTER_CELL_PX cells in Web Mercator pixel
+# space at each zoom level. Cells are tile-aligned powers of two, so every
+# cell at zoom z splits into exactly four at zoom z + 1 (the same hierarchy
+# supercluster builds).
+TILE_SIZE_PX = 256
+CLUSTER_CELL_PX = 64
+
+
+def mercator_xy(lat, lng):
+    """Web Mercator position of a point, scaled to the unit square"""
+    x = lng / 360 + 0.5
+    sin_lat = min(max(math.sin(math.radians(lat)), -0.9999), 0.9999)
+    y = 0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)
+    return x, y
+
+
+def grid_cell(lat, lng, zoom):
+    """(column, row) of the clustering cell holding a point at `zoom`"""
+    x, y = mercator_xy(lat, lng)
+    return _cell(x, y, zoom)
+
+
+def _cell(x, y, zoom):
+    cells = TILE_SIZE_PX * 2 ** zoom // CLUSTER_CELL_PX
+    return min(int(x * cells), cells - 1), min(int(y * cells), cells - 1)
+
+
+class GridClusterIndex:
+    """Grid clusters of a fixed set of points, precomputed for zooms 0..max_zoom
+
+    Built bottom-up like supercluster: points are bucketed into cells at
+    max_zoom, and each coarser level merges the four cells below it, so a
+    query only walks the cells in view at the requested zoom.
+    """
+
+    # Cell layout: [count, sum_lat, sum_lng, min_lat, min_lng, max_lat, max_lng,
+    #               item (single points only), expansion_zoom]
+
+    def __init__(self, points, max_zoom):
+        self.max_zoom = max_zoom
+        self.size = 0
+        level = {}
+        for lat, lng, item in points:
+            x, y = mercator_xy(lat, lng)
+            key = _cell(x, y, max_zoom)
+            cell = level.get(key)
+            if cell is None:
+                level[key] = [1, lat, lng, lat, lng, lat, lng, item, max_zoom + 1]
+            else:
+                self._merge(cell, [1, lat, lng, lat, lng, lat, lng, None, None])
+            self.size += 1
+
+        self.levels = [None] * (max_zoom + 1)
+        self.levels[max_zoom] = level
+        for zoom in range(max_zoom - 1, -1, -1):
+            parents = {}
+            children = {}
+            for (column, row), cell in level.items():
+                key = (column >> 1, row >> 1)
+                parent = parents.get(key)
+                if parent is None:
+                    parents[key] = list(cell)
+                    children[key] = 1
+                else:
+                    self._merge(parent, cell)
+                    children[key] += 1
+            for key, parent in parents.items():
+                # Points split as soon as they occupy two child cells
+                if children[key] > 1:
+                    parent[8] = zoom + 1
+            self.levels[zoom] = parents
+            level = parents
+
+    @staticmethod
+    def _merge(cell, other):
+        cell[0] += other[0]
+        cell[1] += other[1]
+        cell[2] += other[2]
+        cell[3] = min(cell[3], other[3])
+        cell[4] = min(cell[4], other[4])
+        cell[5] = max(cell[5], other[5])
+        cell[6] = max(cell[6], other[6])
+        cell[7] = None
+
+    def query(self, zoom, bbox=None):
+        """(singles, clusters) in a bbox (min_lat, min_lng, max_lat, max_lng) at a zoom level
+
+        Singles are the items of points alone in their cell; clusters carry
+        their centroid, count, bounds and expansion_zoom, the first zoom at
+        which their points stop sharing a cell.
+        """
+        level = self.levels[zoom]
+        if bbox is None:
+            cells = level.items()
+        else:
+            min_lat, min_lng, max_lat, max_lng = bbox
+            left, top = grid_cell(max_lat, min_lng, zoom)
+            right, bottom = grid_cell(min_lat, max_lng, zoom)
+            if (right - left + 1) * (bottom - top + 1) < len(level):
+                cells = ((key, level[key]) for key in
+                         ((column, row) for column in range(left, right + 1) for row in range(top, bottom + 1))
+                         if key in level)
+            else:
+                cells = ((key, cell) for key, cell in level.items()
+                         if left <= key[0] <= right and top <= key[1] <= bottom)
+
+        singles, clusters = [], []
+        for (column, row), cell in cells:
+            count = cell[0]
+            if count == 1:
+                singles.append(cell[7])
+                continue
+            clusters.append({
+                'id': f'{zoom}/{column}/{row}',
+                'lat': cell[1] / count,
+                'lng': cell[2] / count,
+                'count': count,
+                'bbox': [cell[3], cell[4], cell[5], cell[6]],
+                'expansion_zoom': cell[8],
+            })
+        return singles, clusters
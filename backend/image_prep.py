@@ -0,0 +1,154 @@
+"""
+Food photo preprocessing off the request thread
+
+Decoding a 12MP phone photo, resizing it and re-encoding it as JPEG is pure
+CPU work that holds the GIL for hundreds of milliseconds, stalling every other
+request the Flask process is serving. ImagePreprocessor runs it in a small
+process pool instead, and caps how many photos may be queued so a burst of
+uploads can't pile up unbounded work.
+
+JPEGs are decoded with Image.draft(), which lets libjpeg scale by 1/2, 1/4 or
+1/8 while decoding: a 4032x3024 photo bound for 1024px is decoded straight to
+1008x756-or-larger instead of being inflated to 36 MB of pixels first.
+
+Each prepared photo also carries its dHash, a 64-bit perceptual hash that
+near-identical photos share (or differ in by a few bits), used to reuse
+earlier analyses.
+"""
+
+import io
+import multiprocessing
+import threading
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from PIL import Image
+
+# Photos sent to the model are at most this many pixels on a side
+MAX_IMAGE_SIZE = 1024
+JPEG_QUALITY = 85
+
+# Re-encoded JPEG bytes and the dHash of the image
+PreparedImage = namedtuple('PreparedImage', ['data', 'dhash'])
+
+
+class PreprocessorBusy(Exception):
+    """Raised when too many photos are already waiting to be preprocessed"""
+
+
+def dhash(image, size=8):
+    """Difference hash: one bit per horizontally adjacent pixel pair of a
+    size x (size + 1) grayscale thumbnail, set where brightness increases"""
+    pixels = list(image.convert('L').resize((size + 1, size), Image.Resampling.BILINEAR).getdata())
+    value = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            value = (value << 1) | (pixels[row * (size + 1) + col + 1] > left)
+    return value
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+def prepare_image(source, max_size=MAX_IMAGE_SIZE, quality=JPEG_QUALITY):
+    """PreparedImage of an uploaded photo: RGB JPEG at most max_size on a side
+
+    `source` is the photo's bytes, or the path of a file holding them.
+    """
+    image = Image.open(io.BytesIO(source) if isinstance(source, bytes) else source)
+    if image.format == 'JPEG':
+        # Scales during decode; the result is still >= max_size on its long side
+        image.draft('RGB', (max_size, max_size))
+
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    if image.width > max_size or image.height > max_size:
+        image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+
+    output_buffer = io.BytesIO()
+    image.save(output_buffer, format='JPEG', quality=quality)
+    return PreparedImage(output_buffer.getvalue(), dhash(image))
+
+
+class ImagePreprocessor:
+    """Bounded process pool running prepare_image()"""
+
+    def __init__(self, max_workers=2, max_pending=8, wait_seconds=10):
+        self.max_workers = max_workers
+        self.wait_seconds = wait_seconds
+        self.max_pending = max_pending
+        # Free slots; a batch takes all of its slots at once (see _acquire)
+        self._free = max_pending
+        self._slots = threading.Condition()
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _pool(self):
+        # Started on first use; spawn rather than fork, since forking a
+        # threaded server can copy locks held by other threads
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+            return self._executor
+
+    def _reset(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _acquire(self, count):
+        # All or nothing: taking slots one at a time would let concurrent
+        # batches each hold part of the pool and time out waiting on each other
+        if count > self.max_pending:
+            raise PreprocessorBusy(f'At most {self.max_pending} photos can be preprocessed at once')
+        with self._slots:
+            if not self._slots.wait_for(lambda: self._free >= count, timeout=self.wait_seconds):
+                raise PreprocessorBusy('Image preprocessing is at capacity, try again shortly')
+            self._free -= count
+
+    def _release(self, count):
+        with self._slots:
+            self._free += count
+            self._slots.notify_all()
+
+    def process(self, source, max_size=MAX_IMAGE_SIZE, quality=JPEG_QUALITY):
+        """prepare_image() in a worker process; raises its errors here
+
+        Raises PreprocessorBusy if no slot frees up within wait_seconds.
+        """
+        return self.process_many([source], max_size, quality)[0]
+
+    def process_many(self, sources, max_size=MAX_IMAGE_SIZE, quality=JPEG_QUALITY):
+        """prepare_image() of several photos in parallel; results in order
+
+        Takes one slot per photo, so a batch counts against max_pending like
+        that many single photos; the slots are taken together. The first
+        error is raised.
+        """
+        sources = list(sources)
+        self._acquire(len(sources))
+        try:
+            executor = self._pool()
+            try:
+                futures = [executor.submit(prepare_image, source, max_size, quality) for source in sources]
+                return [future.result() for future in futures]
+            except BrokenProcessPool:
+                # A worker died (e.g. killed for memory); start a fresh pool next time
+                self._reset(executor)
+                raise
+        finally:
+            self._release(len(sources))
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
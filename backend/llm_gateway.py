@@ -0,0 +1,283 @@
+"""
+One way out to the LLM providers
+
+The food photo analysis, the weekly insights report and the store analytics
+all call Anthropic or OpenAI. They go through LLMGateway, which gives every
+call the same treatment:
+
+- one pooled HTTP session, so connections to a provider are reused
+- a semaphore capping how many provider calls are in flight at once
+- retries of connection errors, timeouts, 429 and 5xx responses with
+  exponential backoff and full jitter, honouring Retry-After
+- a per-provider circuit breaker: after `breaker_threshold` consecutive
+  failures the provider is skipped for `breaker_reset_seconds`, so callers
+  drop to their fallback immediately instead of waiting on a dead service.
+  Only connection errors, 429 and 5xx count as failures; a call that runs
+  out of its caller's own deadline says nothing about the provider
+- a deadline per call covering queueing, every attempt and the backoff
+
+Errors are raised as LLMError subclasses; callers decide what their fallback
+is. Base URLs come from ANTHROPIC_BASE_URL / OPENAI_BASE_URL, which is also
+how the gateway is pointed at a local fake provider in
+benchmarks/bench_llm_gateway.py.
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+ANTHROPIC_VERSION = '2023-06-01'
+
+# Responses worth retrying: rate limited, server errors, Anthropic's "overloaded"
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+
+class LLMError(Exception):
+    """A provider call that produced no usable response"""
+
+
+class CircuitOpen(LLMError):
+    """The provider has been failing; the call was not attempted"""
+
+
+class DeadlineExceeded(LLMError):
+    """The call's deadline passed before a response arrived"""
+
+
+class ProviderError(LLMError):
+    """The provider answered with an error status"""
+
+    def __init__(self, provider, status_code, body=''):
+        super().__init__(f'{provider} API error: {status_code} {body[:200]}'.strip())
+        self.status_code = status_code
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed -> open -> half-open -> closed"""
+
+    def __init__(self, threshold, reset_seconds):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return 'half_open'
+        return 'open'
+
+    def allow(self):
+        """Whether a call may go ahead; in half-open only one trial call does"""
+        with self._lock:
+            state = self._state()
+            if state == 'closed':
+                return True
+            if state == 'half_open' and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_inconclusive(self):
+        """The call ended without telling us whether the provider is healthy"""
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.opened_at is not None or self.failures >= self.threshold:
+                # A failed trial call re-opens for another full period
+                self.opened_at = time.monotonic()
+
+
+class LLMGateway:
+    """Shared, limited and retried access to the LLM provider HTTP APIs"""
+
+    def __init__(self, anthropic_base_url='https://api.anthropic.com', openai_base_url='https://api.openai.com',
+                 max_concurrency=8, max_retries=3, backoff_base=0.5, backoff_max=8.0,
+                 breaker_threshold=5, breaker_reset_seconds=30):
+        self.base_urls = {'anthropic': anthropic_base_url.rstrip('/'), 'openai': openai_base_url.rstrip('/')}
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breakers = {
+            provider: CircuitBreaker(breaker_threshold, breaker_reset_seconds)
+            for provider in self.base_urls
+        }
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(self.base_urls), pool_maxsize=max_concurrency)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._stats_lock = threading.Lock()
+        self.counts = {
+            provider: {'calls': 0, 'succeeded': 0, 'failed': 0, 'retries': 0, 'short_circuited': 0}
+            for provider in self.base_urls
+        }
+
+    def anthropic_messages(self, api_key, payload, timeout=30):
+        """POST /v1/messages; returns the response JSON"""
+        headers = {
+            'x-api-key': api_key,
+            'anthropic-version': ANTHROPIC_VERSION,
+            'Content-Type': 'application/json',
+        }
+        return self.request('anthropic', '/v1/messages', headers, payload, timeout)
+
+    def openai_chat(self, api_key, payload, timeout=30):
+        """POST /v1/chat/completions; returns the response JSON"""
+        headers = {'Authorization': f'Bearer {api_key}', 'Content-Type': 'application/json'}
+        return self.request('openai', '/v1/chat/completions', headers, payload, timeout)
+
+    def _count(self, provider, key):
+        with self._stats_lock:
+            self.counts[provider][key] += 1
+
+    def _backoff(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return retry_after
+        # Full jitter: anywhere up to the exponential ceiling
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def request(self, provider, path, headers, payload, timeout=30):
+        """POST JSON to a provider within `timeout` seconds overall
+
+        Raises CircuitOpen without calling out if the provider's breaker is
+        open, DeadlineExceeded if time runs out, and ProviderError or
+        LLMError when the last attempt failed.
+        """
+        deadline = time.monotonic() + timeout
+        breaker = self.breakers[provider]
+        url = self.base_urls[provider] + path
+        self._count(provider, 'calls')
+
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self._slots.acquire(timeout=remaining):
+                self._count(provider, 'failed')
+                raise DeadlineExceeded(f'{provider} call did not finish within {timeout}s')
+            retry_after = None
+            try:
+                # Checked with a slot in hand, so an allowed half-open trial
+                # call always goes out and reports back
+                if not breaker.allow():
+                    self._count(provider, 'short_circuited')
+                    raise CircuitOpen(f'{provider} is unavailable, circuit open')
+                response = self.session.post(
+                    url, headers=headers, json=payload,
+                    timeout=max(0.001, deadline - time.monotonic())
+                )
+            except requests.RequestException as e:
+                if isinstance(e, requests.Timeout) and time.monotonic() >= deadline:
+                    # The caller's own time ran out: no evidence against the provider
+                    error, provider_fault = DeadlineExceeded(f'{provider} call did not finish within {timeout}s'), False
+                else:
+                    error, provider_fault = LLMError(f'{provider} request failed: {e}'), True
+                retryable = True
+            else:
+                if response.status_code < 400:
+                    try:
+                        result = response.json()
+                    except ValueError:
+                        error, retryable, provider_fault = LLMError(f'{provider} returned invalid JSON'), True, False
+                    else:
+                        breaker.record_success()
+                        self._count(provider, 'succeeded')
+                        return result
+                else:
+                    error = ProviderError(provider, response.status_code, response.text)
+                    retryable = response.status_code in RETRY_STATUSES
+                    provider_fault = response.status_code == 429 or response.status_code >= 500
+                    retry_after = _retry_after_seconds(response)
+            finally:
+                self._slots.release()
+
+            if not retryable:
+                # Bad request or auth: the provider is up, the call is wrong
+                breaker.record_success()
+                self._count(provider, 'failed')
+                raise error
+
+            if provider_fault:
+                breaker.record_failure()
+            else:
+                breaker.record_inconclusive()
+            delay = self._backoff(attempt, retry_after)
+            if attempt >= self.max_retries or time.monotonic() + delay >= deadline:
+                self._count(provider, 'failed')
+                logger.warning('%s call failed after %d attempts: %s', provider, attempt + 1, error)
+                raise error
+            attempt += 1
+            self._count(provider, 'retries')
+            time.sleep(delay)
+
+    def stats(self):
+        with self._stats_lock:
+            counts = {provider: dict(values) for provider, values in self.counts.items()}
+        for provider, breaker in self.breakers.items():
+            counts[provider]['circuit'] = breaker.state
+            counts[provider]['consecutive_failures'] = breaker.failures
+        return {'max_concurrency': self.max_concurrency, 'providers': counts}
+
+
+def _retry_after_seconds(response):
+    try:
+        return max(0.0, float(response.headers['Retry-After']))
+    except (KeyError, ValueError):
+        return None
+
+
+def message_text(result):
+    """Text of an Anthropic messages response"""
+    return result['content'][0]['text']
+
+
+def chat_text(result):
+    """Text of an OpenAI chat completion response"""
+    return result['choices'][0]['message']['content']
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway():
+    """The process-wide gateway, configured from the environment on first use
+
+    Built lazily so settings from a .env file loaded by the app are seen.
+    """
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = LLMGateway(
+                anthropic_base_url=os.getenv('ANTHROPIC_BASE_URL', 'https://api.anthropic.com'),
+                openai_base_url=os.getenv('OPENAI_BASE_URL', 'https://api.openai.com'),
+                max_concurrency=int(os.getenv('LLM_MAX_CONCURRENCY', 8)),
+                max_retries=int(os.getenv('LLM_MAX_RETRIES', 3)),
+            )
+        return _gateway
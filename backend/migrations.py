@@ -0,0 +1,566 @@
+"""
+Versioned schema migrations for the packages database
+
+The applied version is stored in PRAGMA user_version. Each migration runs in
+its own transaction together with the version bump, so a failed migration
+leaves the schema at the previous version. Append new migrations to the end
+of MIGRATIONS; never edit or reorder ones that have shipped.
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _column_exists(cursor, table, column):
+    cursor.execute(f'PRAGMA table_info({table})')
+    return any(row[1] == column for row in cursor.fetchall())
+
+
+def _add_column(cursor, table, column, definition):
+    """ALTER TABLE ADD COLUMN that tolerates databases patched by older code"""
+    if not _column_exists(cursor, table, column):
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+
+def _packages_store_address(cursor):
+    # Older releases added this column lazily from create_package
+    _add_column(cursor, 'packages', 'store_address', 'TEXT')
+
+
+def _packages_query_indexes(cursor):
+    # One index per hot query shape in app.py:
+    #   available packages / foodbank KPIs: status = ? ORDER BY created_at | pickup_completed_at
+    #   store listing: store_email = ? ORDER BY created_at
+    #   volunteer listing and stats: volunteer_id = ? [AND status ...]
+    # The store_profiles join already uses the UNIQUE index on email.
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_packages_status_created ON packages (status, created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_packages_status_completed ON packages (status, pickup_completed_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_packages_store_created ON packages (store_email, created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_packages_volunteer_status ON packages (volunteer_id, status, created_at)')
+
+
+def _packages_spatial_index(cursor):
+    # Typed store coordinates on each package, copied from the store profile
+    _add_column(cursor, 'packages', 'store_lat', 'REAL')
+    _add_column(cursor, 'packages', 'store_lng', 'REAL')
+    cursor.execute('''
+        UPDATE packages SET
+            store_lat = (SELECT NULLIF(CAST(json_extract(s.profile_data, '$.latitude') AS REAL), 0)
+                         FROM store_profiles s
+                         WHERE s.email = packages.store_email AND json_valid(s.profile_data)),
+            store_lng = (SELECT NULLIF(CAST(json_extract(s.profile_data, '$.longitude') AS REAL), 0)
+                         FROM store_profiles s
+                         WHERE s.email = packages.store_email AND json_valid(s.profile_data))
+        WHERE store_lat IS NULL
+    ''')
+
+    # R*Tree over pending packages only, so a "near me" query never touches
+    # claimed or completed history. Triggers keep it in step with packages.
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS packages_geo
+        USING rtree(id, min_lat, max_lat, min_lng, max_lng)
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS packages_geo_insert AFTER INSERT ON packages
+        WHEN NEW.status = 'pending' AND NEW.store_lat IS NOT NULL AND NEW.store_lng IS NOT NULL
+        BEGIN
+            INSERT INTO packages_geo VALUES (NEW.id, NEW.store_lat, NEW.store_lat, NEW.store_lng, NEW.store_lng);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS packages_geo_update AFTER UPDATE OF status, store_lat, store_lng ON packages
+        BEGIN
+            DELETE FROM packages_geo WHERE id = OLD.id;
+            INSERT INTO packages_geo
+            SELECT NEW.id, NEW.store_lat, NEW.store_lat, NEW.store_lng, NEW.store_lng
+            WHERE NEW.status = 'pending' AND NEW.store_lat IS NOT NULL AND NEW.store_lng IS NOT NULL;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS packages_geo_delete AFTER DELETE ON packages
+        BEGIN
+            DELETE FROM packages_geo WHERE id = OLD.id;
+        END
+    ''')
+    cursor.execute('''
+        INSERT OR REPLACE INTO packages_geo
+        SELECT id, store_lat, store_lat, store_lng, store_lng
+        FROM packages
+        WHERE status = 'pending' AND store_lat IS NOT NULL AND store_lng IS NOT NULL
+    ''')
+
+
+def _users_directory(cursor):
+    # One row per (firebase_uid, role) so login-path lookups are a single
+    # primary-key or index probe instead of one query per profile table.
+    # The per-role tables keep the profile payloads; triggers mirror them here.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            firebase_uid TEXT NOT NULL,
+            user_type TEXT NOT NULL,
+            email TEXT NOT NULL,
+            PRIMARY KEY (firebase_uid, user_type)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_users_email ON users (email, user_type)')
+
+    for user_type in ('volunteer', 'store', 'foodbank'):
+        table = f'{user_type}_profiles'
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_users_insert AFTER INSERT ON {table}
+            BEGIN
+                INSERT OR REPLACE INTO users (firebase_uid, user_type, email)
+                VALUES (NEW.firebase_uid, '{user_type}', NEW.email);
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_users_update AFTER UPDATE OF firebase_uid, email ON {table}
+            BEGIN
+                DELETE FROM users WHERE firebase_uid = OLD.firebase_uid AND user_type = '{user_type}';
+                INSERT OR REPLACE INTO users (firebase_uid, user_type, email)
+                VALUES (NEW.firebase_uid, '{user_type}', NEW.email);
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_users_delete AFTER DELETE ON {table}
+            BEGIN
+                DELETE FROM users WHERE firebase_uid = OLD.firebase_uid AND user_type = '{user_type}';
+            END
+        ''')
+        cursor.execute(f'''
+            INSERT OR REPLACE INTO users (firebase_uid, user_type, email)
+            SELECT firebase_uid, '{user_type}', email FROM {table}
+        ''')
+
+
+def _volunteer_stats(cursor):
+    # Running totals per volunteer, maintained by triggers in the same
+    # transaction as the status change that completes (or un-completes) a package.
+    # points mirrors the old formula: int(total lbs * 10).
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS volunteer_stats (
+            volunteer_id TEXT PRIMARY KEY,
+            completed_pickups INTEGER NOT NULL DEFAULT 0,
+            food_saved_lbs REAL NOT NULL DEFAULT 0,
+            points INTEGER NOT NULL DEFAULT 0,
+            co2_reduced_kg REAL NOT NULL DEFAULT 0,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_volunteer_stats_points ON volunteer_stats (points DESC, volunteer_id)')
+    adjust = _volunteer_stats_adjust
+
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS volunteer_stats_complete
+        AFTER UPDATE OF status ON packages
+        WHEN NEW.status = 'completed' AND OLD.status != 'completed' AND NEW.volunteer_id IS NOT NULL
+        BEGIN
+            {adjust('NEW.volunteer_id', 'NEW.weight_lbs', '+')}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS volunteer_stats_uncomplete
+        AFTER UPDATE OF status ON packages
+        WHEN OLD.status = 'completed' AND NEW.status != 'completed' AND OLD.volunteer_id IS NOT NULL
+        BEGIN
+            {adjust('OLD.volunteer_id', 'OLD.weight_lbs', '-')}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS volunteer_stats_delete
+        AFTER DELETE ON packages
+        WHEN OLD.status = 'completed' AND OLD.volunteer_id IS NOT NULL
+        BEGIN
+            {adjust('OLD.volunteer_id', 'OLD.weight_lbs', '-')}
+        END
+    ''')
+
+    _rebuild_volunteer_stats(cursor)
+
+
+def _volunteer_stats_adjust(volunteer, weight, sign):
+    # Applies (NEW volunteer, +1 package) or (OLD volunteer, -1 package)
+    return f'''
+        INSERT OR IGNORE INTO volunteer_stats (volunteer_id) VALUES ({volunteer});
+        UPDATE volunteer_stats SET
+            completed_pickups = completed_pickups {sign} 1,
+            food_saved_lbs = food_saved_lbs {sign} {weight},
+            points = CAST((food_saved_lbs {sign} {weight}) * 10 AS INTEGER),
+            co2_reduced_kg = (food_saved_lbs {sign} {weight}) * 1.13,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE volunteer_id = {volunteer};
+    '''
+
+
+def _rebuild_volunteer_stats(cursor):
+    cursor.execute('''
+        INSERT OR REPLACE INTO volunteer_stats (
+            volunteer_id, completed_pickups, food_saved_lbs, points, co2_reduced_kg
+        )
+        SELECT volunteer_id, COUNT(*), SUM(weight_lbs),
+               CAST(SUM(weight_lbs) * 10 AS INTEGER), SUM(weight_lbs) * 1.13
+        FROM packages
+        WHERE status = 'completed' AND volunteer_id IS NOT NULL
+        GROUP BY volunteer_id
+    ''')
+
+
+def _volunteer_stats_reassign(cursor):
+    # Re-completing a completed package (PUT .../status) can change its
+    # volunteer_id or weight_lbs without a status change: move the credit
+    # from the old values to the new ones, then rebuild totals that drifted.
+    adjust = _volunteer_stats_adjust
+    changed = 'OLD.volunteer_id IS NOT NEW.volunteer_id OR OLD.weight_lbs IS NOT NEW.weight_lbs'
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS volunteer_stats_reassign_old
+        AFTER UPDATE OF volunteer_id, weight_lbs ON packages
+        WHEN OLD.status = 'completed' AND NEW.status = 'completed' AND OLD.volunteer_id IS NOT NULL
+             AND ({changed})
+        BEGIN
+            {adjust('OLD.volunteer_id', 'OLD.weight_lbs', '-')}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS volunteer_stats_reassign_new
+        AFTER UPDATE OF volunteer_id, weight_lbs ON packages
+        WHEN OLD.status = 'completed' AND NEW.status = 'completed' AND NEW.volunteer_id IS NOT NULL
+             AND ({changed})
+        BEGIN
+            {adjust('NEW.volunteer_id', 'NEW.weight_lbs', '+')}
+        END
+    ''')
+    cursor.execute('DELETE FROM volunteer_stats')
+    _rebuild_volunteer_stats(cursor)
+
+
+def _daily_rollups(cursor):
+    # Completed deliveries aggregated per day x store x food type, for the
+    # foodbank dashboard. daily_rollup_volunteers reference-counts volunteers
+    # per cell so `volunteers` stays an exact distinct count, and a day's
+    # distinct volunteers is a range read on its primary key.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_rollups (
+            day TEXT NOT NULL,
+            store_email TEXT NOT NULL,
+            food_type TEXT NOT NULL,
+            deliveries INTEGER NOT NULL DEFAULT 0,
+            weight_lbs REAL NOT NULL DEFAULT 0,
+            volunteers INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, store_email, food_type)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_rollup_volunteers (
+            day TEXT NOT NULL,
+            volunteer_id TEXT NOT NULL,
+            store_email TEXT NOT NULL,
+            food_type TEXT NOT NULL,
+            deliveries INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, volunteer_id, store_email, food_type)
+        ) WITHOUT ROWID
+    ''')
+
+    _create_daily_rollup_triggers(cursor, _rollup_day_v1,
+                                  ('status', 'pickup_completed_at', 'weight_lbs', 'volunteer_id'))
+    _rebuild_daily_rollups(cursor, _rollup_day_v1)
+
+
+def _rollup_day_v1(ref):
+    # Same day the old DATE(pickup_completed_at) filter used. Not stable for
+    # rows completed without a pickup time; see _rollup_day().
+    return f"COALESCE(substr({ref}.pickup_completed_at, 1, 10), date('now', 'localtime'))"
+
+
+def _rollup_day(ref):
+    # A completed row's day must come out the same when its contribution is
+    # removed as when it was added, so fall back to created_at, not today
+    return f"COALESCE(substr({ref}.pickup_completed_at, 1, 10), substr({ref}.created_at, 1, 10))"
+
+
+def _create_daily_rollup_triggers(cursor, day, columns):
+    # `columns`: every package column a row's cell or totals are computed from
+    def cell(ref):
+        return f"day = {day(ref)} AND store_email = {ref}.store_email AND food_type = {ref}.food_type"
+
+    def volunteer_cell(ref):
+        return f"{cell(ref)} AND volunteer_id = {ref}.volunteer_id"
+
+    def add(ref):
+        return f'''
+            INSERT OR IGNORE INTO daily_rollups (day, store_email, food_type)
+            SELECT {day(ref)}, {ref}.store_email, {ref}.food_type WHERE {ref}.status = 'completed';
+            UPDATE daily_rollups SET deliveries = deliveries + 1, weight_lbs = weight_lbs + {ref}.weight_lbs
+            WHERE {ref}.status = 'completed' AND {cell(ref)};
+            INSERT OR IGNORE INTO daily_rollup_volunteers (day, volunteer_id, store_email, food_type)
+            SELECT {day(ref)}, {ref}.volunteer_id, {ref}.store_email, {ref}.food_type
+            WHERE {ref}.status = 'completed' AND {ref}.volunteer_id IS NOT NULL;
+            UPDATE daily_rollups SET volunteers = volunteers + 1
+            WHERE {ref}.status = 'completed' AND {cell(ref)}
+            AND (SELECT deliveries FROM daily_rollup_volunteers WHERE {volunteer_cell(ref)}) = 0;
+            UPDATE daily_rollup_volunteers SET deliveries = deliveries + 1
+            WHERE {ref}.status = 'completed' AND {volunteer_cell(ref)};
+        '''
+
+    def remove(ref):
+        return f'''
+            UPDATE daily_rollups SET deliveries = deliveries - 1, weight_lbs = weight_lbs - {ref}.weight_lbs
+            WHERE {ref}.status = 'completed' AND {cell(ref)};
+            UPDATE daily_rollup_volunteers SET deliveries = deliveries - 1
+            WHERE {ref}.status = 'completed' AND {volunteer_cell(ref)};
+            UPDATE daily_rollups SET volunteers = volunteers - 1
+            WHERE {ref}.status = 'completed' AND {cell(ref)}
+            AND (SELECT deliveries FROM daily_rollup_volunteers WHERE {volunteer_cell(ref)}) = 0;
+            DELETE FROM daily_rollup_volunteers WHERE {volunteer_cell(ref)} AND deliveries <= 0;
+            DELETE FROM daily_rollups WHERE {cell(ref)} AND deliveries <= 0;
+        '''
+
+    # Every transition is "take out the old row's contribution, put in the new one"
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS daily_rollups_update
+        AFTER UPDATE OF {", ".join(columns)} ON packages
+        WHEN OLD.status = 'completed' OR NEW.status = 'completed'
+        BEGIN
+            {remove('OLD')}
+            {add('NEW')}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS daily_rollups_insert AFTER INSERT ON packages
+        WHEN NEW.status = 'completed'
+        BEGIN
+            {add('NEW')}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS daily_rollups_delete AFTER DELETE ON packages
+        WHEN OLD.status = 'completed'
+        BEGIN
+            {remove('OLD')}
+        END
+    ''')
+
+
+def _rebuild_daily_rollups(cursor, day):
+    cursor.execute(f'''
+        INSERT OR REPLACE INTO daily_rollup_volunteers (day, volunteer_id, store_email, food_type, deliveries)
+        SELECT {day('packages')}, volunteer_id, store_email, food_type, COUNT(*)
+        FROM packages
+        WHERE status = 'completed' AND volunteer_id IS NOT NULL
+        GROUP BY 1, 2, 3, 4
+    ''')
+    cursor.execute(f'''
+        INSERT OR REPLACE INTO daily_rollups (day, store_email, food_type, deliveries, weight_lbs, volunteers)
+        SELECT {day('packages')}, store_email, food_type, COUNT(*), SUM(weight_lbs), COUNT(DISTINCT volunteer_id)
+        FROM packages
+        WHERE status = 'completed'
+        GROUP BY 1, 2, 3
+    ''')
+
+
+def _daily_rollups_stable_day(cursor):
+    # Completed rows with no pickup_completed_at (PUT status=picked_up, then
+    # /deliver) were keyed on today's date, so removing them on a later day
+    # missed the cell they were added to. Re-key on created_at and rebuild.
+    for trigger in ('daily_rollups_update', 'daily_rollups_insert', 'daily_rollups_delete'):
+        cursor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+    _create_daily_rollup_triggers(cursor, _rollup_day, (
+        'status', 'pickup_completed_at', 'created_at', 'weight_lbs', 'volunteer_id', 'store_email', 'food_type'
+    ))
+    cursor.execute('DELETE FROM daily_rollup_volunteers')
+    cursor.execute('DELETE FROM daily_rollups')
+    _rebuild_daily_rollups(cursor, _rollup_day)
+
+
+def _package_changes(cursor):
+    # A single packages_version counter bumped by every write to packages, and
+    # the version at which each package last changed. Pollers keep the version
+    # they last saw and only ask for what moved past it.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS packages_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('INSERT OR IGNORE INTO packages_version (id, version) VALUES (1, 0)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS package_changes (
+            package_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL,
+            deleted INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_package_changes_version ON package_changes (version)')
+
+    def record(ref, deleted):
+        return f'''
+            UPDATE packages_version SET version = version + 1 WHERE id = 1;
+            INSERT OR REPLACE INTO package_changes (package_id, version, deleted)
+            VALUES ({ref}.id, (SELECT version FROM packages_version WHERE id = 1), {deleted});
+        '''
+
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS package_changes_insert AFTER INSERT ON packages
+        BEGIN {record('NEW', 0)} END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS package_changes_update AFTER UPDATE ON packages
+        BEGIN {record('NEW', 0)} END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS package_changes_delete AFTER DELETE ON packages
+        BEGIN {record('OLD', 1)} END
+    ''')
+
+    # Existing rows all count as changed at version 1
+    cursor.execute('''
+        INSERT OR IGNORE INTO package_changes (package_id, version)
+        SELECT id, 1 FROM packages
+    ''')
+    cursor.execute('''
+        UPDATE packages_version SET version = 1
+        WHERE id = 1 AND EXISTS (SELECT 1 FROM package_changes)
+    ''')
+
+
+def _packages_qr_image_index(cursor):
+    # /uploads/<file> rebuilds a missing QR image from the package it belongs to
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_packages_qr_image_path ON packages (qr_code_image_path)'
+    )
+
+
+def _store_profile_location(cursor):
+    # Typed copies of the store profile fields the read paths need, kept in
+    # step with profile_data by triggers so no handler parses the JSON
+    _add_column(cursor, 'store_profiles', 'store_name', 'TEXT')
+    _add_column(cursor, 'store_profiles', 'address', 'TEXT')
+    _add_column(cursor, 'store_profiles', 'latitude', 'REAL')
+    _add_column(cursor, 'store_profiles', 'longitude', 'REAL')
+
+    def extract(ref):
+        # Same rules as app.store_location(): empty or zero values count as missing
+        return f'''
+            store_name = CASE WHEN json_valid({ref}.profile_data)
+                THEN NULLIF(json_extract({ref}.profile_data, '$.storeName'), '') END,
+            address = CASE WHEN json_valid({ref}.profile_data)
+                THEN NULLIF(json_extract({ref}.profile_data, '$.address'), '') END,
+            latitude = CASE WHEN json_valid({ref}.profile_data)
+                THEN NULLIF(CAST(json_extract({ref}.profile_data, '$.latitude') AS REAL), 0) END,
+            longitude = CASE WHEN json_valid({ref}.profile_data)
+                THEN NULLIF(CAST(json_extract({ref}.profile_data, '$.longitude') AS REAL), 0) END
+        '''
+
+    for event in ('INSERT', 'UPDATE OF profile_data'):
+        name = event.split()[0].lower()
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS store_profiles_location_{name} AFTER {event} ON store_profiles
+            BEGIN
+                UPDATE store_profiles SET {extract('NEW')} WHERE id = NEW.id;
+            END
+        ''')
+    cursor.execute(f'UPDATE store_profiles SET {extract("store_profiles")}')
+
+
+def _store_location_index(cursor):
+    # Viewport queries on /api/stores/locations
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_store_profiles_location ON store_profiles (latitude, longitude)'
+    )
+
+    # Bumped whenever a store's map marker could change, so the in-process
+    # cluster index knows when to rebuild
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS store_locations_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('INSERT OR IGNORE INTO store_locations_version (id, version) VALUES (1, 0)')
+    for name, event in (
+        ('insert', 'INSERT'),
+        ('update', 'UPDATE OF firebase_uid, email, store_name, address, latitude, longitude'),
+        ('delete', 'DELETE'),
+    ):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS store_locations_version_{name} AFTER {event} ON store_profiles
+            BEGIN
+                UPDATE store_locations_version SET version = version + 1 WHERE id = 1;
+            END
+        ''')
+
+
+def _image_analysis_cache(cursor):
+    # Food photo analyses keyed by perceptual hash, see analysis_cache.py
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS image_analysis_cache (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            dhash INTEGER NOT NULL,
+            model TEXT NOT NULL,
+            analysis TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            last_used_at REAL NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_image_analysis_cache_model ON image_analysis_cache (model, created_at)'
+    )
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_image_analysis_cache_last_used ON image_analysis_cache (last_used_at)'
+    )
+
+
+def _image_analysis_cache_hash_index(cursor):
+    # Lookups read (id, dhash) of a model's live entries; with dhash in the
+    # index they never touch the rows and their analysis JSON
+    cursor.execute('DROP INDEX IF EXISTS idx_image_analysis_cache_model')
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_image_analysis_cache_model_hash '
+        'ON image_analysis_cache (model, created_at, dhash)'
+    )
+
+
+MIGRATIONS = [
+    ('add packages.store_address', _packages_store_address),
+    ('add indexes for package query shapes', _packages_query_indexes),
+    ('add package coordinates and R*Tree of pending packages', _packages_spatial_index),
+    ('add users directory keyed by firebase_uid and email', _users_directory),
+    ('add trigger-maintained volunteer_stats', _volunteer_stats),
+    ('add trigger-maintained daily_rollups for foodbank KPIs', _daily_rollups),
+    ('add packages_version counter and package_changes feed', _package_changes),
+    ('index packages by QR image path', _packages_qr_image_index),
+    ('add trigger-maintained store location columns', _store_profile_location),
+    ('index store locations and track their version', _store_location_index),
+    ('add image_analysis_cache', _image_analysis_cache),
+    ('move volunteer_stats credit when a completed package is reassigned', _volunteer_stats_reassign),
+    ('key daily_rollups on a stable day for completions without a pickup time', _daily_rollups_stable_day),
+    ('cover image_analysis_cache hash lookups with an index', _image_analysis_cache_hash_index),
+]
+
+
+def get_schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def run_migrations(conn):
+    """Apply every migration newer than the database's user_version"""
+    current = get_schema_version(conn)
+    cursor = conn.cursor()
+
+    for version, (description, migrate) in enumerate(MIGRATIONS, start=1):
+        if version <= current:
+            continue
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            migrate(cursor)
+            cursor.execute(f'PRAGMA user_version = {version}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            logger.error(f"Migration {version} ({description}) failed")
+            raise
+        logger.info(f"Applied migration {version}: {description}")
+        current = version
+
+    return current
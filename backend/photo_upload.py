@@ -0,0 +1,136 @@
+"""
+Spooling uploaded food photos
+
+Photos arrive as base64 inside JSON (the original API), as a multipart/form-data
+file, or as a raw image/* request body. Small photos stay in memory, larger
+ones are moved to a named temporary file, so a 12MP upload never has to sit
+in the web process's memory whole. The preprocessing workers open the file by
+name and feed PIL straight from disk. Raw bodies are copied from the request
+stream in chunks; multipart files are written into a SpooledPhoto by the
+form parser itself (app.py's request class hands it one), so they are
+spooled once.
+
+A SpooledPhoto outlives the request (analysis runs as a background job), so
+whoever finishes with it calls close() to delete the file. Multipart spools
+nobody claimed with take_upload() are closed by the request itself.
+"""
+
+import io
+import os
+import tempfile
+
+CHUNK_BYTES = 64 * 1024
+
+
+class PhotoTooLarge(Exception):
+    """Raised when an upload is bigger than the allowed maximum"""
+
+
+class SpooledPhoto:
+    """Uploaded photo bytes held in memory, or in a temp file once large
+
+    Also readable and seekable, as werkzeug's form parser expects of the
+    streams it writes file uploads into.
+    """
+
+    def __init__(self, memory_bytes, max_bytes=None):
+        self.memory_bytes = memory_bytes
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._buffer = io.BytesIO()
+        self._file = None
+        self._reader = None
+        self.path = None
+        # Set by take_upload(): the request no longer closes it
+        self.claimed = False
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self.max_bytes is not None and self.size > self.max_bytes:
+            # Nobody holds a partly written photo: clean up before raising
+            self.close()
+            raise PhotoTooLarge(f'Photo is larger than the {self.max_bytes:,} byte limit')
+        if self._file is None and self.size > self.memory_bytes:
+            fd, self.path = tempfile.mkstemp(prefix='photo-', suffix='.upload')
+            self._file = os.fdopen(fd, 'wb')
+            self._file.write(self._buffer.getvalue())
+            self._buffer = None
+        if self._file is not None:
+            self._file.write(chunk)
+        else:
+            self._buffer.write(chunk)
+
+    def finish(self):
+        """Flush to disk, if spooled there; the photo is read-only afterwards"""
+        if self._file is not None:
+            self._file.close()
+        return self
+
+    def _open_reader(self):
+        if self._reader is None:
+            self.finish()
+            self._reader = open(self.path, 'rb') if self.path is not None else io.BytesIO(self._buffer.getvalue())
+        return self._reader
+
+    def read(self, size=-1):
+        return self._open_reader().read(size)
+
+    def readline(self, size=-1):
+        return self._open_reader().readline(size)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        # The form parser seeks to the start once the upload is written
+        return self._open_reader().seek(offset, whence)
+
+    @property
+    def source(self):
+        """What image_prep.prepare_image() takes: the bytes, or the file's path"""
+        return self.path if self.path is not None else self._buffer.getvalue()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+        if self.path is not None:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+            self.path = None
+        self._buffer = None
+
+
+def spool_stream(stream, max_bytes, memory_bytes):
+    """Copy a file-like stream into a SpooledPhoto; raises PhotoTooLarge past max_bytes"""
+    photo = SpooledPhoto(memory_bytes, max_bytes)
+    try:
+        while True:
+            chunk = stream.read(CHUNK_BYTES)
+            if not chunk:
+                break
+            photo.write(chunk)
+        return photo.finish()
+    except BaseException:
+        photo.close()
+        raise
+
+
+def take_upload(upload):
+    """The SpooledPhoto a multipart file (werkzeug FileStorage) was parsed into
+
+    Detached from the request, which closes its files at teardown, because
+    the analysis job that now owns the photo runs after the response.
+    """
+    photo = upload.stream
+    if not isinstance(photo, SpooledPhoto):
+        raise TypeError('Upload was not parsed into a SpooledPhoto')
+    upload.stream = io.BytesIO()
+    photo.claimed = True
+    return photo.finish()
+
+
+def spool_bytes(data, max_bytes, memory_bytes):
+    """SpooledPhoto of bytes already in memory (the base64 JSON path)"""
+    return spool_stream(io.BytesIO(data), max_bytes, memory_bytes)
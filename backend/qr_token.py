@@ -0,0 +1,72 @@
+"""
+Compact signed tokens for package QR codes
+
+A token is `<package id>.<signature>`, where the signature is a truncated
+HMAC-SHA256 of the package ID in unpadded base32. Digits, upper-case letters
+and '.' are all in the QR alphanumeric set, so a token fits in a version 1-2
+code instead of the version 10+ the full package JSON needed. Scanning
+clients resolve it through /api/qr/resolve/<token>; clients that only read
+a leading package ID still get the right one.
+"""
+
+import base64
+import hashlib
+import hmac
+import logging
+import os
+import secrets
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Published in config.py and the setup docs, so it protects nothing
+PUBLIC_DEFAULT_SECRET = 'reflourish_ai_secret_key_2024'
+
+# 80 bits: 16 base32 characters, far beyond guessing range for a PIN-gated pickup
+SIGNATURE_BYTES = 10
+
+
+_secret = None
+_secret_lock = threading.Lock()
+
+
+def get_secret():
+    """QR_TOKEN_SECRET, else SECRET_KEY, read on first use
+
+    With neither set (or only the published default), tokens would be
+    forgeable by anyone, so a random per-process secret is used instead and
+    a warning logged: tokens then stop resolving after a restart.
+    """
+    global _secret
+    with _secret_lock:
+        if _secret is None:
+            secret = os.getenv('QR_TOKEN_SECRET') or os.getenv('SECRET_KEY')
+            if not secret or secret == PUBLIC_DEFAULT_SECRET:
+                logger.warning('QR_TOKEN_SECRET/SECRET_KEY is not set to a private value; QR tokens are '
+                               'signed with a random key and will not resolve after a restart. '
+                               'Set QR_TOKEN_SECRET in production.')
+                secret = secrets.token_hex(32)
+            _secret = secret
+        return _secret
+
+
+def _signature(package_id, secret):
+    digest = hmac.new(secret.encode(), f'package:{package_id}'.encode(), hashlib.sha256).digest()
+    return base64.b32encode(digest[:SIGNATURE_BYTES]).decode()
+
+
+def make_token(package_id, secret=None):
+    """Signed QR token for a package ID"""
+    return f'{package_id}.{_signature(package_id, secret or get_secret())}'
+
+
+def parse_token(token, secret=None):
+    """Package ID from a token, or None if it is malformed or the signature is wrong"""
+    package_id, separator, signature = token.strip().upper().partition('.')
+    # isdecimal() alone admits non-ASCII digits, and compare_digest() raises on non-ASCII str
+    if not (separator and package_id.isascii() and package_id.isdecimal() and signature.isascii()):
+        return None
+    expected = _signature(int(package_id), secret or get_secret())
+    if not hmac.compare_digest(signature, expected):
+        return None
+    return int(package_id)
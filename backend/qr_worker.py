@@ -0,0 +1,244 @@
+"""
+Background QR code rendering for new packages
+
+Building the QR matrix and encoding the PNG is the slowest part of creating a
+package, so create_package only queues the job and returns the image path
+straight away. If the image is requested before a worker gets to it,
+QRWorker.ensure() renders it on the spot (or waits for a render that is
+already running), so the URL handed out is always good.
+
+Images are written to a temporary file and renamed into place, so a reader
+never sees a half-written PNG. File names are derived from the payload
+(qr-<hash>.png), so an image's content never changes under its name: the
+/uploads route can serve it with a long-lived Cache-Control and keep hot ones
+in memory. collect_garbage() removes images no live package needs.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import qrcode
+
+logger = logging.getLogger(__name__)
+
+
+def _umask():
+    # os.umask() can only be read by setting it; done once, at import
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+# mkstemp creates files 0600; images get the mode a plain open() would give,
+# so a static file server running as another user can still read them
+IMAGE_FILE_MODE = 0o666 & ~_umask()
+
+
+def _payload_text(payload):
+    return payload if isinstance(payload, str) else json.dumps(payload)
+
+
+def qr_filename(payload):
+    """Content-addressed file name for a QR payload"""
+    return f'qr-{hashlib.sha256(_payload_text(payload).encode()).hexdigest()[:24]}.png'
+
+
+def is_content_addressed(filename):
+    stem = filename[3:-4]
+    return (filename.startswith('qr-') and filename.endswith('.png') and len(stem) == 24
+            and all(c in '0123456789abcdef' for c in stem))
+
+
+def render_qr_code(payload, path):
+    """Render a QR payload (a token string, or a dict as JSON) as a PNG at `path`"""
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=10,
+        border=4,
+    )
+    qr.add_data(_payload_text(payload))
+    qr.make(fit=True)
+    qr_image = qr.make_image(fill_color="black", back_color="white")
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.png.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            qr_image.save(tmp, format='PNG')
+        os.chmod(tmp_path, IMAGE_FILE_MODE)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return path
+
+
+class ImageCache:
+    """Least-recently-used image bytes, bounded by total size"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            data = self._data.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._data.move_to_end(key)
+            return data
+
+    def set(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._data.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self._data[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self.size -= len(evicted)
+
+    def pop(self, key):
+        with self._lock:
+            data = self._data.pop(key, None)
+            if data is not None:
+                self.size -= len(data)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'items': len(self._data),
+                'bytes': self.size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+class QRWorker:
+    """Thread pool rendering QR images, with on-demand fallback"""
+
+    def __init__(self, directory='uploads', max_workers=2, cache_bytes=8 * 1024 * 1024):
+        # Absolute, so writers and the /uploads route agree whatever the cwd
+        self.directory = os.path.abspath(directory)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='qr-render')
+        self._lock = threading.Lock()
+        # path -> (future, payload) for renders that haven't finished
+        self._pending = {}
+        self.cache = ImageCache(cache_bytes)
+
+    def path_for(self, filename):
+        return os.path.join(self.directory, filename)
+
+    def submit(self, payload, filename):
+        """Queue a render and return the absolute path it will be written to"""
+        return self.submit_many([(payload, filename)])[0]
+
+    def submit_many(self, jobs):
+        """Queue (payload, filename) renders together; returns their paths"""
+        queued = [(self.path_for(filename), payload) for payload, filename in jobs]
+        futures = [self._executor.submit(render_qr_code, payload, path) for path, payload in queued]
+        with self._lock:
+            for (path, payload), future in zip(queued, futures):
+                self._pending[path] = (future, payload)
+        for (path, _), future in zip(queued, futures):
+            future.add_done_callback(lambda done, path=path: self._finished(path, done))
+        return [path for path, _ in queued]
+
+    def _finished(self, path, future):
+        with self._lock:
+            entry = self._pending.get(path)
+            if entry is not None and entry[0] is future:
+                del self._pending[path]
+        if not future.cancelled() and future.exception() is not None:
+            logger.warning('QR render for %s failed: %s', path, future.exception())
+
+    def ensure(self, filename, load_payload=None):
+        """Path of a rendered image, rendering it now if no worker has yet
+
+        load_payload() is only called when the render isn't queued in this
+        process and the file is missing (e.g. it was collected); if it is
+        absent or returns None, a missing image raises FileNotFoundError.
+        """
+        path = self.path_for(filename)
+        with self._lock:
+            entry = self._pending.get(path)
+        payload = None
+        if entry is not None:
+            future, payload = entry
+            # Still queued: take it over. Already rendering: wait for it.
+            if not future.cancel():
+                try:
+                    return future.result()
+                except Exception:
+                    pass
+        if os.path.exists(path):
+            return path
+        if payload is None and load_payload is not None:
+            payload = load_payload()
+        if payload is None:
+            raise FileNotFoundError(path)
+        return render_qr_code(payload, path)
+
+    def read(self, filename, load_payload=None):
+        """Image bytes, from memory when hot (see ensure() for load_payload)"""
+        data = self.cache.get(filename)
+        if data is None:
+            with open(self.ensure(filename, load_payload), 'rb') as image:
+                data = image.read()
+            self.cache.set(filename, data)
+        return data
+
+    def collect_garbage(self, keep, grace_seconds=600):
+        """Delete QR images whose names aren't in `keep`; returns how many
+
+        Files younger than grace_seconds and renders still in flight are left
+        alone, so a package created during the sweep keeps its image.
+        """
+        cutoff = time.time() - grace_seconds
+        with self._lock:
+            in_flight = {os.path.basename(path) for path in self._pending}
+        removed = 0
+        try:
+            filenames = os.listdir(self.directory)
+        except FileNotFoundError:
+            return 0
+        for filename in filenames:
+            is_image = filename.startswith('qr-') and filename.endswith('.png')
+            if not (is_image or filename.endswith('.png.tmp')):
+                continue
+            if filename in keep or filename in in_flight:
+                continue
+            path = self.path_for(filename)
+            try:
+                if os.path.getmtime(path) > cutoff:
+                    continue
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            self.cache.pop(filename)
+            removed += 1
+        return removed
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
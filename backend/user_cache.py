@@ -0,0 +1,182 @@
+"""
+In-process cache for login-path user lookups
+
+Signup and login flows call the profile/email existence checks over and over,
+and most answers are "not found". A Bloom filter over every known firebase_uid
+and email answers those negatives without touching SQLite; everything else
+goes through a small LRU cache with a TTL, which also remembers negatives that
+slipped past the filter as false positives.
+
+The cache is per process, which matches how the backend is deployed (a single
+`python app.py`). The Bloom filter is rebuilt from the database periodically,
+so a profile written by some other process is picked up after at most
+BLOOM_REFRESH_SECONDS.
+"""
+
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings"""
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        # Kirsch-Mitzenmacher double hashing from one 128-bit digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, item: str):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class TTLCache:
+    """Least-recently-used mapping whose entries expire after `ttl` seconds"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        value, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self._data[key] = (value, time.monotonic() + self.ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+_MISSING = object()
+
+
+class UserLookupCache:
+    """Role lookups by firebase_uid or email, backed by the users directory table"""
+
+    BLOOM_REFRESH_SECONDS = 300
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 60, bloom_capacity: int = 100000):
+        self._lock = threading.Lock()
+        self._cache = TTLCache(maxsize, ttl)
+        self._bloom_capacity = bloom_capacity
+        self._bloom = None
+        self._bloom_built_at = 0.0
+        # Bumped on every invalidation so a lookup that raced a profile write
+        # doesn't cache what it read before the write
+        self._generation = 0
+        self._stats = {
+            'lookups': 0,
+            'bloom_negatives': 0,
+            'cache_hits': 0,
+            'cache_misses': 0,
+            'invalidations': 0,
+            'bloom_rebuilds': 0,
+            'total_lookup_seconds': 0.0,
+        }
+
+    def _rebuild_bloom(self, conn):
+        rows = conn.execute('SELECT firebase_uid, email FROM users').fetchall()
+        # Leave headroom so signups don't saturate the filter before the next rebuild
+        bloom = BloomFilter(max(self._bloom_capacity, len(rows) * 4))
+        for firebase_uid, email in rows:
+            bloom.add(f'uid:{firebase_uid}')
+            bloom.add(f'email:{email}')
+        self._bloom = bloom
+        self._bloom_built_at = time.monotonic()
+        self._stats['bloom_rebuilds'] += 1
+
+    def _lookup(self, conn, kind, value, column):
+        start = time.perf_counter()
+        key = f'{kind}:{value}'
+        try:
+            with self._lock:
+                self._stats['lookups'] += 1
+                stale = time.monotonic() - self._bloom_built_at > self.BLOOM_REFRESH_SECONDS
+                if self._bloom is None or stale or self._bloom.count > self._bloom.capacity:
+                    self._rebuild_bloom(conn)
+                if key not in self._bloom:
+                    self._stats['bloom_negatives'] += 1
+                    return ()
+                roles = self._cache.get(key, _MISSING)
+                if roles is not _MISSING:
+                    self._stats['cache_hits'] += 1
+                    return roles
+                self._stats['cache_misses'] += 1
+                generation = self._generation
+
+            rows = conn.execute(f'SELECT user_type FROM users WHERE {column} = ?', (value,)).fetchall()
+            roles = tuple(row[0] for row in rows)
+            with self._lock:
+                if generation == self._generation:
+                    self._cache.set(key, roles)
+            return roles
+        finally:
+            with self._lock:
+                self._stats['total_lookup_seconds'] += time.perf_counter() - start
+
+    def roles_for_uid(self, conn, firebase_uid):
+        """User types with a profile for this UID (empty if none)"""
+        return self._lookup(conn, 'uid', firebase_uid, 'firebase_uid')
+
+    def roles_for_email(self, conn, email):
+        """User types with a profile for this email (empty if none)"""
+        return self._lookup(conn, 'email', email, 'email')
+
+    def invalidate(self, firebase_uid, *emails):
+        """Forget cached answers for a UID and emails after its profile was written"""
+        with self._lock:
+            self._stats['invalidations'] += 1
+            self._generation += 1
+            self._cache.pop(f'uid:{firebase_uid}')
+            for email in emails:
+                if email:
+                    self._cache.pop(f'email:{email}')
+            if self._bloom is not None:
+                self._bloom.add(f'uid:{firebase_uid}')
+                for email in emails:
+                    if email:
+                        self._bloom.add(f'email:{email}')
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['cache_size'] = len(self._cache)
+            stats['bloom_items'] = self._bloom.count if self._bloom else 0
+        answered_without_db = stats['bloom_negatives'] + stats['cache_hits']
+        stats['hit_rate'] = round(answered_without_db / stats['lookups'], 4) if stats['lookups'] else 0.0
+        stats['avg_lookup_us'] = round(stats.pop('total_lookup_seconds') / stats['lookups'] * 1e6, 1) if stats['lookups'] else 0.0
+        return stats